@@ -0,0 +1,202 @@
+"""Micro-benchmark for the candidate-place path of /recommend.
+
+Runs the radius-mode pipeline (elements -> per-activity places -> flatten ->
+de-duplicate -> top-10) once with PlaceBatch columns, as the app does, and
+once with the per-place dicts it used before (kept here as a reference), and
+reports time and traced memory per request: the peak while the request runs
+and what the candidate set itself holds before ranking. The two pipelines
+are timed in turn, so a noisy machine skews both alike. The run fails if
+the two pipelines recommend different places.
+
+    python benchmarks/bench_candidates.py [--elements 1500] [--requests 100] [--repeat 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from smarttrip.ai_recommender import rank_places, seed_weights  # noqa: E402
+from smarttrip.app import _dedupe_places  # noqa: E402
+from smarttrip.place_batch import PlaceBatch  # noqa: E402
+from smarttrip.services.osm_service import (  # noqa: E402
+    _DEFAULTS_BY_ACTIVITY,
+    _element_center,
+    _elements_to_places,
+    _matching_activities,
+    _place_fields,
+)
+from smarttrip.taxonomy import ACTIVITY_FAMILY  # noqa: E402
+
+_TAGS = [
+    ("amenity", "cafe"),
+    ("amenity", "restaurant"),
+    ("amenity", "fast_food"),
+    ("amenity", "ice_cream"),
+    ("leisure", "park"),
+    ("tourism", "museum"),
+    ("amenity", "cinema"),
+    ("tourism", "attraction"),
+]
+_ACTIVITY_SETS = [["cafe", "park", "cinema"], ["restaurant", "fast_food"], ["cafe"], ["park", "museum", "attraction"]]
+
+
+def synthetic_elements(count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    elements: List[Dict[str, Any]] = []
+    for i in range(count):
+        key, value = rng.choice(_TAGS)
+        tags: Dict[str, Any] = {key: value}
+        if rng.random() < 0.8:
+            tags["name"] = f"Place {i % (count // 2)}"
+        if rng.random() < 0.2:
+            tags["wikidata"] = "Q1"
+        if rng.random() < 0.3:
+            tags["rating"] = str(round(rng.uniform(3.0, 5.0), 1))
+        lat = 35.7 + rng.uniform(-0.04, 0.04)
+        lon = 51.4 + rng.uniform(-0.04, 0.04)
+        elements.append({"type": "node", "id": i, "lat": lat, "lon": lon, "tags": tags})
+    return elements
+
+
+def reference_elements_to_places(
+    elements: List[Dict[str, Any]], activities: List[str], *, limit: int
+) -> Dict[str, List[Dict[str, Any]]]:
+    """``_elements_to_places`` as it was with one dict per place."""
+    by_activity: Dict[str, List[Dict[str, Any]]] = {a: [] for a in activities}
+    seen: Dict[str, Set[Tuple[str, float, float]]] = {a: set() for a in activities}
+    for element in elements:
+        center = _element_center(element)
+        if not center:
+            continue
+        tags = element.get("tags") or {}
+        matched = _matching_activities(tags, activities)
+        if not matched:
+            continue
+        name, popularity_score, rating_override = _place_fields(tags)
+        sig = (name.strip().lower(), round(center[0], 6), round(center[1], 6))
+        for activity in matched:
+            if sig in seen[activity]:
+                continue
+            seen[activity].add(sig)
+            family = ACTIVITY_FAMILY.get(activity, activity)
+            defaults = _DEFAULTS_BY_ACTIVITY.get(family, _DEFAULTS_BY_ACTIVITY["nature"])
+            place: Dict[str, Any] = {"name": name, "lat": float(center[0]), "lon": float(center[1]), "type": activity}
+            place.update(
+                {
+                    "osm_id": element.get("id"),
+                    "osm_kind": element.get("type"),
+                    "popularity_score": popularity_score,
+                    **(dict(defaults, rating=rating_override) if rating_override is not None else defaults),
+                }
+            )
+            by_activity[activity].append(place)
+    for activity, places in by_activity.items():
+        places.sort(key=lambda p: (p.get("popularity_score", 0), p.get("rating", 0)), reverse=True)
+        by_activity[activity] = places[:limit]
+    return by_activity
+
+
+def dict_candidates(elements: List[Dict[str, Any]], activities: List[str], limit: int) -> List[Dict[str, Any]]:
+    by_activity = reference_elements_to_places(elements, activities, limit=limit)
+    return _dedupe_places([p for a in activities for p in by_activity[a]], limit=120)
+
+
+def batch_candidates(elements: List[Dict[str, Any]], activities: List[str], limit: int) -> PlaceBatch:
+    by_activity = _elements_to_places(elements, activities, candidate_limit=len(elements), limit=limit)
+    return PlaceBatch.concat(by_activity[a] for a in activities).dedupe(120)
+
+
+def measure(fn: Callable[[], Any]) -> Tuple[int, int]:
+    """Peak traced bytes while ``fn`` runs, and bytes still held by its result."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak - before, current - before
+
+
+def best_of_each(repeat: int, fns: List[Callable[[], Any]]) -> List[float]:
+    """Best time of each of ``fns``, run in turn so load drifting on the machine hits all of them alike."""
+    best = [float("inf")] * len(fns)
+    for _ in range(repeat):
+        for i, fn in enumerate(fns):
+            started = time.perf_counter()
+            fn()
+            best[i] = min(best[i], time.perf_counter() - started)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--elements", type=int, default=1500)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    weights = seed_weights()
+    requests = []
+    for _ in range(args.requests):
+        activities = rng.choice(_ACTIVITY_SETS)
+        context = {
+            "user_activity": activities[0],
+            "user_activities": activities,
+            "user_group_type": rng.choice(["solo", "friends", "family"]),
+            "user_budget": rng.choice(["low", "medium", "open"]),
+            "people_count": rng.randint(1, 8),
+            "has_car": rng.random() < 0.5,
+            "origin": [35.7, 51.4],
+            "search_mode": rng.choice(["radius", "city"]),
+        }
+        limit = max(20, int(80 / len(activities)))
+        requests.append((synthetic_elements(args.elements, rng), activities, limit, context))
+
+    def run_dicts() -> List[List[Dict[str, Any]]]:
+        return [
+            rank_places(dict_candidates(e, a, n), context=c, weights=weights, limit=10) for e, a, n, c in requests
+        ]
+
+    def run_batches() -> List[List[Dict[str, Any]]]:
+        return [
+            rank_places(batch_candidates(e, a, n), context=c, weights=weights, limit=10) for e, a, n, c in requests
+        ]
+
+    if run_dicts() != run_batches():
+        print("FAIL: PlaceBatch pipeline recommended different places than the dict pipeline")
+        return 1
+
+    rows = []
+    timings = best_of_each(args.repeat, [run_dicts, run_batches])
+    for label, candidates, seconds in (
+        ("dict per place", dict_candidates, timings[0]),
+        ("PlaceBatch", batch_candidates, timings[1]),
+    ):
+        peaks, held = [], []
+        for e, a, n, c in requests:
+            peak, _ = measure(lambda: rank_places(candidates(e, a, n), context=c, weights=weights, limit=10))
+            peaks.append(peak)
+            held.append(measure(lambda: candidates(e, a, n))[1])
+        rows.append((label, seconds, sum(peaks) / len(peaks), sum(held) / len(held)))
+
+    print(f"{args.requests} requests x {args.elements} elements, best of {args.repeat}")
+    for label, seconds, peak, held in rows:
+        print(
+            f"  {label:<16} {seconds / args.requests * 1e3:7.3f} ms/request"
+            f"  peak {peak / 1024:7.1f} KiB/request  candidates hold {held / 1024:7.1f} KiB"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
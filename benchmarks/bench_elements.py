@@ -0,0 +1,166 @@
+"""Micro-benchmark for turning an Overpass city response into places.
+
+Builds a synthetic 10k-element response shaped like a real city query and
+reports the per-element cost of popularity scoring and of the full
+element-to-place conversion. The previous dict-lookup scorer is kept here as
+a reference; the run fails if the table-driven scorer disagrees with it.
+
+    python benchmarks/bench_elements.py [--elements 10000] [--repeat 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from smarttrip.services.osm_service import (  # noqa: E402
+    _ALL_ACTIVITIES,
+    _activity_filters,
+    _elements_to_places,
+    _score_popularity,
+)
+
+
+def reference_score_popularity(tags: Dict[str, Any]) -> int:
+    if not tags:
+        return 10
+
+    score = 0
+
+    name = tags.get("name") or tags.get("brand") or tags.get("operator") or tags.get("name:en")
+    score += 18 if name else 6
+
+    if tags.get("wikipedia") or tags.get("wikipedia:en"):
+        score += 30
+    if tags.get("wikidata"):
+        score += 25
+
+    if tags.get("website") or tags.get("contact:website"):
+        score += 8
+    if tags.get("opening_hours"):
+        score += 4
+    if tags.get("phone") or tags.get("contact:phone") or tags.get("email") or tags.get("contact:email"):
+        score += 4
+    if tags.get("image") or tags.get("wikimedia_commons"):
+        score += 4
+    if tags.get("contact:instagram") or tags.get("contact:facebook") or tags.get("contact:twitter"):
+        score += 4
+
+    tourism = str(tags.get("tourism") or "").strip().lower()
+    if tourism in {"attraction", "museum", "gallery", "zoo", "theme_park", "aquarium"}:
+        score += 18
+    elif tourism in {"viewpoint", "picnic_site"}:
+        score += 10
+
+    historic = str(tags.get("historic") or "").strip().lower()
+    if historic and historic != "no":
+        score += 10
+
+    if tags.get("heritage"):
+        score += 8
+
+    amenity = str(tags.get("amenity") or "").strip().lower()
+    if amenity in {"restaurant", "cafe", "cinema", "theatre", "arts_centre"}:
+        score += 6
+
+    leisure = str(tags.get("leisure") or "").strip().lower()
+    if leisure in {"park", "garden", "nature_reserve", "water_park", "bowling_alley", "amusement_arcade"}:
+        score += 6
+
+    if any(str(k).startswith("addr:") for k in tags.keys()):
+        score += 3
+
+    return int(max(0, min(100, score)))
+
+
+_OPTIONAL_TAGS = [
+    ("name:en", "Place"),
+    ("brand", "Brand"),
+    ("operator", ""),
+    ("wikipedia", "fa:Place"),
+    ("wikidata", "Q1"),
+    ("website", "https://example.org"),
+    ("opening_hours", "Mo-Su 09:00-22:00"),
+    ("phone", "+98 21 0000 0000"),
+    ("contact:instagram", "place"),
+    ("image", "https://example.org/a.jpg"),
+    ("historic", "no"),
+    ("historic", " Monument "),
+    ("heritage", "2"),
+    ("addr:street", "Valiasr"),
+    ("addr:city", "Tehran"),
+    ("cuisine", "persian"),
+    ("wheelchair", "yes"),
+]
+
+
+def synthetic_elements(count: int, seed: int = 13) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    tag_pool = sorted({tag for a in _ALL_ACTIVITIES for tag in _activity_filters(a)})
+    elements: List[Dict[str, Any]] = []
+    for i in range(count):
+        key, value = rng.choice(tag_pool)
+        tags: Dict[str, Any] = {key: value.upper() if rng.random() < 0.02 else value}
+        if rng.random() < 0.8:
+            tags["name"] = f"Place {i}"
+        for extra_key, extra_value in rng.sample(_OPTIONAL_TAGS, rng.randint(0, 8)):
+            tags[extra_key] = extra_value
+        lat = 35.6 + rng.random() * 0.2
+        lon = 51.2 + rng.random() * 0.3
+        if rng.random() < 0.7:
+            elements.append({"type": "node", "id": i, "lat": lat, "lon": lon, "tags": tags})
+        else:
+            elements.append({"type": "way", "id": i, "center": {"lat": lat, "lon": lon}, "tags": tags})
+    return elements
+
+
+def best_of(repeat: int, fn: Callable[[], Any]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--elements", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    elements = synthetic_elements(args.elements)
+    tag_dicts = [e["tags"] for e in elements]
+
+    mismatches = sum(1 for t in tag_dicts if _score_popularity(t) != reference_score_popularity(t))
+    if mismatches:
+        print(f"FAIL: {mismatches} elements scored differently from the reference")
+        return 1
+
+    n = len(elements)
+    activities = list(_ALL_ACTIVITIES)
+    rows = [
+        ("score (reference)", best_of(args.repeat, lambda: [reference_score_popularity(t) for t in tag_dicts])),
+        ("score (rule table)", best_of(args.repeat, lambda: [_score_popularity(t) for t in tag_dicts])),
+        (
+            "elements -> places",
+            best_of(
+                args.repeat,
+                lambda: _elements_to_places(elements, activities, candidate_limit=n, limit=n),
+            ),
+        ),
+    ]
+    print(f"{n} elements, best of {args.repeat}")
+    for label, seconds in rows:
+        print(f"  {label:<20} {seconds * 1e3:8.2f} ms total  {seconds / n * 1e6:7.2f} us/element")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""Latency and ranking-quality benchmark for the ranking engines.
+
+Replays logged /recommend requests from the SQLite log (``--db``), or a
+synthetic workload with clicks from a planted preference (the default),
+through each engine:
+
+    logged   the order the places were shown in (synthetic: candidate order)
+    ml       ai_recommender.rank_places with the stored global + session weights
+    legacy   algorithm.recommend_places
+
+and reports p50/p95/p99 latency per request, traced allocation per request
+(peak and what the result keeps) and NDCG@k / MRR against the clicks. The
+log only keeps the places that were shown, so replay re-ranks those. Results
+go to ``--out`` as JSON; ``--baseline`` prints the change against an earlier
+run.
+
+    python benchmarks/bench_ranking.py [--db smarttrip.sqlite] [--out run.json] [--baseline old.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_scoring import synthetic_context, synthetic_places  # noqa: E402
+
+from smarttrip.ai_recommender import (  # noqa: E402
+    FEATURE_NAMES,
+    TRAINING_ACTIONS,
+    build_features_from_context,
+    compile_context,
+    np,
+    place_id,
+    rank_places,
+    seed_weights,
+)
+from smarttrip.algorithm import recommend_places  # noqa: E402
+from smarttrip.storage import connect, iter_recommendations, load_global_weights, load_user_weights  # noqa: E402
+
+# (places, context, weights) -> the same places, best first
+Engine = Callable[[List[Dict[str, Any]], Dict[str, Any], Dict[str, float]], List[Dict[str, Any]]]
+Request = Tuple[List[Dict[str, Any]], Dict[str, Any], Dict[str, float], Set[str]]
+
+# Preference behind the synthetic clicks; deliberately not the seed weights.
+_PLANTED = {
+    "activity_fit": 2.0,
+    "distance_fit": 1.5,
+    "group_fit": 0.8,
+    "budget_fit": 1.0,
+    "people_fit": 0.5,
+    "quality": 2.5,
+    "popularity": 1.0,
+}
+
+
+def _logged(places: List[Dict[str, Any]], context: Dict[str, Any], weights: Dict[str, float]) -> List[Dict[str, Any]]:
+    return places
+
+
+def _ml(places: List[Dict[str, Any]], context: Dict[str, Any], weights: Dict[str, float]) -> List[Dict[str, Any]]:
+    return rank_places(places, context=context, weights=weights, limit=len(places))
+
+
+def _legacy(places: List[Dict[str, Any]], context: Dict[str, Any], weights: Dict[str, float]) -> List[Dict[str, Any]]:
+    origin = context.get("origin") or (35.6892, 51.3890)
+    return recommend_places(
+        places,
+        user_activity=str(context.get("user_activity") or "nature"),
+        user_group_type=str(context.get("user_group_type") or "friends"),
+        user_budget=str(context.get("user_budget") or "medium"),
+        people_count=context.get("people_count"),
+        has_car=context.get("has_car"),
+        origin=(float(origin[0]), float(origin[1])),
+        limit=len(places),
+    )
+
+
+ENGINES: Dict[str, Engine] = {"logged": _logged, "ml": _ml, "legacy": _legacy}
+
+
+def replayed_requests(db_path: str, limit: Optional[int]) -> List[Request]:
+    """Logged requests with the weights /recommend would have ranked them with today."""
+    conn = connect(db_path)
+    try:
+        global_weights = {**seed_weights(), **load_global_weights(conn)}
+        by_session: Dict[str, Dict[str, float]] = {}
+        requests: List[Request] = []
+        for _, session_id, context, places, clicked in iter_recommendations(conn, TRAINING_ACTIONS, limit=limit):
+            if not places:
+                continue
+            if session_id and session_id not in by_session:
+                offsets = load_user_weights(conn, session_id)
+                by_session[session_id] = {k: w + offsets.get(k, 0.0) for k, w in global_weights.items()}
+            requests.append((places, context, by_session.get(session_id or "", global_weights), clicked))
+        return requests
+    finally:
+        conn.close()
+
+
+def synthetic_requests(count: int, places: int, rng: random.Random) -> List[Request]:
+    """Synthetic candidate sets; each gets one click (sometimes two) from a noisy planted preference."""
+    weights = seed_weights()
+    requests: List[Request] = []
+    for _ in range(count):
+        candidates = synthetic_places(places, rng)
+        for p in candidates:
+            p["place_id"] = place_id(p)
+        context = synthetic_context(rng)
+        ctx = compile_context(context)
+        utility = []
+        for p in candidates:
+            features = build_features_from_context(p, ctx)
+            gumbel = -math.log(-math.log(rng.random() or 1e-12))
+            utility.append(sum(_PLANTED.get(k, 0.0) * features[k] for k in FEATURE_NAMES) + gumbel)
+        order = sorted(range(len(candidates)), key=utility.__getitem__, reverse=True)
+        clicked = {candidates[order[0]]["place_id"]}
+        if rng.random() < 0.3:
+            clicked.add(candidates[order[1]]["place_id"])
+        requests.append((candidates, context, weights, clicked))
+    return requests
+
+
+def ranking_quality(ranked: List[Dict[str, Any]], clicked: Set[str], k: int) -> Tuple[float, float]:
+    """Binary-relevance NDCG@k and reciprocal rank of the first clicked place."""
+    ids = [str(p.get("place_id") or place_id(p)) for p in ranked]
+    dcg = sum(1.0 / math.log2(i + 2) for i, pid in enumerate(ids[:k]) if pid in clicked)
+    ideal = sum(1.0 / math.log2(i + 2) for i in range(min(k, len(clicked))))
+    first = next((i for i, pid in enumerate(ids) if pid in clicked), None)
+    return (dcg / ideal if ideal else 0.0), (1.0 / (first + 1) if first is not None else 0.0)
+
+
+def traced(fn: Callable[[], Any]) -> Tuple[int, int]:
+    """Peak traced bytes while ``fn`` runs, and bytes still held by its result."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak - before, current - before
+
+
+def percentiles_ms(samples: List[float]) -> Dict[str, float]:
+    cuts = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    return {
+        "p50": cuts[49] * 1e3,
+        "p95": cuts[94] * 1e3,
+        "p99": cuts[98] * 1e3,
+        "mean": statistics.fmean(samples) * 1e3,
+    }
+
+
+def run(requests: List[Request], engines: List[str], *, repeat: int, k: int) -> Dict[str, Dict[str, Any]]:
+    samples: Dict[str, List[float]] = {name: [] for name in engines}
+    for _ in range(repeat):
+        # Interleave engines per request so machine noise hits them alike.
+        for places, context, weights, _ in requests:
+            for name in engines:
+                started = time.perf_counter()
+                ENGINES[name](places, context, weights)
+                samples[name].append(time.perf_counter() - started)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    clicked_requests = [r for r in requests if r[3]]
+    for name in engines:
+        engine = ENGINES[name]
+        allocations = [traced(lambda: engine(p, c, w)) for p, c, w, _ in requests]
+        quality = [ranking_quality(engine(p, c, w), clicked, k) for p, c, w, clicked in clicked_requests]
+        results[name] = {
+            "latency_ms": percentiles_ms(samples[name]),
+            "alloc_peak_kib": statistics.fmean(a[0] for a in allocations) / 1024,
+            "alloc_held_kib": statistics.fmean(a[1] for a in allocations) / 1024,
+            f"ndcg@{k}": statistics.fmean(q[0] for q in quality) if quality else None,
+            "mrr": statistics.fmean(q[1] for q in quality) if quality else None,
+        }
+    return results
+
+
+def _print_results(report: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    print(
+        f"{report['requests']} requests ({report['source']}), {report['clicked_requests']} with clicks,"
+        f" {report['repeat']} passes, {report['numpy']}"
+    )
+    k = report["k"]
+    for name, result in report["engines"].items():
+        latency = result["latency_ms"]
+        ndcg = result[f"ndcg@{k}"]
+        mrr = result["mrr"]
+        print(
+            f"  {name:<8} p50 {latency['p50']:7.3f}  p95 {latency['p95']:7.3f}  p99 {latency['p99']:7.3f} ms"
+            f"  peak {result['alloc_peak_kib']:7.1f} KiB"
+            f"  ndcg@{k} {'-' if ndcg is None else f'{ndcg:.4f}'}  mrr {'-' if mrr is None else f'{mrr:.4f}'}"
+        )
+        old = (baseline or {}).get("engines", {}).get(name)
+        if old:
+            changes = []
+            for label, new_value, old_value in (
+                ("p50", latency["p50"], old["latency_ms"]["p50"]),
+                ("p95", latency["p95"], old["latency_ms"]["p95"]),
+                ("peak", result["alloc_peak_kib"], old["alloc_peak_kib"]),
+            ):
+                if old_value:
+                    changes.append(f"{label} {100.0 * (new_value / old_value - 1.0):+.1f}%")
+            for label in (f"ndcg@{k}", "mrr"):
+                if result.get(label) is not None and old.get(label) is not None:
+                    changes.append(f"{label} {result[label] - old[label]:+.4f}")
+            print(f"  {'':<8} vs baseline: {', '.join(changes)}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="Replay this SQLite log instead of synthetic requests.")
+    parser.add_argument("--requests", type=int, default=300, help="Synthetic requests, or the most to replay.")
+    parser.add_argument("--places", type=int, default=60, help="Candidates per synthetic request.")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="Comma-separated subset of: " + ", ".join(ENGINES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--k", type=int, default=10, help="Cut-off for NDCG.")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--out", help="Write the results here as JSON.")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against.")
+    args = parser.parse_args()
+
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    unknown = [e for e in engines if e not in ENGINES]
+    if unknown:
+        print(f"Unknown engine(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    if args.db:
+        requests = replayed_requests(args.db, args.requests)
+        source = f"replayed from {args.db}"
+    else:
+        requests = synthetic_requests(args.requests, args.places, random.Random(args.seed))
+        source = f"synthetic, {args.places} places each"
+    if not requests:
+        print("No requests to replay", file=sys.stderr)
+        return 1
+
+    report = {
+        "source": source,
+        "requests": len(requests),
+        "clicked_requests": sum(1 for r in requests if r[3]),
+        "repeat": args.repeat,
+        "k": args.k,
+        "python": platform.python_version(),
+        "numpy": f"numpy {np.__version__}" if np is not None else "numpy missing, pure Python fallback",
+        "engines": run(requests, engines, repeat=args.repeat, k=args.k),
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fp:
+            baseline = json.load(fp)
+    _print_results(report, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            json.dump(report, fp, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Micro-benchmark for scoring and ranking candidate places in ai_recommender.
+
+Scores synthetic candidate sets (shaped like /recommend's: OSM and demo
+places, radius and city mode) with the per-place ``score_place`` loop and
+with the batch ``score_places`` engine, and ranks them with ``rank_places``
+(top-k on raw scores) against scoring and sorting every candidate, on one
+core. The run fails if any of them disagree on a score, raw score, distance,
+explanation or the order of the top places.
+
+    python benchmarks/bench_scoring.py [--places 250] [--requests 200] [--repeat 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from smarttrip.ai_recommender import np, rank_places, score_place, score_places, seed_weights  # noqa: E402
+
+_TYPES = ["nature", "cafe", "restaurant", "entertainment", "park", "juice", "cinema", "museum", "hotel", "fast_food"]
+_GROUPS = ["solo", "friends", "family"]
+
+
+def synthetic_places(count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    places: List[Dict[str, Any]] = []
+    for i in range(count):
+        place: Dict[str, Any] = {
+            "name": f"Place {i}",
+            "type": rng.choice(_TYPES),
+            "lat": 35.7 + rng.uniform(-0.1, 0.1),
+            "lon": 51.4 + rng.uniform(-0.1, 0.1),
+            "price_tier": rng.randint(1, 4),
+            "best_for": rng.sample(_GROUPS, rng.randint(0, 3)),
+            "ideal_people": (rng.randint(1, 3), rng.randint(3, 10)),
+        }
+        if rng.random() < 0.6:
+            place["rating"] = round(rng.uniform(3.0, 5.0), 1)
+        if rng.random() < 0.9:
+            place["osm_kind"] = rng.choice(["node", "way"])
+            place["osm_id"] = i
+            place["popularity_score"] = rng.randint(0, 100)
+        if rng.random() < 0.02:
+            del place["lat"]
+            place["distance_km"] = rng.uniform(0.0, 12.0)
+        places.append(place)
+    return places
+
+
+def synthetic_context(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "lang": rng.choice(["en", "fa"]),
+        "user_activity": rng.choice(_TYPES),
+        "user_activities": rng.sample(_TYPES, rng.randint(1, 3)),
+        "user_group_type": rng.choice(_GROUPS),
+        "user_budget": rng.choice(["low", "medium", "open"]),
+        "people_count": rng.randint(1, 8),
+        "has_car": rng.random() < 0.5,
+        "origin": [35.7, 51.4],
+        "search_mode": rng.choice(["radius", "city"]),
+    }
+
+
+def reference_rank(
+    places: List[Dict[str, Any]], context: Dict[str, Any], weights: Dict[str, float], limit: int
+) -> List[Dict[str, Any]]:
+    """Score every candidate, sort them all, keep ``limit`` (rank_places before top-k selection)."""
+    scored = score_places(places, context=context, weights=weights)
+    if context["search_mode"] == "city":
+        scored.sort(
+            key=lambda x: (
+                float(x.get("score_raw", 0.0)),
+                float(x.get("popularity_score", 0.0)),
+                float(x.get("rating", 0.0)),
+            ),
+            reverse=True,
+        )
+    else:
+        scored.sort(
+            key=lambda x: (float(x.get("score_raw", 0.0)), -float(x.get("distance_km", 9999.0))),
+            reverse=True,
+        )
+    return scored[:limit]
+
+
+def best_of(repeat: int, fn: Callable[[], Any]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--places", type=int, default=250)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    weights = seed_weights()
+    batches = [(synthetic_places(args.places, rng), synthetic_context(rng)) for _ in range(args.requests)]
+
+    keys = ("place_id", "score", "score_raw", "distance_km", "breakdown", "explanation")
+    mismatches = 0
+    for places, context in batches:
+        expected = [score_place(p, context=context, weights=weights) for p in places]
+        actual = score_places(places, context=context, weights=weights)
+        mismatches += sum(1 for e, a in zip(expected, actual) if any(e[k] != a[k] for k in keys))
+        if rank_places(places, context=context, weights=weights, limit=args.limit) != reference_rank(
+            places, context, weights, args.limit
+        ):
+            print("FAIL: rank_places picked different top places than a full sort")
+            return 1
+    if mismatches:
+        print(f"FAIL: {mismatches} places scored differently by the batch engine")
+        return 1
+
+    total = args.places * args.requests
+    rows = [
+        (
+            "score_place loop",
+            best_of(
+                args.repeat,
+                lambda: [[score_place(p, context=c, weights=weights) for p in ps] for ps, c in batches],
+            ),
+        ),
+        (
+            "score_places batch",
+            best_of(args.repeat, lambda: [score_places(ps, context=c, weights=weights) for ps, c in batches]),
+        ),
+        (
+            "score + sort all",
+            best_of(args.repeat, lambda: [reference_rank(ps, c, weights, args.limit) for ps, c in batches]),
+        ),
+        (
+            f"rank_places top-{args.limit}",
+            best_of(
+                args.repeat,
+                lambda: [rank_places(ps, context=c, weights=weights, limit=args.limit) for ps, c in batches],
+            ),
+        ),
+    ]
+    engine = f"numpy {np.__version__}" if np is not None else "numpy missing, pure Python fallback"
+    print(f"{args.requests} requests x {args.places} places ({engine}), best of {args.repeat}, one core")
+    for label, seconds in rows:
+        print(
+            f"  {label:<20} {seconds / args.requests * 1e3:7.3f} ms/request"
+            f"  {total / seconds:10.0f} places/s"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
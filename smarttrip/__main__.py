@@ -0,0 +1,174 @@
+"""Command line entry point: ``python -m smarttrip <command>``."""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from typing import List, Optional
+
+
+def _default_config(key: str) -> str:
+    try:
+        from smarttrip.app import create_app
+    except ImportError:  # pragma: no cover
+        from app import create_app  # type: ignore
+
+    return str(create_app().config[key])
+
+
+def _cmd_import_osm(args: argparse.Namespace) -> int:
+    import xml.etree.ElementTree as ET
+
+    try:
+        from smarttrip.services.osm_import import import_extract
+    except ImportError:  # pragma: no cover
+        from services.osm_import import import_extract  # type: ignore
+
+    db_path = args.db or _default_config("SMARTTRIP_POI_DB_PATH")
+    try:
+        written = import_extract(args.path, db_path, fmt=args.format)
+    except (ValueError, ET.ParseError) as e:
+        # Batches before the bad spot stay in the store; re-importing a good extract overwrites them.
+        print(f"Import of {args.path} failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Imported {written} POI rows into {db_path}")
+    return 0
+
+
+def _cmd_warm(args: argparse.Namespace) -> int:
+    try:
+        from smarttrip.app import _ALLOWED_ACTIVITIES, app
+        from smarttrip.services.warmup import warm_cities
+    except ImportError:  # pragma: no cover
+        from app import _ALLOWED_ACTIVITIES, app  # type: ignore
+        from services.warmup import warm_cities  # type: ignore
+
+    cities = list(args.cities) or list(app.config["SMARTTRIP_WARM_CITIES"])
+    if not cities:
+        print("No cities given and SMARTTRIP_WARM_CITIES is empty", file=sys.stderr)
+        return 2
+    if args.activities:
+        activities = [a.strip() for a in args.activities.split(",") if a.strip() in _ALLOWED_ACTIVITIES]
+    else:
+        activities = sorted(_ALLOWED_ACTIVITIES)
+
+    failed = 0
+    for result in warm_cities(cities, activities, limit=args.limit):
+        if result["status"] != "ok":
+            failed += 1
+        print(
+            f"{result['city']}: {result['status']}"
+            f" (fetched: {', '.join(result['fetched']) or '-'}; already cached: {', '.join(result['cached']) or '-'})"
+        )
+    return 1 if failed else 0
+
+
+def _cmd_train(args: argparse.Namespace) -> int:
+    try:
+        from smarttrip.ai_recommender import MODEL_VERSION
+        from smarttrip.storage import apply_trained_weights, connect, save_weight_snapshot
+        from smarttrip.trainer import train
+    except ImportError:  # pragma: no cover
+        from ai_recommender import MODEL_VERSION  # type: ignore
+        from storage import apply_trained_weights, connect, save_weight_snapshot  # type: ignore
+        from trainer import train  # type: ignore
+
+    db_path = args.db or _default_config("SMARTTRIP_DB_PATH")
+    conn = connect(db_path)
+    try:
+        result = train(
+            conn,
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            lr=args.lr,
+            session_epochs=args.session_epochs,
+            session_lr=args.session_lr,
+            workers=args.workers,
+            from_seed=args.from_seed,
+            full=args.full,
+            seed=args.seed,
+        )
+        stats = result["stats"]
+        if not stats["pairs"]:
+            since = f" since weight snapshot {stats['base_snapshot']}" if stats["base_snapshot"] else ""
+            print(f"No trainable feedback in {db_path}{since}", file=sys.stderr)
+            return 1
+        version = save_weight_snapshot(
+            conn,
+            model_version=MODEL_VERSION,
+            last_event_id=result["last_event_id"],
+            global_weights=result["global"],
+            session_weights=result["sessions"],
+            stats=stats,
+        )
+        if args.apply:
+            apply_trained_weights(conn, result["global"], result["sessions"])
+    finally:
+        conn.close()
+
+    print(
+        f"{stats['events']} clicks after event {stats['after_event_id']}, {stats['pairs']} pairs,"
+        f" {stats['sessions']} sessions ({stats['load_s']:.2f}s to load)"
+    )
+    for epoch in stats["global"]["epochs"]:
+        print(
+            f"  epoch {epoch['epoch']:3d}  loss {epoch['loss']:.4f}  accuracy {epoch['accuracy']:.3f}"
+            f"  step {epoch['step_norm']:.4f}"
+        )
+    session = stats["session"]
+    print(f"global:   {stats['global']['pairs_per_s']:,.0f} pairs/s")
+    if stats["sessions"]:
+        print(
+            f"sessions: {session['pairs_per_s']:,.0f} pairs/s on {session['workers']} workers,"
+            f" loss {session['loss_before']:.4f} -> {session['loss_after']:.4f}"
+        )
+    if stats["carried_sessions"]:
+        print(f"          {stats['carried_sessions']} sessions without new clicks shifted to the new weights")
+    print(f"Saved weight snapshot {version}" + (" and applied it" if args.apply else ""))
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="smarttrip")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_osm = commands.add_parser(
+        "import-osm", help="Load an .osm XML file or Overpass JSON dump into the local POI store."
+    )
+    import_osm.add_argument("path", help="Path to the .osm / .json extract.")
+    import_osm.add_argument("--db", help="POI store path (default: the app's SMARTTRIP_POI_DB_PATH).")
+    import_osm.add_argument("--format", choices=["auto", "xml", "json"], default="auto")
+    import_osm.set_defaults(handler=_cmd_import_osm)
+
+    warm = commands.add_parser(
+        "warm", help="Pre-populate the geocode and city caches for a list of cities."
+    )
+    warm.add_argument("cities", nargs="*", help="City names (default: the app's SMARTTRIP_WARM_CITIES).")
+    warm.add_argument("--activities", help="Comma-separated activities (default: all supported).")
+    warm.add_argument("--limit", type=int, default=120, help="Places cached per city and activity.")
+    warm.set_defaults(handler=_cmd_warm)
+
+    train = commands.add_parser(
+        "train", help="Refit the ranking weights to the clicks logged since the last weight snapshot."
+    )
+    train.add_argument("--db", help="Database path (default: the app's SMARTTRIP_DB_PATH).")
+    train.add_argument("--epochs", type=int, default=10)
+    train.add_argument("--batch-size", type=int, default=256)
+    train.add_argument("--lr", type=float, default=0.5, help="Learning rate of the global fit.")
+    train.add_argument("--session-epochs", type=int, default=20)
+    train.add_argument("--session-lr", type=float, default=0.2, help="Learning rate of the per-session fits.")
+    train.add_argument("--workers", type=int, help="Processes for the per-session fits (default: CPU count).")
+    train.add_argument("--full", action="store_true", help="Replay every logged click, not just the new ones.")
+    train.add_argument(
+        "--from-seed", action="store_true", help="Replay every click starting from the seed weights, not the live ones."
+    )
+    train.add_argument("--seed", type=int, default=0, help="Shuffling seed.")
+    train.add_argument("--apply", action="store_true", help="Also write the new weights to the live tables.")
+    train.set_defaults(handler=_cmd_train)
+
+    args = parser.parse_args(argv)
+    return int(args.handler(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
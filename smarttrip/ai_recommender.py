@@ -1,10 +1,65 @@
 from __future__ import annotations
 
+import heapq
 import math
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional; scoring falls back to pure Python
+    np = None  # type: ignore[assignment]
+
+try:
+    from smarttrip.place_batch import PlaceBatch, PlaceKind
+    from smarttrip.taxonomy import (
+        FAMILIES,
+        FOOD_MASK,
+        budget_tier,
+        canonical_budget,
+        canonical_family,
+        canonical_group,
+        family_code,
+        group_bit,
+        group_mask,
+    )
+except ImportError:  # pragma: no cover
+    from place_batch import PlaceBatch, PlaceKind  # type: ignore
+    from taxonomy import (  # type: ignore
+        FAMILIES,
+        FOOD_MASK,
+        budget_tier,
+        canonical_budget,
+        canonical_family,
+        canonical_group,
+        family_code,
+        group_bit,
+        group_mask,
+    )
 
 
 MODEL_VERSION = "ml-v3"
+# Feedback actions the weights learn from (online in /feedback, offline in trainer).
+TRAINING_ACTIONS = ("click", "choose", "like")
+
+# Feature order of build_features (and of the batch feature matrix columns).
+FEATURE_NAMES = (
+    "bias",
+    "activity_fit",
+    "distance_fit",
+    "group_fit",
+    "budget_fit",
+    "people_fit",
+    "quality",
+    "popularity",
+    "city_mode",
+)
+
+# Below this many places the per-place path is faster than building arrays.
+_BATCH_MIN_PLACES = 8
+# sum() of floats is compensated (Neumaier) from Python 3.12; the batch
+# logits mirror whichever summation _dot gets so scores stay identical.
+_COMPENSATED_SUM = sys.version_info >= (3, 12)
 
 # Calibrate the UI-facing score so it doesn't saturate at 100 for most places.
 # (The model is pairwise-learned and only needs a monotonic score for ranking.)
@@ -51,45 +106,6 @@ def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return r_km * c
 
 
-def _canonical_activity(activity: Any) -> str:
-    a = str(activity or "").strip().lower()
-    alias = {
-        "fast_food": "restaurant",
-        "juice": "cafe",
-        "ice_cream": "cafe",
-        "park": "nature",
-        "attraction": "nature",
-        "nature_tourism": "nature",
-        "historical": "nature",
-        "cinema": "entertainment",
-        "amusement_park": "entertainment",
-        "theatre": "entertainment",
-        "museum": "entertainment",
-        "pool": "entertainment",
-        "hotel": "entertainment",
-        "eco_lodge": "nature",
-        "hostel": "entertainment",
-        "market": "entertainment",
-        "shopping_mall": "entertainment",
-    }
-    a = alias.get(a, a)
-    return a if a in {"nature", "cafe", "restaurant", "entertainment"} else "nature"
-
-
-def _canonical_group(group_type: Any) -> str:
-    g = str(group_type or "").strip().lower()
-    return g if g in {"solo", "friends", "family"} else "friends"
-
-
-def _canonical_budget(budget: Any) -> str:
-    b = str(budget or "").strip().lower()
-    if b in {"low", "cheap", "کم"}:
-        return "low"
-    if b in {"open", "high", "زیاد"}:
-        return "open"
-    return "medium"
-
-
 def _normalize_lang(value: Any) -> str:
     s = str(value or "").strip().lower()
     if s.startswith("fa") or s in {"farsi", "persian", "فارسی"}:
@@ -108,10 +124,6 @@ _SIGNAL_FA = {
 }
 
 
-def _budget_tier(budget: str) -> int:
-    return {"low": 1, "medium": 2, "open": 3}.get(_canonical_budget(budget), 2)
-
-
 def place_id(place: Dict[str, Any]) -> str:
     kind = place.get("osm_kind")
     oid = place.get("osm_id")
@@ -134,12 +146,7 @@ def _safe_float(value: Any, default: float) -> float:
         return default
 
 
-def _people_fit(people_count: Any, ideal_people: Any) -> float:
-    try:
-        people = int(people_count)
-    except Exception:
-        people = 2
-
+def _people_fit(people: int, ideal_people: Any) -> float:
     try:
         low = int(ideal_people[0])
         high = int(ideal_people[1])
@@ -153,6 +160,115 @@ def _people_fit(people_count: Any, ideal_people: Any) -> float:
     return float(math.exp(-gap / 2.5))
 
 
+class ScoringContext:
+    """Everything scoring needs from a request, resolved once.
+
+    Activities, group and budget are canonicalized and the people count parsed
+    up front, so per-place scoring only reads place fields. Selected families
+    and the group are also kept as bitmasks (see ``taxonomy``) for matching
+    against place codes. Built by ``compile_context`` from the /recommend
+    ``context`` dict; immutable.
+    """
+
+    __slots__ = (
+        "activity",
+        "selected_types",
+        "selected_mask",
+        "food_selected",
+        "group",
+        "group_bit",
+        "budget",
+        "user_tier",
+        "people",
+        "tau_km",
+        "origin",
+        "origin_cos",
+        "is_city",
+        "lang",
+    )
+
+    def __init__(
+        self,
+        *,
+        user_activity: str,
+        user_activities: Optional[List[str]] = None,
+        user_group_type: str,
+        user_budget: str,
+        people_count: Any,
+        has_car: Any,
+        origin: Tuple[float, float],
+        search_mode: str = "radius",
+        lang: Any = None,
+    ) -> None:
+        activity = canonical_family(user_activity)
+        selected_types = {activity}
+        for raw in user_activities or []:
+            selected_types.add(canonical_family(raw))
+        selected_mask = 0
+        for family in selected_types:
+            selected_mask |= 1 << family_code(family)
+        budget = canonical_budget(user_budget)
+        try:
+            people = int(people_count)
+        except Exception:
+            people = 2
+        origin_lat, origin_lon = float(origin[0]), float(origin[1])
+
+        values = {
+            "activity": activity,
+            "selected_types": frozenset(selected_types),
+            "selected_mask": selected_mask,
+            "food_selected": bool(selected_mask & FOOD_MASK),
+            "group": canonical_group(user_group_type),
+            "group_bit": group_bit(user_group_type),
+            "budget": budget,
+            "user_tier": budget_tier(budget),
+            "people": people,
+            "tau_km": 4.8 if bool(has_car) else 2.4,
+            "origin": (origin_lat, origin_lon),
+            "origin_cos": math.cos(math.radians(origin_lat)),
+            "is_city": str(search_mode).strip().lower() == "city",
+            "lang": _normalize_lang(lang),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("ScoringContext is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("ScoringContext is immutable")
+
+
+def compile_context(context: Union[Dict[str, Any], ScoringContext]) -> ScoringContext:
+    """Resolve a request ``context`` dict (as logged with a recommendation) into a ScoringContext."""
+    if isinstance(context, ScoringContext):
+        return context
+    return ScoringContext(
+        user_activity=str(context.get("user_activity") or "nature"),
+        user_activities=[
+            str(x) for x in (context.get("user_activities") or context.get("user_primary_activities") or [])
+        ],
+        user_group_type=str(context.get("user_group_type") or "friends"),
+        user_budget=str(context.get("user_budget") or "medium"),
+        people_count=context.get("people_count", 2),
+        has_car=context.get("has_car", False),
+        origin=tuple(context.get("origin") or (0.0, 0.0)),  # type: ignore[arg-type]
+        search_mode=str(context.get("search_mode") or "radius"),
+        lang=context.get("lang"),
+    )
+
+
+def _distance_km(ctx: ScoringContext, lat: float, lon: float) -> float:
+    # haversine_km from the request origin, reusing its cosine.
+    phi2 = math.radians(lat)
+    d_phi = math.radians(lat - ctx.origin[0])
+    d_lambda = math.radians(lon - ctx.origin[1])
+    a = math.sin(d_phi / 2) ** 2 + ctx.origin_cos * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return 6371.0 * c
+
+
 def build_features(
     place: Dict[str, Any],
     *,
@@ -165,26 +281,36 @@ def build_features(
     origin: Tuple[float, float],
     search_mode: str = "radius",
 ) -> Tuple[Dict[str, float], float]:
-    activity = _canonical_activity(user_activity)
-    group = _canonical_group(user_group_type)
-    budget = _canonical_budget(user_budget)
-    has_car_bool = bool(has_car)
-
-    selected_types = {_canonical_activity(user_activity)}
-    for raw in user_activities or []:
-        selected_types.add(_canonical_activity(raw))
-
-    place_type = _canonical_activity(place.get("type") or place.get("activity") or activity)
-    if place_type in selected_types:
-        activity_fit = 1.0
-    elif place_type in {"cafe", "restaurant"} and selected_types.intersection({"cafe", "restaurant"}):
-        activity_fit = 0.65
-    else:
-        activity_fit = 0.25
+    ctx = ScoringContext(
+        user_activity=user_activity,
+        user_activities=user_activities,
+        user_group_type=user_group_type,
+        user_budget=user_budget,
+        people_count=people_count,
+        has_car=has_car,
+        origin=origin,
+        search_mode=search_mode,
+    )
+    return _place_features(place, ctx)
+
+
+def _activity_fit(ctx: ScoringContext, family: int) -> float:
+    """Fit of a place whose type is in family ``family`` (a taxonomy code)."""
+    bit = 1 << family
+    if ctx.selected_mask & bit:
+        return 1.0
+    if FOOD_MASK & bit and ctx.food_selected:
+        return 0.65
+    return 0.25
+
+
+def _group_fit(ctx: ScoringContext, best_for_mask: int) -> float:
+    return 1.0 if best_for_mask & ctx.group_bit else 0.35
 
-    best_for = place.get("best_for") or []
-    best_for_set = {str(x).strip().lower() for x in best_for}
-    group_fit = 1.0 if group in best_for_set else 0.35
+
+def _place_features(place: Dict[str, Any], ctx: ScoringContext) -> Tuple[Dict[str, float], float]:
+    activity_fit = _activity_fit(ctx, family_code(place.get("type") or place.get("activity") or ctx.activity))
+    group_fit = _group_fit(ctx, group_mask(place.get("best_for")))
 
     rating = _safe_float(place.get("rating"), 4.2)
     quality = max(0.0, min(1.0, rating / 5.0))
@@ -195,35 +321,29 @@ def build_features(
     else:
         popularity = quality
 
-    user_tier = _budget_tier(budget)
     place_tier = int(_safe_float(place.get("price_tier"), 2))
-    if budget == "open":
+    if ctx.budget == "open":
         budget_fit = 1.0
-    elif place_tier <= user_tier:
+    elif place_tier <= ctx.user_tier:
         budget_fit = 1.0
-    elif place_tier == user_tier + 1:
+    elif place_tier == ctx.user_tier + 1:
         budget_fit = 0.55
     else:
         budget_fit = 0.25
 
     ideal_people = place.get("ideal_people") or (2, 6)
-    people_fit = _people_fit(people_count, ideal_people)
+    people_fit = _people_fit(ctx.people, ideal_people)
 
     plat = _safe_float(place.get("lat"), float("nan"))
     plon = _safe_float(place.get("lon"), float("nan"))
     if math.isfinite(plat) and math.isfinite(plon):
-        distance_km = haversine_km(origin[0], origin[1], plat, plon)
+        distance_km = _distance_km(ctx, plat, plon)
     else:
         distance_km = _safe_float(place.get("distance_km") or place.get("distance"), 5.0)
 
-    tau_km = 4.8 if has_car_bool else 2.4
-    distance_fit = float(math.exp(-max(0.0, distance_km) / tau_km))
-
-    city_mode = 1.0 if str(search_mode).strip().lower() == "city" else 0.0
     # City search is meant to find the best places across the whole city,
     # not "near the city center", so distance shouldn't affect ranking.
-    if city_mode >= 0.5:
-        distance_fit = 0.0
+    distance_fit = 0.0 if ctx.is_city else float(math.exp(-max(0.0, distance_km) / ctx.tau_km))
 
     features = {
         "bias": 1.0,
@@ -234,7 +354,7 @@ def build_features(
         "people_fit": float(people_fit),
         "quality": float(quality),
         "popularity": float(popularity),
-        "city_mode": float(city_mode),
+        "city_mode": 1.0 if ctx.is_city else 0.0,
     }
     return features, float(distance_km)
 
@@ -246,29 +366,28 @@ def _dot(weights: Dict[str, float], features: Dict[str, float]) -> float:
 def score_place(
     place: Dict[str, Any],
     *,
-    context: Dict[str, Any],
+    context: Union[Dict[str, Any], ScoringContext],
     weights: Dict[str, float],
 ) -> Dict[str, Any]:
-    features, distance_km = build_features(
-        place,
-        user_activity=str(context.get("user_activity") or "nature"),
-        user_activities=[
-            str(x) for x in (context.get("user_activities") or context.get("user_primary_activities") or [])
-        ],
-        user_group_type=str(context.get("user_group_type") or "friends"),
-        user_budget=str(context.get("user_budget") or "medium"),
-        people_count=context.get("people_count", 2),
-        has_car=context.get("has_car", False),
-        origin=tuple(context.get("origin") or (0.0, 0.0)),  # type: ignore[arg-type]
-        search_mode=str(context.get("search_mode") or "radius"),
-    )
+    ctx = compile_context(context)
+    features, distance_km = _place_features(place, ctx)
+    return _scored_place(place, features, distance_km, _dot(weights, features), ctx=ctx, weights=weights)
 
-    logit = _dot(weights, features)
+
+def _scored_place(
+    place: Dict[str, Any],
+    features: Dict[str, float],
+    distance_km: float,
+    logit: float,
+    *,
+    ctx: ScoringContext,
+    weights: Dict[str, float],
+) -> Dict[str, Any]:
+    """Copy of ``place`` with its score, breakdown and explanation filled in."""
     calibrated = (float(logit) + float(_SCORE_INTERCEPT)) / float(_SCORE_TEMPERATURE)
-    p_like = sigmoid(calibrated)
-    score = int(round(p_like * 100))
-    is_city = str(context.get("search_mode") or "radius").strip().lower() == "city"
-    lang = _normalize_lang(context.get("lang"))
+    score = int(round(sigmoid(calibrated) * 100))
+    is_city = ctx.is_city
+    lang = ctx.lang
 
     # Breakdown (0..max) derived from current learned weights.
     breakdown = {
@@ -331,33 +450,233 @@ def score_place(
     return scored
 
 
+def _distance_km_many(ctx: ScoringContext, lat: "np.ndarray", lon: "np.ndarray") -> "np.ndarray":
+    """``_distance_km`` for many points, with the same rounding."""
+    phi2 = np.radians(lat)
+    d_phi = np.radians(lat - ctx.origin[0])
+    d_lambda = np.radians(lon - ctx.origin[1])
+    a = np.sin(d_phi / 2) ** 2 + ctx.origin_cos * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    # numpy's arctan2/exp can differ from libm in the last bit; those two stay on math.
+    c = 2 * np.fromiter(map(math.atan2, np.sqrt(a).tolist(), np.sqrt(1 - a).tolist()), float, len(a))
+    return 6371.0 * c
+
+
+def _batch_features(places: List[Dict[str, Any]], ctx: ScoringContext) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Feature matrix (places x FEATURE_NAMES) and distances, equal to ``build_features`` per place.
+
+    Per-place fields are read in one pass and distance is computed for all
+    places at once.
+    """
+    n = len(places)
+    x = np.zeros((n, len(FEATURE_NAMES)))
+    x[:, 0] = 1.0
+    x[:, 8] = 1.0 if ctx.is_city else 0.0
+    lat = np.empty(n)
+    lon = np.empty(n)
+    fallback_km = np.full(n, 5.0)
+    activity_fits = [_activity_fit(ctx, code) for code in range(len(FAMILIES))]
+    for i, place in enumerate(places):
+        activity_fit = activity_fits[family_code(place.get("type") or place.get("activity") or ctx.activity)]
+
+        rating = _safe_float(place.get("rating"), 4.2)
+        quality = max(0.0, min(1.0, rating / 5.0))
+        popularity_raw = _safe_float(place.get("popularity_score"), float("nan"))
+        popularity = max(0.0, min(1.0, popularity_raw / 100.0)) if math.isfinite(popularity_raw) else quality
+
+        place_tier = int(_safe_float(place.get("price_tier"), 2))
+        if ctx.budget == "open" or place_tier <= ctx.user_tier:
+            budget_fit = 1.0
+        elif place_tier == ctx.user_tier + 1:
+            budget_fit = 0.55
+        else:
+            budget_fit = 0.25
+
+        row = x[i]
+        row[1] = activity_fit
+        row[3] = _group_fit(ctx, group_mask(place.get("best_for")))
+        row[4] = budget_fit
+        row[5] = _people_fit(ctx.people, place.get("ideal_people") or (2, 6))
+        row[6] = quality
+        row[7] = popularity
+
+        lat[i] = _safe_float(place.get("lat"), float("nan"))
+        lon[i] = _safe_float(place.get("lon"), float("nan"))
+        if not (math.isfinite(lat[i]) and math.isfinite(lon[i])):
+            fallback_km[i] = _safe_float(place.get("distance_km") or place.get("distance"), 5.0)
+
+    return x, _fill_distance_fit(x, ctx, lat, lon, fallback_km)
+
+
+def _kind_fits(kind: PlaceKind, ctx: ScoringContext) -> Tuple[float, float, float, float]:
+    """Activity, group, budget and people fit shared by every place of ``kind``."""
+    if ctx.budget == "open" or kind.price_tier <= ctx.user_tier:
+        budget_fit = 1.0
+    elif kind.price_tier == ctx.user_tier + 1:
+        budget_fit = 0.55
+    else:
+        budget_fit = 0.25
+    return (
+        _activity_fit(ctx, kind.family),
+        _group_fit(ctx, kind.best_for_mask),
+        budget_fit,
+        _people_fit(ctx.people, kind.ideal_people or (2, 6)),
+    )
+
+
+def _batch_features_columns(batch: PlaceBatch, ctx: ScoringContext) -> Tuple["np.ndarray", "np.ndarray"]:
+    """``_batch_features`` for a PlaceBatch, read straight from its columns.
+
+    Activity, group, budget and people fit depend only on a place's kind,
+    so they are worked out once per kind and gathered by the kind column.
+    """
+    n = len(batch)
+    x = np.zeros((n, len(FEATURE_NAMES)))
+    x[:, 0] = 1.0
+    fits = np.array([_kind_fits(kind, ctx) for kind in batch.kinds], dtype=float).reshape(-1, 4)
+    x[:, [1, 3, 4, 5]] = fits[np.array(batch.kind, dtype=np.intp)]
+    x[:, 6] = np.minimum(1.0, np.maximum(0.0, np.array(batch.rating) / 5.0))
+    x[:, 7] = np.minimum(1.0, np.maximum(0.0, np.array(batch.popularity) / 100.0))
+    x[:, 8] = 1.0 if ctx.is_city else 0.0
+    return x, _fill_distance_fit(x, ctx, np.array(batch.lat), np.array(batch.lon), np.full(n, 5.0))
+
+
+def _fill_distance_fit(
+    x: "np.ndarray", ctx: ScoringContext, lat: "np.ndarray", lon: "np.ndarray", fallback_km: "np.ndarray"
+) -> "np.ndarray":
+    """Set the distance_fit column of ``x``; returns distances (``fallback_km`` where lat/lon are missing)."""
+    located = np.isfinite(lat) & np.isfinite(lon)
+    distance_km = fallback_km
+    if located.any():
+        distance_km[located] = _distance_km_many(ctx, lat[located], lon[located])
+    if not ctx.is_city:
+        # Same as max(0.0, d): NaN counts as 0.
+        scaled = -np.where(distance_km > 0.0, distance_km, 0.0) / ctx.tau_km
+        x[:, 2] = np.fromiter(map(math.exp, scaled.tolist()), float, len(distance_km))
+    return distance_km
+
+
+def _batch_logits(weights: Dict[str, float], x: "np.ndarray") -> "np.ndarray":
+    """Row-wise ``_dot(weights, features)``, summed in the same order (and way) as ``sum``."""
+    terms = [float(weights.get(k, 0.0)) * x[:, j] for j, k in enumerate(FEATURE_NAMES)]
+    total = terms[0].copy()
+    if not _COMPENSATED_SUM:
+        for term in terms[1:]:
+            total = total + term
+        return total
+    compensation = np.zeros_like(total)
+    for term in terms[1:]:
+        t = total + term
+        compensation += np.where(np.abs(total) >= np.abs(term), (total - t) + term, (term - t) + total)
+        total = t
+    apply = (compensation != 0.0) & np.isfinite(compensation)
+    return np.where(apply, total + compensation, total)
+
+
+Places = Union[List[Dict[str, Any]], PlaceBatch]
+
+
+def _place_at(places: Places, i: int) -> Dict[str, Any]:
+    return places.row(i) if isinstance(places, PlaceBatch) else places[i]
+
+
+def _raw_scores(
+    places: Places,
+    *,
+    ctx: ScoringContext,
+    weights: Dict[str, float],
+) -> Tuple[List[List[float]], List[float], List[float]]:
+    """Feature rows (in FEATURE_NAMES order), distances and logits for ``places``.
+
+    Uses the numpy batch engine when available; the values are identical
+    either way.
+    """
+    if np is None or len(places) < _BATCH_MIN_PLACES:
+        rows: List[List[float]] = []
+        distances: List[float] = []
+        logits: List[float] = []
+        for i in range(len(places)):
+            features, distance_km = _place_features(_place_at(places, i), ctx)
+            rows.append(list(features.values()))
+            distances.append(distance_km)
+            logits.append(_dot(weights, features))
+        return rows, distances, logits
+
+    if isinstance(places, PlaceBatch):
+        x, distance_km = _batch_features_columns(places, ctx)
+    else:
+        x, distance_km = _batch_features(places, ctx)
+    return x.tolist(), distance_km.tolist(), _batch_logits(weights, x).tolist()
+
+
+def score_places(
+    places: Union[Iterable[Dict[str, Any]], PlaceBatch],
+    *,
+    context: Union[Dict[str, Any], ScoringContext],
+    weights: Dict[str, float],
+) -> List[Dict[str, Any]]:
+    """``score_place`` for every place, with features and logits computed as arrays.
+
+    Scores, raw scores and distances are identical to the per-place path,
+    which is used instead when numpy is missing or there are only a few places.
+    """
+    places = places if isinstance(places, PlaceBatch) else list(places)
+    ctx = compile_context(context)
+    rows, distances, logits = _raw_scores(places, ctx=ctx, weights=weights)
+    return [
+        _scored_place(
+            _place_at(places, i), dict(zip(FEATURE_NAMES, rows[i])), distances[i], logits[i], ctx=ctx, weights=weights
+        )
+        for i in range(len(places))
+    ]
+
+
 def rank_places(
-    places: Iterable[Dict[str, Any]],
+    places: Union[Iterable[Dict[str, Any]], PlaceBatch],
     *,
-    context: Dict[str, Any],
+    context: Union[Dict[str, Any], ScoringContext],
     weights: Dict[str, float],
     limit: int = 5,
 ) -> List[Dict[str, Any]]:
-    scored = [score_place(p, context=context, weights=weights) for p in places]
-    is_city = str(context.get("search_mode") or "radius").strip().lower() == "city"
-    if is_city:
-        scored.sort(
-            key=lambda x: (
-                float(x.get("score_raw", 0.0)),
-                float(x.get("popularity_score", 0.0)),
-                float(x.get("rating", 0.0)),
-            ),
-            reverse=True,
-        )
+    """Return the ``limit`` best places, scored.
+
+    Candidates are ordered on their raw scores alone (ties as before: by
+    popularity and rating in city mode, by distance otherwise, then input
+    order); breakdowns and explanations are only built for the places kept.
+    A PlaceBatch is ranked from its columns, and only the kept rows become dicts.
+    """
+    places = places if isinstance(places, PlaceBatch) else list(places)
+    ctx = compile_context(context)
+    rows, distances, logits = _raw_scores(places, ctx=ctx, weights=weights)
+    score_raw = [round(float(logit), 4) for logit in logits]
+    if ctx.is_city and isinstance(places, PlaceBatch):
+        popularity, rating = places.popularity, places.rating
+
+        def key(i: int) -> Tuple[float, ...]:
+            return (score_raw[i], float(popularity[i]), rating[i])
+
+    elif ctx.is_city:
+
+        def key(i: int) -> Tuple[float, ...]:
+            place = places[i]
+            return (
+                score_raw[i],
+                float(place.get("popularity_score", 0.0)),
+                float(place.get("rating", 0.0)),
+            )
+
     else:
-        scored.sort(
-            key=lambda x: (
-                float(x.get("score_raw", 0.0)),
-                -float(x.get("distance_km", 9999.0)),
-            ),
-            reverse=True,
+
+        def key(i: int) -> Tuple[float, ...]:
+            return (score_raw[i], -round(float(distances[i]), 2))
+
+    # nlargest keeps input order among equal keys, like the stable sort it replaces.
+    top = heapq.nlargest(max(1, int(limit)), range(len(places)), key=key)
+    return [
+        _scored_place(
+            _place_at(places, i), dict(zip(FEATURE_NAMES, rows[i])), distances[i], logits[i], ctx=ctx, weights=weights
         )
-    return scored[: max(1, int(limit))]
+        for i in top
+    ]
 
 
 def pairwise_update(
@@ -391,18 +710,8 @@ def pairwise_update(
     return updated
 
 
-def build_features_from_context(place: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, float]:
-    features, _ = build_features(
-        place,
-        user_activity=str(context.get("user_activity") or "nature"),
-        user_activities=[
-            str(x) for x in (context.get("user_activities") or context.get("user_primary_activities") or [])
-        ],
-        user_group_type=str(context.get("user_group_type") or "friends"),
-        user_budget=str(context.get("user_budget") or "medium"),
-        people_count=context.get("people_count", 2),
-        has_car=context.get("has_car", False),
-        origin=tuple(context.get("origin") or (0.0, 0.0)),  # type: ignore[arg-type]
-        search_mode=str(context.get("search_mode") or "radius"),
-    )
+def build_features_from_context(
+    place: Dict[str, Any], context: Union[Dict[str, Any], ScoringContext]
+) -> Dict[str, float]:
+    features, _ = _place_features(place, compile_context(context))
     return features
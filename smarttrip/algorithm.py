@@ -9,6 +9,11 @@ from __future__ import annotations
 import math
 from typing import Any, Dict, Iterable, List, Tuple
 
+try:
+    from smarttrip.taxonomy import canonical_family, canonical_group
+except ImportError:  # pragma: no cover
+    from taxonomy import canonical_family, canonical_group  # type: ignore
+
 Budget = str  # "low" | "medium" | "open"
 GroupType = str  # "solo" | "friends" | "family"
 ActivityType = str  # "nature" | "cafe" | "restaurant" | "entertainment"
@@ -39,37 +44,11 @@ def _budget_tier(budget: Budget) -> int:
 
 
 def _canonical_activity(activity: str) -> ActivityType:
-    activity = (activity or "").strip().lower()
-    alias = {
-        "fast_food": "restaurant",
-        "juice": "cafe",
-        "ice_cream": "cafe",
-        "park": "nature",
-        "attraction": "nature",
-        "nature_tourism": "nature",
-        "historical": "nature",
-        "cinema": "entertainment",
-        "amusement_park": "entertainment",
-        "theatre": "entertainment",
-        "museum": "entertainment",
-        "pool": "entertainment",
-        "hotel": "entertainment",
-        "eco_lodge": "nature",
-        "hostel": "entertainment",
-        "market": "entertainment",
-        "shopping_mall": "entertainment",
-    }
-    activity = alias.get(activity, activity)
-    if activity in {"nature", "cafe", "restaurant", "entertainment"}:
-        return activity  # type: ignore[return-value]
-    return "nature"
+    return canonical_family(activity)
 
 
 def _canonical_group(group_type: str) -> GroupType:
-    group_type = (group_type or "").strip().lower()
-    if group_type in {"solo", "friends", "family"}:
-        return group_type  # type: ignore[return-value]
-    return "friends"
+    return canonical_group(group_type)
 
 
 def _canonical_budget(budget: str) -> Budget:
@@ -1,24 +1,46 @@
 from __future__ import annotations
 
 import os
+import time
 import uuid
-from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, current_app, jsonify, render_template, request
 
 try:
     # Package-style imports (recommended): `python -m smarttrip.app`
     from smarttrip.ai_recommender import (
         MODEL_VERSION,
+        TRAINING_ACTIONS,
         build_features_from_context,
+        compile_context,
         pairwise_update,
         rank_places,
         seed_weights,
     )
     from smarttrip.algorithm import demo_places
     from smarttrip.chat_parser import parse_message
-    from smarttrip.services.osm_service import geocode_city, get_places, get_places_city
+    from smarttrip.place_batch import PlaceBatch
+    from smarttrip.services.cache import TTLCache, WeightsCache
+    from smarttrip.services.gazetteer import DEFAULT_GAZETTEER_PATH, configure_gazetteer, get_gazetteer
+    from smarttrip.services.osm_service import (
+        cache_stats,
+        configure_caches,
+        configure_http_pool,
+        configure_local_store,
+        configure_overpass_endpoints,
+        configure_persistent_cache,
+        geocode_city,
+        get_places_city_multi,
+        get_places_multi,
+        upstream_stats,
+    )
+    from smarttrip.services.ratelimit import configure_rate_limits
+    from smarttrip.services.warmup import start_warm_scheduler, warm_stats
     from smarttrip.storage import (
+        apply_trained_weights,
         connect as connect_db,
         ensure_seed_global_weights,
         get_recommendation,
@@ -26,22 +48,45 @@ try:
         load_user_weights,
         log_event,
         log_recommendation,
-        upsert_global_weights,
-        upsert_user_weights,
+        weights_versions,
     )
+    from smarttrip.taxonomy import ACTIVITIES, canonical_family
 except ImportError:  # pragma: no cover
     # Script-style fallback: `python smarttrip/app.py`
     from ai_recommender import (  # type: ignore
         MODEL_VERSION,
+        TRAINING_ACTIONS,
         build_features_from_context,
+        compile_context,
         pairwise_update,
         rank_places,
         seed_weights,
     )
     from algorithm import demo_places  # type: ignore
     from chat_parser import parse_message  # type: ignore
-    from services.osm_service import geocode_city, get_places, get_places_city  # type: ignore
+    from place_batch import PlaceBatch  # type: ignore
+    from services.cache import TTLCache, WeightsCache  # type: ignore
+    from services.gazetteer import (  # type: ignore
+        DEFAULT_GAZETTEER_PATH,
+        configure_gazetteer,
+        get_gazetteer,
+    )
+    from services.osm_service import (  # type: ignore
+        cache_stats,
+        configure_caches,
+        configure_http_pool,
+        configure_local_store,
+        configure_overpass_endpoints,
+        configure_persistent_cache,
+        geocode_city,
+        get_places_city_multi,
+        get_places_multi,
+        upstream_stats,
+    )
+    from services.ratelimit import configure_rate_limits  # type: ignore
+    from services.warmup import start_warm_scheduler, warm_stats  # type: ignore
     from storage import (  # type: ignore
+        apply_trained_weights,
         connect as connect_db,
         ensure_seed_global_weights,
         get_recommendation,
@@ -49,56 +94,31 @@ except ImportError:  # pragma: no cover
         load_user_weights,
         log_event,
         log_recommendation,
-        upsert_global_weights,
-        upsert_user_weights,
+        weights_versions,
     )
+    from taxonomy import ACTIVITIES, canonical_family  # type: ignore
 
 
 DEFAULT_ORIGIN: Tuple[float, float] = (35.6892, 51.3890)
 _MAX_ABS_WEIGHT = 6.0
 _RECOMMENDATION_LIMIT = 10
-_ALLOWED_ACTIVITIES = {
-    "nature",
-    "cafe",
-    "restaurant",
-    "entertainment",
-    "fast_food",
-    "juice",
-    "ice_cream",
-    "park",
-    "attraction",
-    "nature_tourism",
-    "historical",
-    "cinema",
-    "amusement_park",
-    "theatre",
-    "museum",
-    "pool",
-    "hotel",
-    "eco_lodge",
-    "hostel",
-    "market",
-    "shopping_mall",
-}
-_PRIMARY_BY_ACTIVITY = {
-    "fast_food": "restaurant",
-    "juice": "cafe",
-    "ice_cream": "cafe",
-    "park": "nature",
-    "attraction": "nature",
-    "nature_tourism": "nature",
-    "historical": "nature",
-    "cinema": "entertainment",
-    "amusement_park": "entertainment",
-    "theatre": "entertainment",
-    "museum": "entertainment",
-    "pool": "entertainment",
-    "hotel": "entertainment",
-    "eco_lodge": "nature",
-    "hostel": "entertainment",
-    "market": "entertainment",
-    "shopping_mall": "entertainment",
-}
+_ALLOWED_ACTIVITIES = frozenset(ACTIVITIES)
+# Upstream fetches run in a bounded pool so a request waits at most one
+# deadline instead of the sum of the per-call timeouts. Each fetch is given
+# the time left minus a margin for parsing, so abandoned ones end by then too.
+_FETCH_MAX_WORKERS = 8
+_FETCH_MARGIN_S = 1.0
+_CITY_FETCH_DEADLINE_S = 20.0
+_RADIUS_FETCH_DEADLINE_S = 9.0
+# Part of the city deadline kept back for the radius fallback, so a city
+# query that times out still leaves time to search around the center.
+_CITY_FALLBACK_RESERVE_S = 6.0
+# Compiled scoring contexts of recent recommendations, so /feedback on them
+# doesn't resolve the logged context again for every click.
+_scoring_contexts = TTLCache(ttl_s=60 * 60.0, max_entries=2048)
+# Global and per-session weights for /recommend, reloaded only when the stored weights version moves.
+_weights_cache = WeightsCache(max_sessions=4096)
+_fetch_pool = ThreadPoolExecutor(max_workers=_FETCH_MAX_WORKERS, thread_name_prefix="smarttrip-fetch")
 
 
 def _safe_float(value: Any) -> Optional[float]:
@@ -127,6 +147,11 @@ def _normalize_lang(value: Any) -> str:
     return "en"
 
 
+def _load_global_weights(conn: Any) -> Dict[str, float]:
+    ensure_seed_global_weights(conn, seed_weights())
+    return load_global_weights(conn)
+
+
 def _clip_weights(weights: dict) -> dict:
     clipped = {}
     for k, v in (weights or {}).items():
@@ -155,8 +180,7 @@ def _normalize_activities(payload: Dict[str, Any]) -> List[str]:
 
 
 def _primary_activity(activity: str) -> str:
-    key = str(activity or "").strip().lower()
-    return _PRIMARY_BY_ACTIVITY.get(key, key if key in {"nature", "cafe", "restaurant", "entertainment"} else "nature")
+    return canonical_family(activity)
 
 
 def _primary_activities(activities: List[str]) -> List[str]:
@@ -224,11 +248,79 @@ def _dedupe_places(places: List[Dict[str, Any]], limit: int) -> List[Dict[str, A
     return unique
 
 
+def _fetch_activities(
+    fetch: Callable[..., Optional[Dict[str, PlaceBatch]]],
+    activities: List[str],
+    *,
+    deadline: float,
+) -> Optional[PlaceBatch]:
+    """Run one merged ``fetch`` for all activities by ``deadline`` (``time.monotonic()``).
+
+    ``fetch(activities, timeout_s=..., cached_only=...)`` is first asked for
+    cached data in the request thread; only a miss goes to the pool, with the
+    time left as its ``timeout_s``. Results are concatenated in the order of
+    ``activities``. Returns None if the fetch didn't finish by the deadline
+    (it still ends shortly after, and warms the cache); a fetch that fails
+    is logged and comes back empty.
+    """
+    try:
+        by_activity = fetch(activities, timeout_s=_FETCH_MARGIN_S, cached_only=True)
+    except Exception:
+        current_app.logger.exception("Cached place lookup failed")
+        by_activity = None
+    if by_activity is None:
+        remaining = deadline - time.monotonic()
+        if remaining <= _FETCH_MARGIN_S:
+            return None
+        future = _fetch_pool.submit(fetch, activities, timeout_s=remaining - _FETCH_MARGIN_S, cached_only=False)
+        try:
+            by_activity = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            return None
+        except Exception:
+            current_app.logger.exception("Place fetch failed")
+            return PlaceBatch()
+    return PlaceBatch.concat(by_activity[a] for a in activities if a in by_activity)
+
+
 def create_app() -> Flask:
     app = Flask(__name__, instance_relative_config=True)
     os.makedirs(app.instance_path, exist_ok=True)
     app.config.setdefault("SMARTTRIP_DB_PATH", os.path.join(app.instance_path, "smarttrip.sqlite"))
+    app.config.setdefault("SMARTTRIP_CACHE_DB_PATH", os.path.join(app.instance_path, "osm_cache.sqlite"))
+    # Written by `python -m smarttrip import-osm`; when present, places come from it instead of Overpass.
+    app.config.setdefault("SMARTTRIP_POI_DB_PATH", os.path.join(app.instance_path, "osm_pois.sqlite"))
+    # Per-cache overrides, e.g. {"tiles": {"ttl_s": 120, "max_stale_s": 3600, "max_entries": 2000}}.
+    app.config.setdefault("SMARTTRIP_OSM_CACHES", {})
+    # Offline city list tried before Nominatim (None disables it).
+    app.config.setdefault("SMARTTRIP_GAZETTEER_PATH", DEFAULT_GAZETTEER_PATH)
+    app.config.setdefault("SMARTTRIP_HTTP_POOL", {"max_per_host": 4, "idle_timeout_s": 30.0})
+    # Outbound rate limits per upstream host, e.g. {"overpass-api.de": {"rate_per_s": 0.5, "burst": 2}}.
+    # The token buckets live in the cache DB so all workers share them.
+    app.config.setdefault("SMARTTRIP_OUTBOUND_RATES", {})
+    # Cities kept warm in the background once the app serves requests (empty disables it);
+    # `python -m smarttrip warm` does the same once from the command line.
+    app.config.setdefault("SMARTTRIP_WARM_CITIES", [])
+    app.config.setdefault("SMARTTRIP_WARM_INTERVAL_S", 60 * 60.0)
     app.config["JSON_SORT_KEYS"] = False
+    configure_caches(app.config["SMARTTRIP_OSM_CACHES"])
+    configure_gazetteer(app.config["SMARTTRIP_GAZETTEER_PATH"])
+    configure_http_pool(**app.config["SMARTTRIP_HTTP_POOL"])
+    if app.config.get("SMARTTRIP_OVERPASS_URLS"):
+        configure_overpass_endpoints(list(app.config["SMARTTRIP_OVERPASS_URLS"]))
+    configure_persistent_cache(app.config["SMARTTRIP_CACHE_DB_PATH"])
+    configure_rate_limits(app.config["SMARTTRIP_OUTBOUND_RATES"], shared_path=app.config["SMARTTRIP_CACHE_DB_PATH"])
+    poi_db_path = str(app.config["SMARTTRIP_POI_DB_PATH"])
+    configure_local_store(poi_db_path if os.path.exists(poi_db_path) else None)
+
+    @app.before_request
+    def start_warming():
+        # Started lazily so CLI commands that build the app don't warm too.
+        start_warm_scheduler(
+            list(app.config["SMARTTRIP_WARM_CITIES"]),
+            sorted(_ALLOWED_ACTIVITIES),
+            interval_s=float(app.config["SMARTTRIP_WARM_INTERVAL_S"]),
+        )
 
     @app.get("/")
     def index():
@@ -238,6 +330,41 @@ def create_app() -> Flask:
     def health():
         return jsonify({"status": "ok"})
 
+    @app.get("/stats")
+    def stats():
+        return jsonify(
+            {
+                "status": "ok",
+                "caches": cache_stats(),
+                "upstreams": upstream_stats(),
+                "warm": warm_stats(),
+                "weights": _weights_cache.stats(),
+            }
+        )
+
+    @app.get("/cities/autocomplete")
+    def cities_autocomplete():
+        query = str(request.args.get("q") or "").strip()
+        limit = max(1, min(20, _safe_int(request.args.get("limit"), 8)))
+        gazetteer = get_gazetteer()
+        matches = gazetteer.complete(query, limit=limit) if gazetteer is not None and query else []
+        return jsonify(
+            {
+                "status": "success",
+                "query": query,
+                "cities": [
+                    {
+                        "name": c["name"],
+                        "name_fa": c["name_fa"],
+                        "country": c["country"],
+                        "lat": c["lat"],
+                        "lon": c["lon"],
+                    }
+                    for c in matches
+                ],
+            }
+        )
+
     @app.post("/recommend")
     def recommend():
         payload = request.get_json(silent=True) or {}
@@ -285,14 +412,23 @@ def create_app() -> Flask:
         radius_m = int(payload.get("radius_m", default_radius))
         radius_m = max(1000, min(15000, radius_m))
 
+        # Filled by the OSM service with how fresh the served data is.
+        freshness: Dict[str, Any] = {}
         if city and city_info:
-            places: List[Dict[str, Any]] = []
             per_activity_limit = max(30, int(200 / max(1, len(selected_activities))))
-            for activity in selected_activities:
-                places.extend(
-                    get_places_city(city, activity=activity, timeout_s=12.0, limit=per_activity_limit)
-                )
-            places = _dedupe_places(places, limit=250)
+            deadline = time.monotonic() + _CITY_FETCH_DEADLINE_S
+            fetched = _fetch_activities(
+                lambda activities, **options: get_places_city_multi(
+                    city,
+                    activities=activities,
+                    limit=per_activity_limit,
+                    freshness=freshness,
+                    **options,
+                ),
+                selected_activities,
+                deadline=deadline - _CITY_FALLBACK_RESERVE_S,
+            )
+            places = fetched.dedupe(250) if fetched is not None else PlaceBatch()
             search_mode_out = "city"
             if not places:
                 city_lat = _safe_float(city_info.get("lat")) if isinstance(city_info, dict) else None
@@ -301,38 +437,45 @@ def create_app() -> Flask:
                     # City-area queries can be slow/unavailable; fall back to a large-radius
                     # search around the city center before using demo data.
                     fallback_radius_m = 15000
-                    per_activity_limit = max(20, int(80 / max(1, len(selected_activities))))
-                    for activity in selected_activities:
-                        places.extend(
-                            get_places(
-                                city_lat,
-                                city_lon,
-                                radius=fallback_radius_m,
-                                activity=activity,
-                                timeout_s=8.0,
-                                limit=per_activity_limit,
-                            )
-                        )
-                    places = _dedupe_places(places, limit=120)
+                    fallback_limit = max(20, int(80 / max(1, len(selected_activities))))
+                    fetched = _fetch_activities(
+                        lambda activities, **options: get_places_multi(
+                            city_lat,
+                            city_lon,
+                            activities=activities,
+                            radius=fallback_radius_m,
+                            limit=fallback_limit,
+                            freshness=freshness,
+                            **options,
+                        ),
+                        selected_activities,
+                        deadline=min(deadline, time.monotonic() + _RADIUS_FETCH_DEADLINE_S),
+                    )
+                    places = fetched.dedupe(120) if fetched is not None else PlaceBatch()
         else:
-            places = []
             per_activity_limit = max(20, int(80 / max(1, len(selected_activities))))
-            for activity in selected_activities:
-                places.extend(
-                    get_places(
-                        origin[0],
-                        origin[1],
-                        radius=radius_m,
-                        activity=activity,
-                        timeout_s=8.0,
-                        limit=per_activity_limit,
-                    )
-                )
-            places = _dedupe_places(places, limit=120)
+            fetched = _fetch_activities(
+                lambda activities, **options: get_places_multi(
+                    origin[0],
+                    origin[1],
+                    activities=activities,
+                    radius=radius_m,
+                    limit=per_activity_limit,
+                    freshness=freshness,
+                    **options,
+                ),
+                selected_activities,
+                deadline=time.monotonic() + _RADIUS_FETCH_DEADLINE_S,
+            )
+            places = fetched.dedupe(120) if fetched is not None else PlaceBatch()
             search_mode_out = "radius"
             city = ""
 
         data_source = "osm" if places else "demo"
+        data_freshness = dict(freshness) if places and freshness else None
+        if fetched is None:
+            # Demo results below, but say why: OSM didn't answer in time, not "nothing here".
+            data_freshness = {"status": "timeout"}
         if not places:
             places = _expand_demo_places(
                 _filter_demo_places_by_primary(demo_places(origin[0], origin[1]), selected_primary),
@@ -342,12 +485,14 @@ def create_app() -> Flask:
         db_path = str(app.config["SMARTTRIP_DB_PATH"])
         conn = connect_db(db_path)
         try:
-            ensure_seed_global_weights(conn, seed_weights())
-            weights_global = load_global_weights(conn)
-            weights_user = load_user_weights(conn, session_id) if session_id else {}
-            weights = dict(weights_global)
-            for f, w in weights_user.items():
-                weights[f] = float(weights.get(f, 0.0)) + float(w)
+            version, session_version = weights_versions(conn, session_id)
+            weights = _weights_cache.weights(
+                version,
+                session_id,
+                session_version,
+                load_global=lambda: _load_global_weights(conn),
+                load_session=lambda sid: load_user_weights(conn, sid),
+            )
 
             context = {
                 "lang": lang,
@@ -364,7 +509,8 @@ def create_app() -> Flask:
                 "city": city or None,
             }
 
-            recommendations = rank_places(places, context=context, weights=weights, limit=_RECOMMENDATION_LIMIT)
+            scoring = compile_context(context)
+            recommendations = rank_places(places, context=scoring, weights=weights, limit=_RECOMMENDATION_LIMIT)
             if data_source == "osm" and len(recommendations) < _RECOMMENDATION_LIMIT:
                 # OSM may return too few candidates for a small radius.
                 # Keep all OSM picks, and top-up with demo candidates.
@@ -375,7 +521,7 @@ def create_app() -> Flask:
                 demo_candidates = _expand_demo_places(demo_candidates, _RECOMMENDATION_LIMIT * 2)
                 demo_ranked = rank_places(
                     demo_candidates,
-                    context=context,
+                    context=scoring,
                     weights=weights,
                     limit=_RECOMMENDATION_LIMIT,
                 )
@@ -416,6 +562,7 @@ def create_app() -> Flask:
                     p["lon"] = plon
 
             request_id = uuid.uuid4().hex
+            _scoring_contexts.set(request_id, scoring)
             log_recommendation(
                 conn,
                 request_id=request_id,
@@ -446,6 +593,7 @@ def create_app() -> Flask:
                 "city": city or None,
                 "activities": selected_activities,
                 "data_source": data_source,
+                "data_freshness": data_freshness,
                 "recommendations": recommendations,
             }
         )
@@ -481,7 +629,7 @@ def create_app() -> Flask:
                 payload={"client": "web"},
             )
 
-            if action not in {"click", "choose", "like"}:
+            if action not in TRAINING_ACTIONS:
                 return jsonify({"status": "success", "trained": False})
 
             context, items = get_recommendation(conn, request_id)
@@ -500,8 +648,12 @@ def create_app() -> Flask:
             if not others:
                 return jsonify({"status": "success", "trained": False})
 
-            clicked_features = build_features_from_context(clicked, context)
-            other_features = [build_features_from_context(p, context) for p in others]
+            scoring = _scoring_contexts.get(request_id)
+            if scoring is None:
+                scoring = compile_context(context)
+                _scoring_contexts.set(request_id, scoring)
+            clicked_features = build_features_from_context(clicked, scoring)
+            other_features = [build_features_from_context(p, scoring) for p in others]
 
             ensure_seed_global_weights(conn, seed_weights())
             weights_global = load_global_weights(conn)
@@ -516,8 +668,8 @@ def create_app() -> Flask:
                 lr=global_lr,
             )
             weights_global_new = _clip_weights(weights_global_new)
-            upsert_global_weights(conn, weights_global_new)
 
+            session_offsets: Dict[str, Dict[str, float]] = {}
             if session_id:
                 weights_user = load_user_weights(conn, session_id)
                 combined = dict(weights_global_new)
@@ -535,8 +687,10 @@ def create_app() -> Flask:
                     f: float(combined_new.get(f, 0.0)) - float(weights_global_new.get(f, 0.0))
                     for f in set(combined_new.keys()) | set(weights_global_new.keys())
                 }
-                user_offset_new = _clip_weights(user_offset_new)
-                upsert_user_weights(conn, session_id, user_offset_new)
+                session_offsets[session_id] = _clip_weights(user_offset_new)
+
+            # One write, so readers never see the new global weights next to old offsets.
+            apply_trained_weights(conn, weights_global_new, session_offsets)
 
             return jsonify({"status": "success", "trained": True})
         finally:
@@ -0,0 +1,243 @@
+"""Columnar storage for candidate places on the /recommend path.
+
+Instead of one dict per candidate (copied again by every stage), a
+``PlaceBatch`` keeps numeric fields in ``array`` columns and every
+string field as an index into one interned value table. Fields that every
+place of one activity shares (its type, city and the activity's defaults)
+are interned together as a ``PlaceKind``, with their taxonomy codes worked
+out once. Filtering, sorting and de-duplication select rows by index; dicts
+are built only for the places that end up in a response (``row`` /
+``to_dicts``).
+"""
+
+from __future__ import annotations
+
+from array import array
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from smarttrip.taxonomy import family_code, group_mask
+except ImportError:  # pragma: no cover
+    from taxonomy import family_code, group_mask  # type: ignore
+
+_NO_ID = -1
+
+
+class PlaceKind:
+    """Fields shared by a group of places, plus their taxonomy codes (``family``, ``best_for_mask``)."""
+
+    __slots__ = ("type", "city", "price_tier", "best_for", "ideal_people", "family", "best_for_mask")
+
+    def __init__(
+        self,
+        *,
+        type: str,
+        city: Optional[str],
+        price_tier: int,
+        best_for: Tuple[str, ...],
+        ideal_people: Tuple[int, int],
+    ) -> None:
+        self.type = type
+        self.city = city
+        self.price_tier = price_tier
+        self.best_for = best_for
+        self.ideal_people = ideal_people
+        self.family = family_code(type)
+        self.best_for_mask = group_mask(best_for)
+
+
+class _ValueTable:
+    """Interned values and place kinds shared by related batches."""
+
+    __slots__ = ("values", "ids", "kinds", "kind_ids")
+
+    def __init__(self) -> None:
+        self.values: List[Hashable] = []
+        self.ids: Dict[Any, int] = {}
+        self.kinds: List[PlaceKind] = []
+        self.kind_ids: Dict[Tuple[Any, ...], int] = {}
+
+    def intern(self, value: Hashable) -> int:
+        # Non-strings are keyed with their type, so 1 and 1.0 or True stay distinct values.
+        key = value if value.__class__ is str else (value.__class__, value)
+        idx = self.ids.get(key)
+        if idx is None:
+            idx = len(self.values)
+            self.values.append(value)
+            self.ids[key] = idx
+        return idx
+
+    def intern_kind(self, kind: PlaceKind) -> int:
+        key = (kind.type, kind.city, kind.price_tier, kind.best_for, kind.ideal_people)
+        idx = self.kind_ids.get(key)
+        if idx is None:
+            idx = len(self.kinds)
+            self.kinds.append(kind)
+            self.kind_ids[key] = idx
+        return idx
+
+
+class PlaceBatch:
+    """Candidate places as parallel columns.
+
+    Numeric columns: ``lat``, ``lon``, ``rating`` (float), ``popularity``
+    and ``osm_id``. ``kind`` indexes ``kinds``; ``name`` and ``osm_kind``
+    index ``values``. Batches derived from one another share both tables,
+    which only ever grow.
+    """
+
+    __slots__ = (
+        "_table",
+        "values",
+        "kinds",
+        "lat",
+        "lon",
+        "rating",
+        "popularity",
+        "osm_id",
+        "kind",
+        "name",
+        "osm_kind",
+    )
+
+    def __init__(self, table: Optional[_ValueTable] = None) -> None:
+        self._table = table if table is not None else _ValueTable()
+        self.values = self._table.values
+        self.kinds = self._table.kinds
+        self.lat = array("d")
+        self.lon = array("d")
+        self.rating = array("d")
+        self.popularity = array("i")
+        self.osm_id = array("q")
+        self.kind = array("i")
+        self.name = array("i")
+        self.osm_kind = array("i")
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def empty_like(self) -> "PlaceBatch":
+        """A new, empty batch sharing this batch's tables."""
+        return PlaceBatch(self._table)
+
+    def add_kind(
+        self,
+        *,
+        type: str,
+        city: Optional[str] = None,
+        price_tier: int,
+        best_for: Sequence[str],
+        ideal_people: Tuple[int, int],
+    ) -> int:
+        """Code of the kind with these fields, for ``append``."""
+        kind = PlaceKind(
+            type=type, city=city, price_tier=price_tier, best_for=tuple(best_for), ideal_people=tuple(ideal_people)
+        )
+        return self._table.intern_kind(kind)
+
+    def append(
+        self,
+        kind: int,
+        name: str,
+        lat: float,
+        lon: float,
+        osm_kind: Any,
+        osm_id: Optional[int],
+        popularity: int,
+        rating: float,
+    ) -> None:
+        intern = self._table.intern
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.rating.append(rating)
+        self.popularity.append(popularity)
+        self.osm_id.append(_NO_ID if osm_id is None else osm_id)
+        self.kind.append(kind)
+        self.name.append(intern(name))
+        self.osm_kind.append(intern(osm_kind))
+
+    def _numeric_columns(self) -> Tuple[array, ...]:
+        return (self.lat, self.lon, self.rating, self.popularity, self.osm_id)
+
+    def _columns(self) -> Tuple[array, ...]:
+        return self._numeric_columns() + (self.kind, self.name, self.osm_kind)
+
+    def take(self, indexes: Iterable[int]) -> "PlaceBatch":
+        """Rows at ``indexes`` (in that order) as a new batch sharing this batch's tables."""
+        indexes = list(indexes)
+        out = self.empty_like()
+        for src, dst in zip(self._columns(), out._columns()):
+            dst.extend([src[i] for i in indexes])
+        return out
+
+    def extend(self, other: "PlaceBatch") -> None:
+        """Append every row of ``other``."""
+        if other._table is self._table:
+            for src, dst in zip(other._columns(), self._columns()):
+                dst.extend(src)
+            return
+        table = self._table
+        for src, dst in zip(other._numeric_columns(), self._numeric_columns()):
+            dst.extend(src)
+        kinds = [table.intern_kind(kind) for kind in other.kinds]
+        values = [table.intern(value) for value in other.values]
+        self.kind.extend([kinds[i] for i in other.kind])
+        self.name.extend([values[i] for i in other.name])
+        self.osm_kind.extend([values[i] for i in other.osm_kind])
+
+    @classmethod
+    def concat(cls, batches: Iterable["PlaceBatch"]) -> "PlaceBatch":
+        batches = list(batches)
+        out = batches[0].empty_like() if batches else cls()
+        for batch in batches:
+            out.extend(batch)
+        return out
+
+    def popularity_order(self, rows: Optional[Iterable[int]] = None) -> List[int]:
+        """``rows`` (default: all) most popular first, then by rating; ties keep their order."""
+        popularity = self.popularity
+        rating = self.rating
+        return sorted(
+            range(len(self)) if rows is None else rows,
+            key=lambda i: (popularity[i], rating[i]),
+            reverse=True,
+        )
+
+    def dedupe(self, limit: int) -> "PlaceBatch":
+        """First ``limit`` rows with a distinct (name, lat, lon), like ``app._dedupe_places``."""
+        seen = set()
+        keep: List[int] = []
+        values = self.values
+        for i in range(len(self)):
+            sig = (str(values[self.name[i]] or "").strip().lower(), round(self.lat[i], 6), round(self.lon[i], 6))
+            if sig in seen:
+                continue
+            seen.add(sig)
+            keep.append(i)
+            if len(keep) >= limit:
+                break
+        return self.take(keep)
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """Row ``i`` as a place dict (the shape ``osm_service`` has always returned)."""
+        kind = self.kinds[self.kind[i]]
+        place: Dict[str, Any] = {
+            "name": self.values[self.name[i]],
+            "lat": self.lat[i],
+            "lon": self.lon[i],
+            "type": kind.type,
+        }
+        if kind.city is not None:
+            place["city"] = kind.city
+        osm_id = self.osm_id[i]
+        place["osm_id"] = None if osm_id == _NO_ID else osm_id
+        place["osm_kind"] = self.values[self.osm_kind[i]]
+        place["popularity_score"] = self.popularity[i]
+        place["price_tier"] = kind.price_tier
+        place["rating"] = self.rating[i]
+        place["best_for"] = list(kind.best_for)
+        place["ideal_people"] = kind.ideal_people
+        return place
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [self.row(i) for i in range(len(self))]
@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import heapq
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+def approx_size(value: Any, _depth: int = 0) -> int:
+    """Rough deep size in bytes of JSON-like values (dicts, lists, tuples, scalars)."""
+    size = sys.getsizeof(value)
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += approx_size(k, _depth + 1) + approx_size(v, _depth + 1)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += approx_size(item, _depth + 1)
+    return size
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a per-entry TTL and entry/byte caps.
+
+    Entries are fresh for ``ttl_s`` seconds after they were fetched. For a
+    further ``max_stale_s`` they can still be read as stale (to be served
+    while a refresh runs); past that hard limit they are gone. Dead entries
+    are dropped on read and swept proactively on every write; when either cap
+    is exceeded the least recently used entries are evicted.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_s: float,
+        max_stale_s: float = 0.0,
+        max_entries: int = 1024,
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        self._lock = threading.Lock()
+        # key -> (stored_ts, size, value), in LRU order (most recent last).
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        # (dead_ts, seq, key) min-heap for the proactive sweep; superseded
+        # items are skipped lazily.
+        self._expiry: List[Tuple[float, int, Hashable]] = []
+        self._seq = 0
+        self._bytes = 0
+        self.ttl_s = float(ttl_s)
+        self.max_stale_s = float(max_stale_s)
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes) if max_bytes else None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def configure(
+        self,
+        *,
+        ttl_s: Optional[float] = None,
+        max_stale_s: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        with self._lock:
+            if ttl_s is not None:
+                self.ttl_s = float(ttl_s)
+            if max_stale_s is not None:
+                self.max_stale_s = float(max_stale_s)
+            if max_entries is not None:
+                self.max_entries = int(max_entries)
+            if max_bytes is not None:
+                self.max_bytes = int(max_bytes) or None
+            self._evict_locked()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the value if it is still fresh, else None."""
+        entry = self.get_entry(key)
+        return entry[1] if entry is not None else None
+
+    def get_entry(self, key: Hashable, *, allow_stale: bool = False) -> Optional[Tuple[float, Any, bool]]:
+        """Return ``(stored_ts, value, is_stale)``, or None when missing/dead."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            age = now - entry[0]
+            if age > self.ttl_s + self.max_stale_s:
+                self._remove_locked(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            is_stale = age > self.ttl_s
+            if is_stale and not allow_stale:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if is_stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return entry[0], entry[2], is_stale
+
+    def set(self, key: Hashable, value: Any, *, stored_ts: Optional[float] = None) -> None:
+        """Store ``value``; ``stored_ts`` keeps the original fetch time of a re-loaded entry."""
+        now = time.time()
+        stored_ts = now if stored_ts is None else float(stored_ts)
+        size = approx_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (stored_ts, size, value)
+            self._seq += 1
+            heapq.heappush(self._expiry, (stored_ts + self.ttl_s + self.max_stale_s, self._seq, key))
+            self._bytes += size
+            self._sweep_locked(now)
+            self._evict_locked()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._expiry.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                "max_stale_s": self.max_stale_s,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _remove_locked(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _sweep_locked(self, now: float) -> None:
+        horizon = self.ttl_s + self.max_stale_s
+        while self._expiry and self._expiry[0][0] <= now:
+            _, _, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            # The key may have been rewritten since this heap item was pushed.
+            if entry is not None and now - entry[0] > horizon:
+                self._remove_locked(key)
+                self.expirations += 1
+        if len(self._expiry) > 4 * max(1, len(self._entries)):
+            self._expiry = [item for item in self._expiry if item[2] in self._entries]
+            heapq.heapify(self._expiry)
+
+    def _evict_locked(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key = next(iter(self._entries))
+            self._remove_locked(key)
+            self.evictions += 1
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into a single execution.
+
+    The first caller for a key runs ``fn``; callers arriving while it is in
+    flight block until it finishes and receive the same result (or exception).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"in_flight": len(self._calls), "executed": self.executed, "coalesced": self.coalesced}
+
+
+class WeightsCache:
+    """Ranking weights for the current weights versions, without a database read per request.
+
+    Holds the global vector under the stored global version and an LRU of
+    per-session offsets, each under its session's own version, along with
+    the combined weights (global plus offsets). Callers pass the versions
+    currently stored, which is one cheap read; while they are unchanged
+    everything is served from memory. A new global version reloads only the
+    global vector (cached offsets are recombined with it), and a new session
+    version reloads only that session. Returned dicts are shared and must not
+    be modified.
+    """
+
+    def __init__(self, *, max_sessions: int = 4096) -> None:
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._global: Dict[str, float] = {}
+        # session_id -> (session version, offsets, global version combined with, combined weights)
+        self._sessions: "OrderedDict[str, Tuple[int, Dict[str, float], int, Dict[str, float]]]" = OrderedDict()
+        self.max_sessions = int(max_sessions)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def weights(
+        self,
+        version: int,
+        session_id: Optional[str],
+        session_version: int = 0,
+        *,
+        load_global: Callable[[], Dict[str, float]],
+        load_session: Callable[[str], Dict[str, float]],
+    ) -> Dict[str, float]:
+        """Weights to rank with for ``session_id`` (the global ones when it is empty).
+
+        ``version`` is the global version and ``session_version`` that of the
+        session's offsets.
+        """
+        with self._lock:
+            global_weights = self._global if version == self._version else None
+            offsets = None
+            if not session_id:
+                if global_weights is not None:
+                    self.hits += 1
+                    return global_weights
+            else:
+                entry = self._sessions.get(session_id)
+                if entry is not None and entry[0] == session_version:
+                    offsets = entry[1]
+                    if global_weights is not None and entry[2] == version:
+                        self._sessions.move_to_end(session_id)
+                        self.hits += 1
+                        return entry[3]
+        # Only a database read counts as a miss; combining cached offsets with new globals doesn't.
+        loaded = global_weights is None or (bool(session_id) and offsets is None)
+
+        # Load outside the lock; a concurrent loader for the same version stores the same values.
+        if global_weights is None:
+            global_weights = dict(load_global())
+        if not session_id:
+            weights = global_weights
+        else:
+            if offsets is None:
+                offsets = dict(load_session(session_id))
+            weights = dict(global_weights)
+            for f, w in offsets.items():
+                weights[f] = float(weights.get(f, 0.0)) + float(w)
+
+        with self._lock:
+            if loaded:
+                self.misses += 1
+            else:
+                self.hits += 1
+            # Versions only grow; a slow loader holding an older one must not replace newer weights.
+            if self._version is None or version > self._version:
+                if self._version is not None:
+                    self.invalidations += 1
+                self._version = version
+                self._global = global_weights
+            if session_id and version == self._version:
+                held = self._sessions.get(session_id)
+                if held is None or session_version >= held[0]:
+                    self._sessions[session_id] = (session_version, offsets, version, weights)
+                    self._sessions.move_to_end(session_id)
+                    while len(self._sessions) > self.max_sessions:
+                        self._sessions.popitem(last=False)
+                        self.evictions += 1
+        return weights
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version = None
+            self._global = {}
+            self._sessions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "version": self._version,
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+            }
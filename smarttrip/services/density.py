@@ -0,0 +1,45 @@
+"""Running estimates of how many OSM results an area yields.
+
+Radius searches use them to size the search to the area: a small radius is
+plenty downtown, while a sparse suburb needs a wider one before the app has
+to fall back to demo data.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class DensityTracker:
+    """Exponentially weighted moving average of result counts per key.
+
+    Keys are things like ``(z, x, y, activity)`` or ``(city, family)``; the
+    estimate is how many elements a fetch for that key returned recently.
+    The least recently observed keys are dropped beyond ``max_keys``.
+    """
+
+    def __init__(self, *, alpha: float = 0.3, max_keys: int = 50000) -> None:
+        self.alpha = float(alpha)
+        self.max_keys = int(max_keys)
+        self._lock = threading.Lock()
+        self._values: "OrderedDict[Hashable, float]" = OrderedDict()
+        self.observations = 0
+
+    def observe(self, key: Hashable, count: float) -> None:
+        with self._lock:
+            previous = self._values.pop(key, None)
+            count = max(0.0, float(count))
+            self._values[key] = count if previous is None else previous + self.alpha * (count - previous)
+            self.observations += 1
+            while len(self._values) > self.max_keys:
+                self._values.popitem(last=False)
+
+    def estimate(self, key: Hashable) -> Optional[float]:
+        with self._lock:
+            return self._values.get(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"keys": len(self._values), "observations": self.observations, "alpha": self.alpha}
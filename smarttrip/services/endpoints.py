@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+
+class EndpointHealth:
+    """Rolling latency/error window and circuit breaker for one upstream endpoint.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and the
+    endpoint is skipped for ``cooldown_s``. It is then half-open: exactly one
+    probe request is let through, and its outcome closes or re-opens the
+    breaker. A probe that is never sent is handed back with
+    ``release_probe``; one whose outcome never gets recorded is given up on
+    after another ``cooldown_s``, and the next request probes instead.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        window: int = 50,
+        failure_threshold: int = 5,
+        cooldown_s: float = 30.0,
+    ) -> None:
+        self.url = url
+        self.failure_threshold = int(failure_threshold)
+        self.cooldown_s = float(cooldown_s)
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=int(window))
+        self._outcomes: Deque[bool] = deque(maxlen=int(window))
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._probe_until = 0.0
+
+    def allow_request(self) -> bool:
+        """Whether to send a request now; in the half-open state this claims the one probe."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._open_until:
+                return False
+            if self._consecutive_failures < self.failure_threshold:
+                return True
+            if now < self._probe_until:
+                return False
+            self._probe_until = now + self.cooldown_s
+            return True
+
+    def release_probe(self) -> None:
+        """Hand back a probe claimed by ``allow_request`` whose request was never sent."""
+        with self._lock:
+            self._probe_until = 0.0
+
+    def record_success(self, latency_s: float) -> None:
+        with self._lock:
+            self._latencies.append(float(latency_s))
+            self._outcomes.append(True)
+            self._consecutive_failures = 0
+            self._open_until = 0.0
+            self._probe_until = 0.0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._outcomes.append(False)
+            self._consecutive_failures += 1
+            self._probe_until = 0.0
+            if self._consecutive_failures >= self.failure_threshold:
+                self._open_until = time.monotonic() + self.cooldown_s
+
+    def record_latency(self, latency_s: float) -> None:
+        """Record a lower bound on a latency whose outcome is unknown, e.g. a hedged request that lost."""
+        with self._lock:
+            self._latencies.append(float(latency_s))
+
+    def latency_quantile(self, q: float, default: float) -> float:
+        """Return the ``q`` quantile of recent latencies (``default`` with few samples).
+
+        Samples are successful requests plus the time hedged losers had run
+        when they were abandoned, which only ever understates a latency.
+        """
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 5:
+            return float(default)
+        idx = min(len(samples) - 1, int(q * len(samples)))
+        return samples[idx]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            outcomes = list(self._outcomes)
+            state = "open" if self._open_until > time.monotonic() else "closed"
+            if state == "closed" and self._consecutive_failures >= self.failure_threshold:
+                state = "half_open"
+        return {
+            "url": self.url,
+            "state": state,
+            "error_rate": round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0,
+            "p50_s": round(self.latency_quantile(0.5, 0.0), 3),
+            "p90_s": round(self.latency_quantile(0.9, 0.0), 3),
+            "samples": len(outcomes),
+        }
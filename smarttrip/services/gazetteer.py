@@ -0,0 +1,159 @@
+"""Offline city gazetteer used before falling back to Nominatim.
+
+Cities are loaded from a CSV (a small bundled list of Iranian cities by
+default, or any file with the same columns) and indexed by every name and
+alias, in Latin and Persian script, in one sorted array. Exact lookups and
+prefix completion are binary searches over that array.
+
+Columns: ``name, name_fa, aliases (| separated), country, lat, lon, south,
+west, north, east, population, osm_type, osm_id``. ``osm_type``/``osm_id``
+may be empty; without them city searches use the bbox instead of an
+Overpass area.
+"""
+
+from __future__ import annotations
+
+import bisect
+import csv
+import os
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_GAZETTEER_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cities.csv"
+)
+
+# Arabic code points that Persian keyboards and texts use interchangeably.
+_PERSIAN_FOLD = str.maketrans({"ي": "ی", "ى": "ی", "ك": "ک", "ة": "ه"})
+_SEPARATORS_RE = re.compile(r"[\s\u200c\-_.']+")
+
+
+def normalize_name(text: str) -> str:
+    """Fold case, diacritics and Arabic/Persian letter variants; drop ZWNJ and separators.
+
+    Spaces are dropped too, so "Khorram Abad", "خرم‌آباد" and "خرماباد" all
+    index the same way.
+    """
+    text = unicodedata.normalize("NFKD", str(text or "").translate(_PERSIAN_FOLD))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _SEPARATORS_RE.sub("", text.casefold())
+
+
+def _float_or_none(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _area_id(osm_type: str, osm_id: Optional[int]) -> Optional[int]:
+    # Same offsets Overpass uses for area ids (see geocode_city).
+    if osm_id is None:
+        return None
+    if osm_type == "relation":
+        return 3600000000 + osm_id
+    if osm_type == "way":
+        return 2400000000 + osm_id
+    return None
+
+
+class Gazetteer:
+    """Sorted-array name index over a list of cities."""
+
+    def __init__(self, cities: List[Dict[str, Any]]) -> None:
+        self.cities = cities
+        pairs: List[Tuple[str, int]] = []
+        for idx, city in enumerate(cities):
+            for name in {normalize_name(n) for n in city["names"]}:
+                if name:
+                    pairs.append((name, idx))
+        pairs.sort()
+        self._keys = [name for name, _ in pairs]
+        self._ids = [idx for _, idx in pairs]
+
+    @classmethod
+    def from_csv(cls, path: str) -> "Gazetteer":
+        cities: List[Dict[str, Any]] = []
+        with open(path, "r", encoding="utf-8", newline="") as fp:
+            for row in csv.DictReader(fp):
+                lat = _float_or_none(row.get("lat"))
+                lon = _float_or_none(row.get("lon"))
+                name = (row.get("name") or "").strip()
+                if lat is None or lon is None or not name:
+                    continue
+                bbox_parts = [_float_or_none(row.get(k)) for k in ("south", "west", "north", "east")]
+                osm_type = (row.get("osm_type") or "").strip()
+                osm_id_raw = _float_or_none(row.get("osm_id"))
+                osm_id = int(osm_id_raw) if osm_id_raw is not None else None
+                name_fa = (row.get("name_fa") or "").strip()
+                aliases = [a.strip() for a in (row.get("aliases") or "").split("|") if a.strip()]
+                cities.append(
+                    {
+                        "name": name,
+                        "name_fa": name_fa or None,
+                        "names": [name, *([name_fa] if name_fa else []), *aliases],
+                        "country": (row.get("country") or "").strip() or None,
+                        "lat": lat,
+                        "lon": lon,
+                        "bbox": tuple(bbox_parts) if None not in bbox_parts else None,
+                        "population": int(_float_or_none(row.get("population")) or 0),
+                        "osm_type": osm_type or None,
+                        "osm_id": osm_id,
+                        "area_id": _area_id(osm_type, osm_id),
+                    }
+                )
+        return cls(cities)
+
+    def lookup(self, name: str) -> Optional[Dict[str, Any]]:
+        """Return the city whose name or alias equals ``name`` (normalized), if any."""
+        key = normalize_name(name)
+        i = bisect.bisect_left(self._keys, key)
+        if key and i < len(self._keys) and self._keys[i] == key:
+            return self.cities[self._ids[i]]
+        return None
+
+    def complete(self, prefix: str, *, limit: int = 10) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` cities with a name starting with ``prefix``, most populous first."""
+        key = normalize_name(prefix)
+        if not key:
+            return []
+        matched: Dict[int, None] = {}
+        i = bisect.bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i].startswith(key):
+            matched[self._ids[i]] = None
+            i += 1
+        cities = [self.cities[idx] for idx in matched]
+        cities.sort(key=lambda c: c["population"], reverse=True)
+        return cities[: max(0, int(limit))]
+
+    def __len__(self) -> int:
+        return len(self.cities)
+
+
+_lock = threading.Lock()
+_path: Optional[str] = DEFAULT_GAZETTEER_PATH
+_gazetteer: Optional[Gazetteer] = None
+
+
+def configure_gazetteer(path: Optional[str]) -> None:
+    """Use the CSV at ``path`` (None disables the gazetteer); loaded on first use."""
+    global _path, _gazetteer
+    with _lock:
+        _path = str(path) if path else None
+        _gazetteer = None
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    global _gazetteer
+    loaded = _gazetteer
+    if loaded is not None:
+        return loaded
+    with _lock:
+        if _gazetteer is None and _path:
+            try:
+                _gazetteer = Gazetteer.from_csv(_path)
+            except (OSError, csv.Error, UnicodeDecodeError):
+                _gazetteer = Gazetteer([])
+        return _gazetteer
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import http.client
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, code: int, url: str) -> None:
+        super().__init__(f"HTTP {code} from {url}")
+        self.code = code
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+# Errors that mean a pooled keep-alive socket was closed by the server while idle.
+_STALE_SOCKET_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+_READ_CHUNK_SIZE = 64 * 1024
+_MAX_REDIRECTS = 5
+_REDIRECT_CODES = frozenset({301, 302, 303, 307, 308})
+
+_HostKey = Tuple[str, str, int]
+
+
+class ConnectionPool:
+    """Small per-host pool of persistent ``http.client`` connections.
+
+    At most ``max_per_host`` connections per host are open at once, idle or
+    in use; further requests wait for one to be released. Requests advertise
+    gzip and decompress the body while streaming it. A request on a reused
+    socket that the server already closed is retried once on a fresh
+    connection. Redirects are followed the way ``urllib`` follows them, but
+    never from https to http.
+    """
+
+    def __init__(self, *, max_per_host: int = 4, idle_timeout_s: float = 30.0) -> None:
+        self.max_per_host = max(1, int(max_per_host))
+        self.idle_timeout_s = float(idle_timeout_s)
+        self._lock = threading.Condition()
+        self._idle: Dict[_HostKey, List[Tuple[http.client.HTTPConnection, float]]] = {}
+        self._open: Dict[_HostKey, int] = {}
+        self.opened = 0
+        self.reused = 0
+        self.waited = 0
+
+    def configure(self, *, max_per_host: Optional[int] = None, idle_timeout_s: Optional[float] = None) -> None:
+        with self._lock:
+            if max_per_host is not None:
+                self.max_per_host = max(1, int(max_per_host))
+            if idle_timeout_s is not None:
+                self.idle_timeout_s = float(idle_timeout_s)
+            self._lock.notify_all()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        body: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout_s: float,
+        cancel: Optional[threading.Event] = None,
+    ) -> bytes:
+        """Send a request and return the decoded body.
+
+        Raises ``HTTPStatusError`` on 4xx/5xx and on redirects it doesn't
+        follow, and ``TimeoutError`` when no connection to the host frees up
+        within ``timeout_s``.
+        """
+        deadline = time.monotonic() + float(timeout_s)
+        send_headers = {"Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        send_headers.update(headers or {})
+        for redirects in range(_MAX_REDIRECTS + 1):
+            remaining = max(0.1, deadline - time.monotonic())
+            status, location, data = self._round_trip(method, url, body, send_headers, remaining, cancel)
+            if status not in _REDIRECT_CODES or not location or redirects == _MAX_REDIRECTS:
+                break
+            target = urljoin(url, location)
+            scheme, target_scheme = urlsplit(url).scheme, urlsplit(target).scheme
+            if target_scheme not in ("http", "https") or (scheme == "https" and target_scheme == "http"):
+                break
+            if method == "POST" and status in (301, 302, 303):
+                # As urllib does: re-issue as a GET without the body.
+                method, body = "GET", None
+                send_headers = {k: v for k, v in send_headers.items() if k.lower() != "content-type"}
+            elif method not in ("GET", "HEAD"):
+                break
+            url = target
+        if status >= 300:
+            raise HTTPStatusError(status, url)
+        return data
+
+    def _round_trip(
+        self,
+        method: str,
+        url: str,
+        body: Optional[bytes],
+        headers: Dict[str, str],
+        timeout_s: float,
+        cancel: Optional[threading.Event],
+    ) -> Tuple[int, Optional[str], bytes]:
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key: _HostKey = (scheme, parts.hostname or "", port)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+
+        conn, reused = self._acquire(key, timeout_s, cancel)
+        try:
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+            except _STALE_SOCKET_ERRORS:
+                if not reused:
+                    raise
+                # Replace the dead socket; the new one takes over its slot.
+                conn.close()
+                conn, reused = self._connect(key, timeout_s), False
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+
+            data = self._read_body(resp, cancel)
+        except BaseException:
+            self._discard(key, conn)
+            raise
+
+        if resp.will_close:
+            self._discard(key, conn)
+        else:
+            self._release(key, conn)
+        return resp.status, resp.getheader("Location"), data
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            idle = sum(len(conns) for conns in self._idle.values())
+            in_use = sum(self._open.values()) - idle
+            return {"idle": idle, "in_use": in_use, "opened": self.opened, "reused": self.reused, "waited": self.waited}
+
+    def close(self) -> None:
+        with self._lock:
+            idle = [(key, conn) for key, conns in self._idle.items() for conn, _ in conns]
+            self._idle.clear()
+            for key, _ in idle:
+                self._open[key] -= 1
+            self._lock.notify_all()
+        for _, conn in idle:
+            conn.close()
+
+    def _read_body(self, resp: http.client.HTTPResponse, cancel: Optional[threading.Event]) -> bytes:
+        encoding = (resp.getheader("Content-Encoding") or "").strip().lower()
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip" else None
+        chunks: List[bytes] = []
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise RequestCancelled()
+            chunk = resp.read(_READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(decoder.decompress(chunk) if decoder is not None else chunk)
+        if decoder is not None:
+            chunks.append(decoder.flush())
+        return b"".join(chunks)
+
+    def _acquire(
+        self, key: _HostKey, timeout_s: float, cancel: Optional[threading.Event]
+    ) -> Tuple[http.client.HTTPConnection, bool]:
+        deadline = time.monotonic() + timeout_s
+        stale: List[http.client.HTTPConnection] = []
+        conn: Optional[http.client.HTTPConnection] = None
+        waited = False
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                idle = self._idle.get(key) or []
+                while idle:
+                    candidate, last_used = idle.pop()
+                    if now - last_used <= self.idle_timeout_s:
+                        conn = candidate
+                        self.reused += 1
+                        break
+                    stale.append(candidate)
+                    self._open[key] -= 1
+                if conn is not None or self._open.get(key, 0) < self.max_per_host:
+                    break
+                if now >= deadline or (cancel is not None and cancel.is_set()):
+                    raise TimeoutError(f"no free connection to {key[1]}")
+                if not waited:
+                    waited = True
+                    self.waited += 1
+                # Wake up periodically to notice cancellation.
+                self._lock.wait(min(deadline - now, 0.1) if cancel is not None else deadline - now)
+            if conn is None:
+                self._open[key] = self._open.get(key, 0) + 1
+        for old in stale:
+            old.close()
+        if conn is None:
+            return self._connect(key, timeout_s), False
+        conn.timeout = timeout_s
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout_s)
+        return conn, True
+
+    def _connect(self, key: _HostKey, timeout_s: float) -> http.client.HTTPConnection:
+        # The caller holds a slot for the connection.
+        scheme, host, port = key
+        with self._lock:
+            self.opened += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout_s)
+        return http.client.HTTPConnection(host, port, timeout=timeout_s)
+
+    def _release(self, key: _HostKey, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if self._open[key] <= self.max_per_host:
+                idle.append((conn, time.monotonic()))
+                self._lock.notify_all()
+                return
+        self._discard(key, conn)
+
+    def _discard(self, key: _HostKey, conn: http.client.HTTPConnection) -> None:
+        conn.close()
+        with self._lock:
+            self._open[key] -= 1
+            self._lock.notify_all()
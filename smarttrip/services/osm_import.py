@@ -0,0 +1,257 @@
+"""Offline importer that turns an OSM extract into the local POI store.
+
+Both ``.osm`` XML files and Overpass JSON dumps are streamed element by
+element, so memory stays flat regardless of the file size. Elements are
+classified with the same activity filters and popularity rules as the live
+Overpass path, so the store can stand in for the network entirely.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import tempfile
+import xml.etree.ElementTree as ET
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from smarttrip.services.osm_service import (
+        _ALL_ACTIVITIES,
+        _element_center,
+        _matching_activities,
+        _place_fields,
+    )
+    from smarttrip.storage import connect_poi_store, insert_pois
+except ImportError:  # pragma: no cover
+    from services.osm_service import (  # type: ignore
+        _ALL_ACTIVITIES,
+        _element_center,
+        _matching_activities,
+        _place_fields,
+    )
+    from storage import connect_poi_store, insert_pois  # type: ignore
+
+
+_JSON_CHUNK_SIZE = 1 << 16
+# No single element comes close; a buffer this large without one is a corrupt dump.
+_JSON_MAX_ELEMENT_SIZE = 1 << 25
+_BATCH_SIZE = 2000
+# SQLite's default limit on bound parameters per statement.
+_SQL_VARS_PER_QUERY = 900
+
+
+def iter_overpass_json(fp: IO[str]) -> Iterator[Dict[str, Any]]:
+    """Yield the objects of the top-level ``elements`` array one at a time.
+
+    Raises ``ValueError`` when the stream has no ``elements`` array, ends
+    before the array is closed, or holds something that never decodes.
+    """
+    decoder = json.JSONDecoder()
+    marker = '"elements"'
+
+    buf = fp.read(_JSON_CHUNK_SIZE)
+    while True:
+        idx = buf.find(marker)
+        bracket = buf.find("[", idx) if idx >= 0 else -1
+        if bracket >= 0:
+            buf = buf[bracket + 1 :]
+            break
+        chunk = fp.read(_JSON_CHUNK_SIZE)
+        if not chunk:
+            raise ValueError("no \"elements\" array in the Overpass JSON")
+        buf = (buf[idx:] if idx >= 0 else buf[-len(marker) :]) + chunk
+
+    pos = 0
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            # The element continues in the next chunk.
+            if len(buf) - pos > _JSON_MAX_ELEMENT_SIZE:
+                raise ValueError(f"invalid Overpass JSON element: {e.msg}") from e
+            chunk = fp.read(_JSON_CHUNK_SIZE)
+            if not chunk:
+                raise ValueError("Overpass JSON ends inside the elements array") from e
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        if isinstance(obj, dict):
+            yield obj
+        pos = end
+        if pos > _JSON_CHUNK_SIZE:
+            buf = buf[pos:]
+            pos = 0
+
+
+def _way_center(nodes: sqlite3.Connection, refs: List[int]) -> Optional[Tuple[float, float]]:
+    # Bounding-box center, matching what Overpass returns for ``out center``.
+    south = west = float("inf")
+    north = east = float("-inf")
+    for i in range(0, len(refs), _SQL_VARS_PER_QUERY):
+        chunk = refs[i : i + _SQL_VARS_PER_QUERY]
+        placeholders = ",".join("?" * len(chunk))
+        row = nodes.execute(
+            f"SELECT min(lat), min(lon), max(lat), max(lon) FROM nodes WHERE id IN ({placeholders})",
+            chunk,
+        ).fetchone()
+        if row is None or row[0] is None:
+            continue
+        south, west = min(south, row[0]), min(west, row[1])
+        north, east = max(north, row[2]), max(east, row[3])
+    if south == float("inf"):
+        return None
+    return ((south + north) / 2.0, (west + east) / 2.0)
+
+
+def iter_osm_xml(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield tagged OSM XML elements in Overpass JSON shape.
+
+    Node coordinates are spooled to a temporary SQLite file so ways without a
+    ``<center>`` can be resolved without holding the extract in memory.
+    Relations are only kept when the file carries a ``<center>`` for them.
+    """
+    fd, nodes_path = tempfile.mkstemp(suffix=".sqlite", prefix="smarttrip-nodes-")
+    os.close(fd)
+    nodes = sqlite3.connect(nodes_path)
+    try:
+        nodes.execute("PRAGMA journal_mode = OFF;")
+        nodes.execute("PRAGMA synchronous = OFF;")
+        nodes.execute("CREATE TABLE nodes (id INTEGER PRIMARY KEY, lat REAL NOT NULL, lon REAL NOT NULL)")
+        pending: List[Tuple[int, float, float]] = []
+
+        def flush_nodes() -> None:
+            if pending:
+                nodes.executemany("INSERT OR REPLACE INTO nodes(id, lat, lon) VALUES(?, ?, ?)", pending)
+                pending.clear()
+
+        root: Optional[ET.Element] = None
+        for event, elem in ET.iterparse(path, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag not in {"node", "way", "relation"}:
+                continue
+
+            tags = {t.get("k"): t.get("v") for t in elem.iter("tag") if t.get("k") is not None}
+            try:
+                osm_id = int(elem.get("id") or "")
+            except ValueError:
+                osm_id = None
+
+            element: Optional[Dict[str, Any]] = None
+            if elem.tag == "node":
+                try:
+                    coords: Optional[Tuple[float, float]] = (
+                        float(elem.get("lat") or ""),
+                        float(elem.get("lon") or ""),
+                    )
+                except ValueError:
+                    coords = None
+                if osm_id is not None and coords is not None:
+                    lat, lon = coords
+                    pending.append((osm_id, lat, lon))
+                    if len(pending) >= _BATCH_SIZE:
+                        flush_nodes()
+                    if tags:
+                        element = {"type": "node", "id": osm_id, "lat": lat, "lon": lon, "tags": tags}
+            elif tags:
+                center_el = elem.find("center")
+                center: Optional[Tuple[float, float]] = None
+                if center_el is not None:
+                    try:
+                        center = (float(center_el.get("lat") or ""), float(center_el.get("lon") or ""))
+                    except ValueError:
+                        center = None
+                elif elem.tag == "way":
+                    flush_nodes()
+                    refs = [int(nd.get("ref") or 0) for nd in elem.iter("nd")]
+                    center = _way_center(nodes, refs) if refs else None
+                if center is not None:
+                    element = {
+                        "type": elem.tag,
+                        "id": osm_id,
+                        "center": {"lat": center[0], "lon": center[1]},
+                        "tags": tags,
+                    }
+
+            elem.clear()
+            if root is not None:
+                root.clear()
+            if element is not None:
+                yield element
+    finally:
+        nodes.close()
+        try:
+            os.remove(nodes_path)
+        except OSError:
+            pass
+
+
+def _poi_rows(elements: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Any, ...]]:
+    for element in elements:
+        tags = element.get("tags")
+        if not isinstance(tags, dict) or not tags:
+            continue
+        activities = _matching_activities(tags, _ALL_ACTIVITIES)
+        if not activities:
+            continue
+        center = _element_center(element)
+        if not center:
+            continue
+        name, popularity_score, rating_override = _place_fields(tags)
+        for activity in activities:
+            yield (
+                activity,
+                str(element.get("type") or "node"),
+                element.get("id"),
+                name,
+                center[0],
+                center[1],
+                popularity_score,
+                rating_override,
+            )
+
+
+def import_extract(path: str, db_path: str, *, fmt: str = "auto") -> int:
+    """Import an ``.osm`` XML file or Overpass JSON dump into the POI store at ``db_path``.
+
+    Returns the number of POI rows written (one per element and matching activity).
+    """
+    if fmt == "auto":
+        fmt = "json" if path.lower().endswith(".json") else "xml"
+
+    conn = connect_poi_store(db_path)
+    written = 0
+    try:
+        if fmt == "json":
+            fp: Optional[IO[str]] = open(path, "r", encoding="utf-8")
+            elements: Iterable[Dict[str, Any]] = iter_overpass_json(fp)
+        else:
+            fp = None
+            elements = iter_osm_xml(path)
+
+        try:
+            batch: List[Tuple[Any, ...]] = []
+            for row in _poi_rows(elements):
+                if row[2] is None:
+                    continue
+                batch.append(row)
+                if len(batch) >= _BATCH_SIZE:
+                    insert_pois(conn, batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                insert_pois(conn, batch)
+                written += len(batch)
+        finally:
+            if fp is not None:
+                fp.close()
+    finally:
+        conn.close()
+    return written
@@ -1,12 +1,63 @@
 from __future__ import annotations
 
 import json
-import socket
+import math
+import sqlite3
+import threading
 import time
-from typing import Any, Dict, List, Optional, Set, Tuple
-from urllib.error import HTTPError, URLError
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
 from urllib.parse import urlencode
-from urllib.request import Request, urlopen
+
+try:
+    from smarttrip.place_batch import PlaceBatch
+    from smarttrip.services.cache import SingleFlight, TTLCache
+    from smarttrip.services.density import DensityTracker
+    from smarttrip.services.endpoints import EndpointHealth
+    from smarttrip.services.gazetteer import get_gazetteer
+    from smarttrip.services.http_pool import ConnectionPool, HTTPStatusError
+    from smarttrip.services.ratelimit import (
+        PRIORITY_BACKGROUND,
+        current_priority,
+        outbound_priority,
+        rate_limit_stats,
+        scheduler_for,
+    )
+    from smarttrip.services.spatial import GridIndex, haversine_m, within_radius
+    from smarttrip.storage import (
+        cache_get,
+        cache_put,
+        connect_cache,
+        connect_poi_store,
+        purge_expired_cache,
+        query_pois_bbox,
+    )
+    from smarttrip.taxonomy import ACTIVITIES, ACTIVITY_FAMILY
+except ImportError:  # pragma: no cover
+    from place_batch import PlaceBatch  # type: ignore
+    from services.cache import SingleFlight, TTLCache  # type: ignore
+    from services.density import DensityTracker  # type: ignore
+    from services.endpoints import EndpointHealth  # type: ignore
+    from services.gazetteer import get_gazetteer  # type: ignore
+    from services.http_pool import ConnectionPool, HTTPStatusError  # type: ignore
+    from services.ratelimit import (  # type: ignore
+        PRIORITY_BACKGROUND,
+        current_priority,
+        outbound_priority,
+        rate_limit_stats,
+        scheduler_for,
+    )
+    from services.spatial import GridIndex, haversine_m, within_radius  # type: ignore
+    from storage import (  # type: ignore
+        cache_get,
+        cache_put,
+        connect_cache,
+        connect_poi_store,
+        purge_expired_cache,
+        query_pois_bbox,
+    )
+    from taxonomy import ACTIVITIES, ACTIVITY_FAMILY  # type: ignore
 
 
 _DEFAULTS_BY_ACTIVITY = {
@@ -31,26 +82,6 @@ _DEFAULTS_BY_ACTIVITY = {
     },
 }
 
-_ACTIVITY_FAMILY = {
-    "fast_food": "restaurant",
-    "juice": "cafe",
-    "ice_cream": "cafe",
-    "park": "nature",
-    "attraction": "nature",
-    "nature_tourism": "nature",
-    "historical": "nature",
-    "cinema": "entertainment",
-    "amusement_park": "entertainment",
-    "theatre": "entertainment",
-    "museum": "entertainment",
-    "pool": "entertainment",
-    "hotel": "entertainment",
-    "eco_lodge": "nature",
-    "hostel": "entertainment",
-    "market": "entertainment",
-    "shopping_mall": "entertainment",
-}
-
 
 def _activity_filters(activity: str) -> List[Tuple[str, str]]:
     activity = (activity or "").strip().lower()
@@ -125,54 +156,99 @@ def _activity_filters(activity: str) -> List[Tuple[str, str]]:
     ]
 
 
-def _score_popularity(tags: Dict[str, Any]) -> int:
-    if not tags:
-        return 10
-
-    score = 0
-
-    name = tags.get("name") or tags.get("brand") or tags.get("operator") or tags.get("name:en")
-    score += 18 if name else 6
-
-    if tags.get("wikipedia") or tags.get("wikipedia:en"):
-        score += 30
-    if tags.get("wikidata"):
-        score += 25
-
-    if tags.get("website") or tags.get("contact:website"):
-        score += 8
-    if tags.get("opening_hours"):
-        score += 4
-    if tags.get("phone") or tags.get("contact:phone") or tags.get("email") or tags.get("contact:email"):
-        score += 4
-    if tags.get("image") or tags.get("wikimedia_commons"):
-        score += 4
-    if tags.get("contact:instagram") or tags.get("contact:facebook") or tags.get("contact:twitter"):
-        score += 4
-
-    tourism = str(tags.get("tourism") or "").strip().lower()
-    if tourism in {"attraction", "museum", "gallery", "zoo", "theme_park", "aquarium"}:
-        score += 18
-    elif tourism in {"viewpoint", "picnic_site"}:
-        score += 10
+# Every activity the service knows how to query, primaries first.
+_ALL_ACTIVITIES = list(ACTIVITIES)
+_KNOWN_ACTIVITIES = frozenset(_ALL_ACTIVITIES)
+# Activities whose filters include every filter of the key's, so a complete
+# cached set of one of them holds all of the key's elements too.
+_COVERED_BY: Dict[str, List[str]] = {
+    activity: [
+        other
+        for other in _ALL_ACTIVITIES
+        if other != activity and set(_activity_filters(activity)) <= set(_activity_filters(other))
+    ]
+    for activity in _ALL_ACTIVITIES
+}
+# (tag key, tag value) -> activities whose filters include that exact tag.
+_ACTIVITIES_BY_TAG: Dict[Tuple[str, str], List[str]] = {}
+for _activity in _ALL_ACTIVITIES:
+    for _tag in _activity_filters(_activity):
+        _ACTIVITIES_BY_TAG.setdefault(_tag, []).append(_activity)
+del _activity, _tag
+
+# Popularity rules compiled into lookup tables so an element's tags are
+# scored in one pass over its items. Keys that share a rule (e.g. "phone" and
+# "contact:phone") share a bit and count once.
+_POPULARITY_BASE = 6
+_POPULARITY_GROUPS: List[Tuple[Tuple[str, ...], int]] = [
+    # Named places score 18 instead of the base 6.
+    (("name", "brand", "operator", "name:en"), 12),
+    (("wikipedia", "wikipedia:en"), 30),
+    (("wikidata",), 25),
+    (("website", "contact:website"), 8),
+    (("opening_hours",), 4),
+    (("phone", "contact:phone", "email", "contact:email"), 4),
+    (("image", "wikimedia_commons"), 4),
+    (("contact:instagram", "contact:facebook", "contact:twitter"), 4),
+    (("heritage",), 8),
+]
+# key -> (group bit, weight)
+_POPULARITY_PRESENCE: Dict[str, Tuple[int, int]] = {
+    key: (1 << bit, weight) for bit, (keys, weight) in enumerate(_POPULARITY_GROUPS) for key in keys
+}
+_POPULARITY_ADDR_BIT = 1 << len(_POPULARITY_GROUPS)
+_POPULARITY_ADDR_WEIGHT = 3
+# key -> (weight by normalized value, weight for any other non-empty value)
+_POPULARITY_VALUES: Dict[str, Tuple[Dict[str, int], int]] = {
+    "tourism": (
+        {
+            **dict.fromkeys(["attraction", "museum", "gallery", "zoo", "theme_park", "aquarium"], 18),
+            **dict.fromkeys(["viewpoint", "picnic_site"], 10),
+        },
+        0,
+    ),
+    "historic": ({"no": 0}, 10),
+    "amenity": (dict.fromkeys(["restaurant", "cafe", "cinema", "theatre", "arts_centre"], 6), 0),
+    "leisure": (
+        dict.fromkeys(
+            ["park", "garden", "nature_reserve", "water_park", "bowling_alley", "amusement_arcade"], 6
+        ),
+        0,
+    ),
+}
 
-    historic = str(tags.get("historic") or "").strip().lower()
-    if historic and historic != "no":
-        score += 10
 
-    if tags.get("heritage"):
-        score += 8
+# Tags kept on cached elements: enough to re-derive activities, names and scores.
+_CACHED_TAG_KEYS = frozenset(
+    [k for k, _ in _ACTIVITIES_BY_TAG]
+    + list(_POPULARITY_PRESENCE)
+    + list(_POPULARITY_VALUES)
+    + ["rating", "stars"]
+)
 
-    amenity = str(tags.get("amenity") or "").strip().lower()
-    if amenity in {"restaurant", "cafe", "cinema", "theatre", "arts_centre"}:
-        score += 6
 
-    leisure = str(tags.get("leisure") or "").strip().lower()
-    if leisure in {"park", "garden", "nature_reserve", "water_park", "bowling_alley", "amusement_arcade"}:
-        score += 6
+def _score_popularity(tags: Dict[str, Any]) -> int:
+    if not tags:
+        return 10
 
-    if any(str(k).startswith("addr:") for k in tags.keys()):
-        score += 3
+    score = _POPULARITY_BASE
+    seen = 0
+    for key, value in tags.items():
+        presence = _POPULARITY_PRESENCE.get(key)
+        if presence is not None:
+            if value and not seen & presence[0]:
+                seen |= presence[0]
+                score += presence[1]
+            continue
+        by_value = _POPULARITY_VALUES.get(key)
+        if by_value is not None:
+            normalized = str(value or "").strip().lower()
+            if normalized:
+                score += by_value[0].get(normalized, by_value[1])
+            continue
+        if not seen & _POPULARITY_ADDR_BIT and str(key).startswith("addr:"):
+            seen |= _POPULARITY_ADDR_BIT
+            score += _POPULARITY_ADDR_WEIGHT
 
     return int(max(0, min(100, score)))
 
@@ -182,78 +258,570 @@ _OVERPASS_URL_FALLBACKS = [
     # Useful when the primary is rate-limited.
     "https://overpass.kumi.systems/api/interpreter",
 ]
-
+_overpass_endpoints = [EndpointHealth(url) for url in [_OVERPASS_URL_PRIMARY, *_OVERPASS_URL_FALLBACKS]]
+# A hedged request goes out once the current one is slower than its recent p90.
+_HEDGE_DEFAULT_DELAY_S = 3.0
+_HEDGE_MIN_DELAY_S = 0.25
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="smarttrip-overpass")
+# Keep-alive connections to the few OSM hosts we talk to.
+_http_pool = ConnectionPool(max_per_host=4, idle_timeout_s=30.0)
+# After a 429 the host's rate-limit bucket is held back this long for every caller.
+_THROTTLED_PENALTY_S = 10.0
+
+# Radius searches are cached per slippy-map tile (~4 km at z13) and activity,
+# so nearby or wider searches reuse tiles and only fetch the missing ones.
+_TILE_ZOOM = 13
+# Overpass output cap per activity of a tile fetch, raised toward the max where
+# learned densities expect more.
+_TILE_FETCH_LIMIT = 1500
+_TILE_FETCH_MAX_LIMIT = 6000
+
+# Learned places per (tile, activity), from complete tile fetches. Radius
+# searches shrink where the radius would hold far more candidates than asked
+# for and widen (up to twice the requested radius) where it would hold too few.
+_tile_density = DensityTracker(alpha=0.3, max_keys=50000)
+_DENSITY_HEADROOM = 3.0
+_RADIUS_MIN_FACTOR = 0.5
+_RADIUS_MAX_FACTOR = 2.0
+_MIN_RADIUS_M = 250
+_MAX_RADIUS_M = 20000
+# Below this many places for an activity a second, wider pass is tried.
+_SPARSE_RESULTS = 10
+
+# Grid indexes over cached tile element lists, keyed by list identity. The
+# list is held alongside so its id can't be reused while the index lives.
+_GRID_MIN_ELEMENTS = 64
+_GRID_MAX_INDEXES = 1024
+_element_grids: "OrderedDict[int, Tuple[List[Dict[str, Any]], GridIndex]]" = OrderedDict()
+_element_grids_lock = threading.Lock()
+# Past its TTL an entry is still served (stale-while-revalidate) for up to its
+# max staleness while a background refresh replaces it.
 _CACHE_TTL_S = 60.0
-_cache: Dict[Tuple[float, float, int, str], Tuple[float, List[Dict[str, Any]]]] = {}
+_CACHE_MAX_STALE_S = 6 * 60 * 60.0
+_cache = TTLCache(
+    ttl_s=_CACHE_TTL_S, max_stale_s=_CACHE_MAX_STALE_S, max_entries=4096, max_bytes=64 * 1024 * 1024
+)
 _CITY_CACHE_TTL_S = 300.0
-_city_cache: Dict[Tuple[str, str], Tuple[float, List[Dict[str, Any]]]] = {}
+_CITY_CACHE_MAX_STALE_S = 24 * 60 * 60.0
+_city_cache = TTLCache(
+    ttl_s=_CITY_CACHE_TTL_S, max_stale_s=_CITY_CACHE_MAX_STALE_S, max_entries=512, max_bytes=32 * 1024 * 1024
+)
 
 _GEOCODE_TTL_S = 24 * 60 * 60.0
-_geocode_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_GEOCODE_MAX_STALE_S = 7 * 24 * 60 * 60.0
+_geocode_cache = TTLCache(
+    ttl_s=_GEOCODE_TTL_S, max_stale_s=_GEOCODE_MAX_STALE_S, max_entries=2048, max_bytes=4 * 1024 * 1024
+)
+
+_CACHES = {"tiles": _cache, "city": _city_cache, "geocode": _geocode_cache}
+# Identical concurrent upstream fetches (same cache key) share one request.
+_flights = SingleFlight()
+
+# Background refreshes of stale entries, at most one queued per key.
+_REFRESH_TIMEOUT_S = 15.0
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="smarttrip-refresh")
+_refresh_lock = threading.Lock()
+_refreshing: Set[Hashable] = set()
+_refresh_stats = {"scheduled": 0, "skipped": 0, "failed": 0}
+
+# Worst status wins when a response mixes sources.
+_FRESHNESS_ORDER = ("live", "offline", "cached", "stale")
+
+# Persistent tier shared by all workers, read through under the caches above.
+# POI data changes on the scale of days, so entries live longer on disk (and
+# at least as long as the in-memory stale window).
+_PERSISTENT_TTL_S = {
+    "tile_elements": 60 * 60.0,
+    "city_elements": 6 * 60 * 60.0,
+    "geocode": 7 * 24 * 60 * 60.0,
+}
+_persistent_db_path: Optional[str] = None
+_persistent_local = threading.local()
+
+# Optional offline POI store (see ``python -m smarttrip import-osm``).
+_local_store_path: Optional[str] = None
+_local_store_local = threading.local()
 
 _NOMINATIM_SEARCH_URL = "https://nominatim.openstreetmap.org/search"
 _HTTP_USER_AGENT = "SmartTrip/1.0 (learning project)"
 
 
-def _cache_key(lat: float, lon: float, radius: int, activity: str) -> Tuple[float, float, int, str]:
-    # Rounded to reduce cache misses while still being location-accurate.
-    return (round(float(lat), 4), round(float(lon), 4), int(radius), (activity or "").strip().lower())
+def _cache_key(tile: Tuple[int, int, int], activity: str) -> Tuple[int, int, int, str]:
+    return (tile[0], tile[1], tile[2], (activity or "").strip().lower())
 
 
-def _read_overpass_json(query: str, *, timeout_s: float) -> Optional[Dict[str, Any]]:
-    """Return parsed Overpass JSON response, or None on failure."""
+def _tile_for(lat: float, lon: float, zoom: int = _TILE_ZOOM) -> Tuple[int, int, int]:
+    n = 1 << zoom
+    lat = max(-85.05112878, min(85.05112878, float(lat)))
+    x = int((float(lon) + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return (zoom, max(0, min(n - 1, x)), max(0, min(n - 1, y)))
 
-    urls = [_OVERPASS_URL_PRIMARY, *_OVERPASS_URL_FALLBACKS]
 
-    for url in urls:
-        try:
-            req = Request(url, data=query.encode("utf-8"), headers={"User-Agent": _HTTP_USER_AGENT})
-            with urlopen(req, timeout=timeout_s) as resp:
-                raw = resp.read()
-            # Overpass returns UTF-8 JSON.
-            return json.loads(raw.decode("utf-8"))
-        except socket.timeout:
-            return None
-        except HTTPError as e:
-            # Try a fallback endpoint for common transient errors.
-            if getattr(e, "code", None) in {429, 502, 503, 504} and url != urls[-1]:
+def _tile_bounds(tile: Tuple[int, int, int]) -> Tuple[float, float, float, float]:
+    """Return ``(south, west, north, east)`` of a slippy-map tile."""
+    zoom, x, y = tile
+    n = 1 << zoom
+
+    def lat_of(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * row / n))))
+
+    return (lat_of(y + 1), x / n * 360.0 - 180.0, lat_of(y), (x + 1) / n * 360.0 - 180.0)
+
+
+_haversine_m = haversine_m
+
+
+def _covering_tiles(lat: float, lon: float, radius_m: float) -> List[Tuple[int, int, int]]:
+    """Tiles that intersect the circle of ``radius_m`` around ``(lat, lon)``."""
+    d_lat = radius_m / 111320.0
+    d_lon = radius_m / (111320.0 * max(0.01, math.cos(math.radians(lat))))
+    _, x0, y0 = _tile_for(lat + d_lat, lon - d_lon)
+    _, x1, y1 = _tile_for(lat - d_lat, lon + d_lon)
+
+    tiles: List[Tuple[int, int, int]] = []
+    for y in range(y0, y1 + 1):
+        for x in range(x0, x1 + 1):
+            tile = (_TILE_ZOOM, x, y)
+            south, west, north, east = _tile_bounds(tile)
+            # Skip bbox corners the circle doesn't reach.
+            near_lat = max(south, min(north, lat))
+            near_lon = max(west, min(east, lon))
+            if _haversine_m(lat, lon, near_lat, near_lon) <= radius_m:
+                tiles.append(tile)
+    return tiles
+
+
+def _tile_rectangles(tiles: List[Tuple[int, int, int]]) -> List[Tuple[float, float, float, float]]:
+    """Merge tiles into a few ``(south, west, north, east)`` boxes for one Overpass query."""
+    rows: Dict[int, List[int]] = {}
+    for _, x, y in tiles:
+        rows.setdefault(y, []).append(x)
+
+    # Contiguous x runs per row, then stack identical runs from adjacent rows.
+    runs: Dict[Tuple[int, int], List[int]] = {}
+    for y in sorted(rows):
+        xs = sorted(set(rows[y]))
+        start = prev = xs[0]
+        for x in xs[1:] + [None]:  # type: ignore[list-item]
+            if x is not None and x == prev + 1:
+                prev = x
                 continue
-            return None
-        except URLError as e:
-            if isinstance(getattr(e, "reason", None), socket.timeout):
-                return None
-            # Otherwise, try the next endpoint (e.g., DNS/connection issues).
-            if url != urls[-1]:
+            runs.setdefault((start, prev), []).append(y)
+            if x is not None:
+                start = prev = x
+
+    boxes: List[Tuple[float, float, float, float]] = []
+    for (x0, x1), ys in runs.items():
+        y_start = y_prev = ys[0]
+        for y in ys[1:] + [None]:  # type: ignore[list-item]
+            if y is not None and y == y_prev + 1:
+                y_prev = y
                 continue
-            return None
+            south = _tile_bounds((_TILE_ZOOM, x0, y_prev))[0]
+            _, west, north, _ = _tile_bounds((_TILE_ZOOM, x0, y_start))
+            east = _tile_bounds((_TILE_ZOOM, x1, y_start))[3]
+            boxes.append((south, west, north, east))
+            if y is not None:
+                y_start = y_prev = y
+    return boxes
+
+
+def configure_persistent_cache(db_path: Optional[str]) -> None:
+    """Enable the SQLite cache tier at ``db_path`` (or disable it with None)."""
+    global _persistent_db_path
+    _persistent_db_path = str(db_path) if db_path else None
+    conn = _persistent_conn()
+    if conn is not None:
+        try:
+            purge_expired_cache(conn)
+        except sqlite3.Error:
+            pass
+
+
+def _persistent_conn() -> Optional[sqlite3.Connection]:
+    path = _persistent_db_path
+    if not path:
+        return None
+    # One connection per thread; reopened if the configured path changes.
+    current = getattr(_persistent_local, "conn", None)
+    if current is not None and current[0] == path:
+        return current[1]
+    try:
+        conn = connect_cache(path)
+    except (OSError, sqlite3.Error):
+        return None
+    _persistent_local.conn = (path, conn)
+    return conn
+
+
+def _persistent_key(key: Any) -> str:
+    if isinstance(key, tuple):
+        return "|".join(str(part) for part in key)
+    return str(key)
+
+
+def configure_caches(settings: Dict[str, Dict[str, Any]]) -> None:
+    """Apply ``{"tiles"|"city"|"geocode": {"ttl_s", "max_stale_s", "max_entries", "max_bytes"}}`` limits."""
+    for name, options in (settings or {}).items():
+        cache = _CACHES.get(name)
+        if cache is None or not isinstance(options, dict):
+            continue
+        cache.configure(
+            ttl_s=options.get("ttl_s"),
+            max_stale_s=options.get("max_stale_s"),
+            max_entries=options.get("max_entries"),
+            max_bytes=options.get("max_bytes"),
+        )
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    stats = {name: cache.stats() for name, cache in _CACHES.items()}
+    stats["single_flight"] = _flights.stats()
+    stats["density"] = _tile_density.stats()
+    with _refresh_lock:
+        stats["refresh"] = dict(_refresh_stats, in_flight=len(_refreshing))
+    return stats
+
+
+def _read_through(memory: TTLCache, namespace: str, key: Any) -> Optional[Tuple[float, Any, bool]]:
+    """Look ``key`` up in the in-memory cache, then in the persistent tier.
+
+    Returns ``(stored_ts, value, is_stale)``; stale entries are still within the
+    cache's max staleness and should be refreshed with ``_schedule_refresh``.
+    """
+    entry = memory.get_entry(key, allow_stale=True)
+    if entry is not None:
+        return entry
+
+    conn = _persistent_conn()
+    if conn is None:
+        return None
+    try:
+        stored = cache_get(conn, namespace, _persistent_key(key))
+    except sqlite3.Error:
+        return None
+    if stored is None:
+        return None
+    stored_ts, value = stored
+    age = time.time() - stored_ts
+    if age > memory.ttl_s + memory.max_stale_s:
+        return None
+    # Keep the original fetch time so freshness is the same in every worker.
+    memory.set(key, value, stored_ts=stored_ts)
+    return stored_ts, value, age > memory.ttl_s
+
+
+def _write_through(memory: TTLCache, namespace: str, key: Any, value: Any) -> None:
+    memory.set(key, value)
+    conn = _persistent_conn()
+    if conn is None:
+        return
+    try:
+        ttl_s = max(_PERSISTENT_TTL_S[namespace], memory.ttl_s + memory.max_stale_s)
+        cache_put(conn, namespace, _persistent_key(key), value, ttl_s=ttl_s)
+    except sqlite3.Error:
+        pass
+
+
+def _schedule_refresh(key: Hashable, fn: Callable[[], Any]) -> None:
+    """Run ``fn`` in the background unless a refresh for ``key`` is already pending."""
+    with _refresh_lock:
+        if key in _refreshing:
+            _refresh_stats["skipped"] += 1
+            return
+        _refreshing.add(key)
+        _refresh_stats["scheduled"] += 1
+
+    def run() -> None:
+        try:
+            with outbound_priority(PRIORITY_BACKGROUND):
+                fn()
         except Exception:
-            return None
-    return None
+            with _refresh_lock:
+                _refresh_stats["failed"] += 1
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(key)
+
+    _refresh_pool.submit(run)
+
+
+def _note_freshness(freshness: Optional[Dict[str, Any]], status: str, stored_ts: Optional[float] = None) -> None:
+    """Fold one data source into a ``{"status", "age_s"}`` freshness summary."""
+    if freshness is None:
+        return
+    current = freshness.get("status")
+    if current is None or _FRESHNESS_ORDER.index(status) > _FRESHNESS_ORDER.index(current):
+        freshness["status"] = status
+    age = max(0.0, time.time() - stored_ts) if stored_ts is not None else 0.0
+    freshness["age_s"] = round(max(float(freshness.get("age_s") or 0.0), age), 1)
+
+
+def configure_overpass_endpoints(urls: List[str]) -> None:
+    """Replace the Overpass endpoints (primary first), resetting their health tracking."""
+    global _overpass_endpoints
+    _overpass_endpoints = [EndpointHealth(str(url)) for url in urls if url]
+
+
+def configure_http_pool(*, max_per_host: Optional[int] = None, idle_timeout_s: Optional[float] = None) -> None:
+    _http_pool.configure(max_per_host=max_per_host, idle_timeout_s=idle_timeout_s)
+
+
+def upstream_stats() -> Dict[str, Any]:
+    return {
+        "overpass": [health.stats() for health in _overpass_endpoints],
+        "http_pool": _http_pool.stats(),
+        "rate_limits": rate_limit_stats(),
+    }
+
+
+class _OverpassAttempt:
+    """One request of ``_read_overpass_json`` to one endpoint.
+
+    Its outcome is recorded once: by the attempt when it finishes, or by
+    ``abandon`` when the read stops waiting for it first. An attempt that is
+    never sent hands its endpoint's half-open probe back instead.
+    """
+
+    __slots__ = ("health", "started", "_settled", "_lock")
+
+    def __init__(self, health: EndpointHealth) -> None:
+        self.health = health
+        self.started: Optional[float] = None
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def _settle(self) -> bool:
+        with self._lock:
+            settled, self._settled = self._settled, True
+        return not settled
+
+    def begin(self) -> Optional[float]:
+        """Mark the request as sent and return when; None if it was abandoned while waiting to be."""
+        with self._lock:
+            if self._settled:
+                return None
+            self.started = time.monotonic()
+            return self.started
+
+    def unsent(self) -> None:
+        """Give up before sending: the endpoint never saw it, so only its probe is handed back."""
+        with self._lock:
+            if self._settled or self.started is not None:
+                return
+            self._settled = True
+        self.health.release_probe()
+
+    def succeeded(self, latency_s: float) -> None:
+        if self._settle():
+            self.health.record_success(latency_s)
+
+    def failed(self) -> None:
+        if self._settle():
+            self.health.record_failure()
+
+    def abandon(self, *, timed_out: bool) -> None:
+        """Account for the attempt still running: a failure past the deadline, else (a hedge loser) its time so far."""
+        with self._lock:
+            started = self.started
+            settled, self._settled = self._settled, True
+        if settled:
+            return
+        if started is None:
+            # Still waiting on our own rate limit; the endpoint never saw it.
+            self.health.release_probe()
+        elif timed_out:
+            self.health.record_failure()
+        else:
+            self.health.record_latency(time.monotonic() - started)
+
+
+def _overpass_attempt(
+    attempt: _OverpassAttempt, query: str, *, timeout_s: float, cancel: threading.Event, priority: int
+) -> Optional[Dict[str, Any]]:
+    health = attempt.health
+    scheduler = scheduler_for(health.url)
+    queued = time.monotonic()
+    if not scheduler.acquire(timeout_s=timeout_s, priority=priority, cancel=cancel):
+        # Our own rate limit, not the endpoint's fault.
+        attempt.unsent()
+        return None
+    started = attempt.begin()
+    if started is None:
+        return None
+    timeout_s = max(0.1, timeout_s - (started - queued))
+    try:
+        # The pool reads in chunks, so a losing hedged request stops early.
+        raw = _http_pool.request(
+            "POST",
+            health.url,
+            body=query.encode("utf-8"),
+            headers={"User-Agent": _HTTP_USER_AGENT, "Content-Type": "application/x-www-form-urlencoded"},
+            timeout_s=timeout_s,
+            cancel=cancel,
+        )
+        # Overpass returns UTF-8 JSON.
+        data = json.loads(raw.decode("utf-8"))
+    except HTTPStatusError as e:
+        if e.code == 429:
+            # Out of slots: hold back everyone in this process (and, when shared, all workers).
+            scheduler.penalize(_THROTTLED_PENALTY_S)
+        if not cancel.is_set():
+            attempt.failed()
+        return None
+    except Exception:
+        # Covers timeouts, HTTP errors (429/5xx) and connection/DNS failures.
+        if not cancel.is_set():
+            attempt.failed()
+        return None
+    attempt.succeeded(time.monotonic() - started)
+    return data if isinstance(data, dict) else None
+
+
+def _read_overpass_json(query: str, *, timeout_s: float) -> Optional[Dict[str, Any]]:
+    """Return parsed Overpass JSON response, or None on failure.
+
+    Endpoints with an open circuit breaker are skipped. If the current
+    endpoint fails, the next one is tried at once; if it is merely slower than
+    its recent p90 latency, a hedged request goes to the next endpoint and the
+    first good response wins. Everything shares one ``timeout_s`` deadline.
+    Attempts still running when it ends are recorded too: as failures past
+    the deadline, and with their time so far when another endpoint won.
+    """
+    # Breakers are asked only when an endpoint is actually tried, so a
+    # half-open endpoint's one probe isn't claimed by a fallback never used.
+    queue = list(_overpass_endpoints)
+    deadline = time.monotonic() + float(timeout_s)
+    cancel = threading.Event()
+    # Attempts run on the hedge pool, so carry the caller's priority over explicitly.
+    priority = current_priority()
+    pending: Dict[Future, _OverpassAttempt] = {}
+    hedge_at = deadline
+    won = False
+
+    def launch() -> None:
+        nonlocal hedge_at
+        while queue:
+            health = queue.pop(0)
+            if health.allow_request():
+                break
+        else:
+            return
+        now = time.monotonic()
+        attempt = _OverpassAttempt(health)
+        future = _hedge_pool.submit(
+            _overpass_attempt,
+            attempt,
+            query,
+            timeout_s=max(0.1, deadline - now),
+            cancel=cancel,
+            priority=priority,
+        )
+        pending[future] = attempt
+        hedge_delay = health.latency_quantile(0.9, default=_HEDGE_DEFAULT_DELAY_S)
+        hedge_at = now + max(_HEDGE_MIN_DELAY_S, hedge_delay)
+
+    launch()
+    try:
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                return None
+            wait_until = min(deadline, hedge_at) if queue else deadline
+            done, _ = wait(list(pending), timeout=max(0.0, wait_until - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future, None)
+                data = future.result()
+                if data is not None:
+                    won = True
+                    return data
+            if queue and (done or time.monotonic() >= hedge_at):
+                # Fail over after an error, or hedge a slow request.
+                launch()
+        return None
+    finally:
+        # The first good response wins; tell any other attempt to stop.
+        for attempt in pending.values():
+            attempt.abandon(timed_out=not won)
+        cancel.set()
+        for future in pending:
+            future.cancel()
 
 
 def _read_json_url(
     url: str, *, timeout_s: float, headers: Optional[Dict[str, str]] = None
 ) -> Optional[Any]:
+    scheduler = scheduler_for(url)
+    started = time.monotonic()
+    if not scheduler.acquire(timeout_s=timeout_s):
+        return None
+    timeout_s = max(0.1, timeout_s - (time.monotonic() - started))
     try:
-        req = Request(url, headers=headers or {})
-        with urlopen(req, timeout=timeout_s) as resp:
-            raw = resp.read()
+        raw = _http_pool.request("GET", url, headers=headers, timeout_s=timeout_s)
         return json.loads(raw.decode("utf-8"))
+    except HTTPStatusError as e:
+        if e.code == 429:
+            scheduler.penalize(_THROTTLED_PENALTY_S)
+        return None
     except Exception:
         return None
 
 
+def _city_key(city: str) -> str:
+    """Cache key for a city; names and aliases of a gazetteer city share one key."""
+    gazetteer = get_gazetteer()
+    known = gazetteer.lookup(city) if gazetteer is not None else None
+    return (known["name"] if known is not None else city).casefold()
+
+
 def geocode_city(city: str, *, timeout_s: float = 6.0) -> Optional[Dict[str, Any]]:
-    """Resolve a city name to a center point and (when possible) an Overpass area id."""
+    """Resolve a city name to a center point and (when possible) an Overpass area id.
+
+    The offline gazetteer is tried first; Nominatim is only asked about
+    cities it doesn't know.
+    """
     city = (city or "").strip()
     if not city:
         return None
 
+    gazetteer = get_gazetteer()
+    known = gazetteer.lookup(city) if gazetteer is not None else None
+    if known is not None:
+        return {
+            "query": city,
+            "lat": known["lat"],
+            "lon": known["lon"],
+            "osm_type": known["osm_type"],
+            "osm_id": known["osm_id"],
+            "area_id": known["area_id"],
+            "bbox": known["bbox"],
+            "display_name": ", ".join(p for p in (known["name"], known["country"]) if p),
+        }
+
     key = city.casefold()
+    entry = _read_through(_geocode_cache, "geocode", key)
+    if entry is not None and isinstance(entry[1], dict):
+        if entry[2]:
+            _schedule_refresh(
+                ("geocode", key), lambda: _geocode_remote(city, key, timeout_s=_REFRESH_TIMEOUT_S)
+            )
+        result = dict(entry[1])
+        if isinstance(result.get("bbox"), list):
+            # JSON round-trips through the persistent tier turn tuples into lists.
+            result["bbox"] = tuple(result["bbox"])
+        return result
+
+    result = _flights.do(("geocode", key), lambda: _geocode_remote(city, key, timeout_s=timeout_s))
+    return dict(result) if result is not None else None
+
+
+def _geocode_remote(city: str, key: str, *, timeout_s: float) -> Optional[Dict[str, Any]]:
+    # Another caller may have filled the cache while we waited to lead the flight.
+    # Stale entries don't count: this is also the background refresh.
     cached = _geocode_cache.get(key)
-    now = time.time()
-    if cached and (now - cached[0]) <= _GEOCODE_TTL_S:
-        return dict(cached[1])
+    if isinstance(cached, dict):
+        return cached
 
     params = {
         "format": "jsonv2",
@@ -315,12 +883,13 @@ def geocode_city(city: str, *, timeout_s: float = 6.0) -> Optional[Dict[str, Any
         "display_name": item.get("display_name"),
     }
 
-    _geocode_cache[key] = (now, dict(result))
+    _write_through(_geocode_cache, "geocode", key, dict(result))
     return result
 
 
 def _element_center(element: Dict[str, Any]) -> Optional[Tuple[float, float]]:
-    if element.get("type") == "node":
+    # Nodes (and cached compact elements) carry lat/lon, ways and relations a center.
+    if element.get("type") == "node" or "lat" in element:
         lat = element.get("lat")
         lon = element.get("lon")
     else:
@@ -334,66 +903,421 @@ def _element_center(element: Dict[str, Any]) -> Optional[Tuple[float, float]]:
         return None
 
 
-def get_places_city(
+def _merged_filter_clauses(filters: List[Tuple[str, str]]) -> List[str]:
+    """Group tag filters by key into one Overpass clause per key.
+
+    ``[("amenity", "cafe"), ("amenity", "restaurant")]`` becomes
+    ``['["amenity"~"^(cafe|restaurant)$"]']`` so a multi-activity request costs
+    a single union block per key instead of one block per tag pair.
+    """
+    by_key: Dict[str, List[str]] = {}
+    for k, v in filters:
+        values = by_key.setdefault(k, [])
+        if v not in values:
+            values.append(v)
+
+    clauses: List[str] = []
+    for k, values in by_key.items():
+        if len(values) == 1:
+            clauses.append(f'["{k}"="{values[0]}"]')
+        else:
+            clauses.append(f'["{k}"~"^({"|".join(values)})$"]')
+    return clauses
+
+
+def _plan_query(
+    activities: List[str],
+    scopes: List[str],
+    *,
+    overpass_timeout: int,
+    limits: Dict[str, int],
+    prefix: str = "",
+) -> str:
+    """One Overpass query for all ``activities``, each capped at its own ``limits[activity]``.
+
+    The filters of all activities, grouped by key, are scanned once into a
+    named set. Each activity then picks its elements out of that set (a tag
+    test, not another scan) and gets its own ``out`` statement, so a dense
+    activity can't fill a shared cap and crowd sparse ones out of the
+    response. An element matching several activities comes back once per
+    activity.
+    """
+    filters = [f for activity in activities for f in _activity_filters(activity)]
+    scan = [f"nwr{clause}{scope};" for scope in scopes for clause in _merged_filter_clauses(filters)]
+    statements = ["(\n  " + "\n  ".join(scan) + "\n)->.candidates;"]
+    for activity in activities:
+        picks = [f"nwr.candidates{clause};" for clause in _merged_filter_clauses(_activity_filters(activity))]
+        statements.append("(" + " ".join(picks) + f");\nout center qt {limits[activity]};")
+    return f"[out:json][timeout:{overpass_timeout}];{prefix}" + "\n".join(statements)
+
+
+def _matching_activities(tags: Dict[str, Any], activities: List[str]) -> List[str]:
+    """Return the activities whose filters match ``tags`` (exact, like Overpass ``=``)."""
+    matched: Set[str] = set()
+    for item in tags.items():
+        hit = _ACTIVITIES_BY_TAG.get(item)
+        if hit:
+            matched.update(hit)
+    return [
+        a
+        for a in activities
+        if a in matched
+        or (a not in _KNOWN_ACTIVITIES and any(tags.get(k) == v for k, v in _activity_filters(a)))
+    ]
+
+
+def _normalize_activities(activities: List[str]) -> List[str]:
+    out: List[str] = []
+    for raw in activities or []:
+        activity = (raw or "").strip().lower() or "nature"
+        if activity not in out:
+            out.append(activity)
+    return out or ["nature"]
+
+
+def _place_fields(tags: Dict[str, Any]) -> Tuple[str, int, Optional[float]]:
+    """Return ``(name, popularity_score, rating_override)`` derived from OSM tags."""
+    popularity_score = _score_popularity(tags)
+
+    rating_tag = tags.get("rating") or tags.get("stars")
+    rating_override: Optional[float]
+    try:
+        rating_override = float(rating_tag) if rating_tag is not None else None
+    except (TypeError, ValueError):
+        rating_override = None
+    if rating_override is not None and not (0.0 <= rating_override <= 5.0):
+        rating_override = None
+
+    name = (
+        tags.get("name")
+        or tags.get("brand")
+        or tags.get("operator")
+        or tags.get("name:en")
+        or "Unnamed place"
+    )
+    return str(name), popularity_score, rating_override
+
+
+def _place_kind(batch: PlaceBatch, activity: str, city: Optional[str] = None) -> Tuple[int, float]:
+    """Kind code for ``activity``'s places in ``batch``, and the rating they default to."""
+    family = ACTIVITY_FAMILY.get(activity, activity)
+    defaults = _DEFAULTS_BY_ACTIVITY.get(family, _DEFAULTS_BY_ACTIVITY["nature"])
+    kind = batch.add_kind(
+        type=activity,
+        city=city,
+        price_tier=defaults["price_tier"],
+        best_for=defaults["best_for"],
+        ideal_people=defaults["ideal_people"],
+    )
+    return kind, defaults["rating"]
+
+
+def _most_popular(batch: PlaceBatch, limit: int) -> PlaceBatch:
+    return batch.take(batch.popularity_order()[:limit])
+
+
+def _elements_to_places(
+    elements: List[Any],
+    activities: List[str],
+    *,
+    candidate_limit: int,
+    limit: int,
+    city: Optional[str] = None,
+    table: Optional[PlaceBatch] = None,
+) -> Dict[str, PlaceBatch]:
+    """Convert Overpass elements to places, assigning each element to its activities locally.
+
+    Matches are collected as plain tuples and only the ``limit`` most popular
+    of each activity are appended to a batch, so rows that would be dropped
+    never get columns or interned values. The batches share ``table``'s
+    value table when given.
+    """
+    table = table if table is not None else PlaceBatch()
+    rows: Dict[str, List[Tuple[int, float, str, float, float, Any, Any]]] = {a: [] for a in activities}
+    default_ratings: Dict[str, float] = {}
+    kinds: Dict[str, int] = {}
+    for activity in activities:
+        kinds[activity], default_ratings[activity] = _place_kind(table, activity, city)
+    seen: Dict[str, Set[Tuple[str, float, float]]] = {a: set() for a in activities}
+    open_activities = list(activities)
+
+    for element in elements:
+        if not open_activities:
+            break
+        if not isinstance(element, dict):
+            continue
+        center = _element_center(element)
+        if not center:
+            continue
+        el_lat, el_lon = center
+
+        tags = element.get("tags") or {}
+        if not isinstance(tags, dict):
+            tags = {}
+        matched = _matching_activities(tags, open_activities)
+        if not matched:
+            continue
+        name, popularity_score, rating_override = _place_fields(tags)
+        sig = (name.strip().lower(), round(el_lat, 6), round(el_lon, 6))
+
+        for activity in matched:
+            if sig in seen[activity]:
+                continue
+            seen[activity].add(sig)
+            rating = default_ratings[activity] if rating_override is None else rating_override
+            activity_rows = rows[activity]
+            activity_rows.append(
+                (popularity_score, rating, name, float(el_lat), float(el_lon), element.get("type"), element.get("id"))
+            )
+            if len(activity_rows) >= candidate_limit:
+                open_activities.remove(activity)
+
+    by_activity: Dict[str, PlaceBatch] = {}
+    for activity, activity_rows in rows.items():
+        # Stable, so ties keep element order as PlaceBatch.popularity_order does.
+        activity_rows.sort(key=lambda row: (row[0], row[1]), reverse=True)
+        places = by_activity[activity] = table.empty_like()
+        kind = kinds[activity]
+        for popularity_score, rating, name, lat, lon, osm_kind, osm_id in activity_rows[:limit]:
+            places.append(kind, name, lat, lon, osm_kind, osm_id, popularity_score, rating)
+    return by_activity
+
+
+def configure_local_store(db_path: Optional[str]) -> None:
+    """Serve places from an offline POI store at ``db_path`` instead of Overpass (None disables)."""
+    global _local_store_path
+    _local_store_path = str(db_path) if db_path else None
+
+
+def _local_store_conn() -> Optional[sqlite3.Connection]:
+    path = _local_store_path
+    if not path:
+        return None
+    current = getattr(_local_store_local, "conn", None)
+    if current is not None and current[0] == path:
+        return current[1]
+    try:
+        conn = connect_poi_store(path)
+    except (OSError, sqlite3.Error):
+        return None
+    _local_store_local.conn = (path, conn)
+    return conn
+
+
+def _local_store_places(
+    conn: sqlite3.Connection,
+    activity: str,
+    bbox: Tuple[float, float, float, float],
+    *,
+    limit: Optional[int] = None,
+    city: Optional[str] = None,
+    table: Optional[PlaceBatch] = None,
+) -> PlaceBatch:
+    places = table.empty_like() if table is not None else PlaceBatch()
+    try:
+        rows = query_pois_bbox(conn, activity, bbox, limit=limit)
+    except sqlite3.Error:
+        return places
+    kind, default_rating = _place_kind(places, activity, city)
+    for osm_kind, osm_id, name, lat, lon, popularity, rating in rows:
+        places.append(
+            kind,
+            name,
+            float(lat),
+            float(lon),
+            osm_kind,
+            osm_id,
+            int(popularity),
+            default_rating if rating is None else rating,
+        )
+    return places
+
+
+def _within_radius(places: PlaceBatch, lat: float, lon: float, radius: float, limit: int) -> PlaceBatch:
+    """Keep places within ``radius`` metres, most popular first, capped at ``limit``."""
+    rows = within_radius(range(len(places)), lat, lon, radius, point=lambda i: (places.lat[i], places.lon[i]))
+    return places.take(places.popularity_order(rows)[:limit])
+
+
+def _city_candidate_limit(limit: int) -> int:
+    # City queries can be expensive. Keep a moderate candidate pool.
+    return max(120, min(350, limit * 2))
+
+
+def _compact_element(element: Any) -> Optional[Dict[str, Any]]:
+    """Reduce an Overpass element to what local derivation needs (center + relevant tags)."""
+    if not isinstance(element, dict):
+        return None
+    center = _element_center(element)
+    if not center:
+        return None
+    tags = element.get("tags")
+    if not isinstance(tags, dict):
+        tags = {}
+    kept = {k: v for k, v in tags.items() if k in _CACHED_TAG_KEYS}
+    # Popularity only asks whether some addr:* key exists.
+    addr_key = next((k for k in tags if str(k).startswith("addr:")), None)
+    if addr_key is not None:
+        kept[addr_key] = tags[addr_key]
+    return {"type": element.get("type"), "id": element.get("id"), "lat": center[0], "lon": center[1], "tags": kept}
+
+
+def _bin_by_activity(elements: List[Any], activities: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    binned: Dict[str, List[Dict[str, Any]]] = {activity: [] for activity in activities}
+    seen: Set[Tuple[Any, Any]] = set()
+    for element in elements:
+        compact = _compact_element(element)
+        if compact is None:
+            continue
+        # Elements matching several activities come back once per activity's output.
+        if compact["id"] is not None:
+            ident = (compact["type"], compact["id"])
+            if ident in seen:
+                continue
+            seen.add(ident)
+        for activity in _matching_activities(compact["tags"], activities):
+            binned[activity].append(compact)
+    return binned
+
+
+def get_places_city_multi(
     city: str,
     *,
-    activity: str = "nature",
+    activities: List[str],
     timeout_s: float = 10.0,
     limit: int = 120,
-) -> List[Dict[str, Any]]:
-    """Fetch places from OSM scoped to a whole city using Nominatim + Overpass."""
+    freshness: Optional[Dict[str, Any]] = None,
+    cached_only: bool = False,
+) -> Optional[Dict[str, PlaceBatch]]:
+    """Fetch places for several activities across a whole city with one Overpass query.
+
+    The cache holds each activity's elements for the city (stale ones are
+    served while they refresh in the background). Only the activities
+    missing from it are fetched, together in one merged query. The batches
+    share one value table. ``freshness``, when given, is filled with the
+    ``status`` and ``age_s`` of the data served. Geocoding and the query
+    share one ``timeout_s``. With ``cached_only``, returns None instead of
+    fetching when some activity isn't cached.
+    """
+    started = time.monotonic()
+    activities = _normalize_activities(activities)
     city = (city or "").strip()
+    table = PlaceBatch()
     if not city:
-        return []
+        return {a: table.empty_like() for a in activities}
 
-    activity = (activity or "").strip().lower() or "nature"
     timeout_s = float(timeout_s)
     timeout_s = max(1.5, min(20.0, timeout_s))
     limit = int(limit)
     limit = max(1, min(250, limit))
-    # City queries can be expensive. Keep a moderate candidate pool.
-    candidate_limit = max(120, min(350, limit * 2))
-
-    cache_key = (city.casefold(), activity)
-    cached = _city_cache.get(cache_key)
-    now = time.time()
-    if cached and (now - cached[0]) <= _CITY_CACHE_TTL_S:
-        return list(cached[1])
-
-    geo = geocode_city(city, timeout_s=min(6.0, timeout_s))
-    if not geo:
-        return []
-
-    filters = _activity_filters(activity)
-    family = _ACTIVITY_FAMILY.get(activity, activity)
-    defaults = _DEFAULTS_BY_ACTIVITY.get(family, _DEFAULTS_BY_ACTIVITY["nature"])
+    candidate_limit = _city_candidate_limit(limit)
+
+    city_key = _city_key(city)
+    elements: Dict[str, List[Dict[str, Any]]] = {}
+    missing: List[str] = []
+    stale: List[str] = []
+    for activity in activities:
+        entry = _read_through(_city_cache, "city_elements", (city_key, activity))
+        if entry is not None and isinstance(entry[1], list):
+            elements[activity] = entry[1]
+            _note_freshness(freshness, "stale" if entry[2] else "cached", entry[0])
+            if entry[2]:
+                stale.append(activity)
+        else:
+            missing.append(activity)
+    if missing and cached_only:
+        return None
+    if stale:
+        _schedule_refresh(
+            ("city", city_key, tuple(stale)),
+            lambda: _refresh_city(city, stale, candidate_limit=candidate_limit),
+        )
 
+    results: Dict[str, PlaceBatch] = {}
+    if missing:
+        geo = geocode_city(city, timeout_s=min(6.0, timeout_s))
+        store = _local_store_conn() if geo else None
+        if store is not None:
+            bbox = geo.get("bbox") if geo else None
+            for activity in missing:
+                places = table.empty_like()
+                if isinstance(bbox, tuple) and len(bbox) == 4:
+                    places = _local_store_places(store, activity, bbox, limit=candidate_limit, city=city, table=table)
+                results[activity] = _most_popular(places, limit)
+            _note_freshness(freshness, "offline")
+        elif geo:
+            remaining = max(1.0, timeout_s - (time.monotonic() - started))
+            fetched = _flights.do(
+                ("city", city_key, tuple(missing), candidate_limit),
+                lambda: _fetch_city(city, geo, missing, timeout_s=remaining, candidate_limit=candidate_limit),
+            )
+            if fetched:
+                _note_freshness(freshness, "live")
+            elements.update(fetched)
+
+    for activity in activities:
+        if activity not in results:
+            results.update(
+                _elements_to_places(
+                    elements.get(activity) or [],
+                    [activity],
+                    candidate_limit=candidate_limit,
+                    limit=limit,
+                    city=city,
+                    table=table,
+                )
+            )
+    return {a: results.get(a) or table.empty_like() for a in activities}
+
+
+def _refresh_city(city: str, activities: List[str], *, candidate_limit: int) -> None:
+    geo = geocode_city(city, timeout_s=_REFRESH_TIMEOUT_S)
+    if geo:
+        _fetch_city(city, geo, activities, timeout_s=_REFRESH_TIMEOUT_S, candidate_limit=candidate_limit)
+
+
+def _fetch_city(
+    city: str,
+    geo: Dict[str, Any],
+    activities: List[str],
+    *,
+    timeout_s: float,
+    candidate_limit: int,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Run the merged city query for ``activities`` and cache each one's elements.
+
+    Each activity is capped at ``candidate_limit`` on its own, as a query for
+    it alone would be, so the response holds at most
+    ``len(activities) * candidate_limit`` elements.
+    """
     overpass_timeout = int(max(5, min(25, round(timeout_s))))
+    limits = {activity: candidate_limit for activity in activities}
 
     area_id = geo.get("area_id")
     bbox = geo.get("bbox")
 
     queries: List[str] = []
     if isinstance(area_id, int):
-        blocks = [f'nwr["{k}"="{v}"](area.searchArea);' for k, v in filters]
         queries.append(
-            f"[out:json][timeout:{overpass_timeout}];"
-            f"area({area_id})->.searchArea;(\n  "
-            + "\n  ".join(blocks)
-            + f"\n);\nout center qt {candidate_limit};"
+            _plan_query(
+                activities,
+                ["(area.searchArea)"],
+                overpass_timeout=overpass_timeout,
+                limits=limits,
+                prefix=f"area({area_id})->.searchArea;",
+            )
         )
     if isinstance(bbox, tuple) and len(bbox) == 4:
         south, west, north, east = bbox
-        blocks = [f'nwr[\"{k}\"=\"{v}\"]({south},{west},{north},{east});' for k, v in filters]
         queries.append(
-            f"[out:json][timeout:{overpass_timeout}];(\n  "
-            + "\n  ".join(blocks)
-            + f"\n);\nout center qt {candidate_limit};"
+            _plan_query(
+                activities,
+                [f"({south},{west},{north},{east})"],
+                overpass_timeout=overpass_timeout,
+                limits=limits,
+            )
         )
 
-    if not queries:
-        return []
-
     data: Optional[Dict[str, Any]] = None
     for query in queries:
         data = _read_overpass_json(query, timeout_s=timeout_s)
@@ -406,178 +1330,407 @@ def get_places_city(
             continue
         break
 
-    if data is None:
-        return []
-
-    elements = data.get("elements") or []
+    elements = data.get("elements") if data is not None else None
     if not isinstance(elements, list):
-        return []
+        return {}
+    fetched = _bin_by_activity(elements, activities)
+    for activity, activity_elements in fetched.items():
+        _write_through(_city_cache, "city_elements", (_city_key(city), activity), activity_elements)
+    return fetched
 
-    places: List[Dict[str, Any]] = []
-    seen: Set[Tuple[str, float, float]] = set()
 
-    for element in elements:
-        if not isinstance(element, dict):
-            continue
-        center = _element_center(element)
-        if not center:
-            continue
-        el_lat, el_lon = center
-
-        tags = element.get("tags") or {}
-        if not isinstance(tags, dict):
-            tags = {}
-        popularity_score = _score_popularity(tags)
+def prefetch_city(
+    city: str,
+    activities: List[str],
+    *,
+    priority: int = PRIORITY_BACKGROUND,
+    limit: int = 120,
+    timeout_s: float = 25.0,
+    before_fetch: Optional[Callable[[], None]] = None,
+) -> Optional[Dict[str, List[str]]]:
+    """Make sure the geocode and the city results for ``activities`` are cached and fresh.
+
+    Outbound calls run at ``priority``. Activities whose results are missing
+    or stale are fetched through the same single flight as
+    :func:`get_places_city_multi`, so a warm run and a visitor asking for
+    the same city share one query. ``before_fetch`` is called right before
+    that query (the warmer uses it to space queries out); nothing is fetched
+    when an offline POI store serves city results.
+
+    Returns None when the city can't be geocoded, else ``{"fetched",
+    "cached", "failed"}`` listing activities.
+    """
+    city = (city or "").strip()
+    if not city:
+        return None
+    activities = _normalize_activities(activities)
+    candidate_limit = _city_candidate_limit(max(1, min(250, int(limit))))
+
+    with outbound_priority(priority):
+        key = city.casefold()
+        gazetteer = get_gazetteer()
+        entry = _read_through(_geocode_cache, "geocode", key)
+        if (gazetteer is not None and gazetteer.lookup(city) is not None) or (entry is not None and not entry[2]):
+            geo = geocode_city(city)
+        else:
+            # Stale entries are re-fetched now rather than served and refreshed later.
+            geo = _flights.do(
+                ("geocode", key), lambda: _geocode_remote(city, key, timeout_s=min(10.0, timeout_s))
+            )
+        if not geo:
+            return None
 
-        rating_tag = tags.get("rating") or tags.get("stars")
-        rating_override: Optional[float]
-        try:
-            rating_override = float(rating_tag) if rating_tag is not None else None
-        except (TypeError, ValueError):
-            rating_override = None
-        if rating_override is not None and not (0.0 <= rating_override <= 5.0):
-            rating_override = None
-
-        name = (
-            tags.get("name")
-            or tags.get("brand")
-            or tags.get("operator")
-            or tags.get("name:en")
-            or "Unnamed place"
+        city_key = _city_key(city)
+        due: List[str] = []
+        result: Dict[str, List[str]] = {"fetched": [], "cached": [], "failed": []}
+        for activity in activities:
+            entry = _read_through(_city_cache, "city_elements", (city_key, activity))
+            if entry is None or entry[2]:
+                due.append(activity)
+            else:
+                result["cached"].append(activity)
+        if not due or _local_store_conn() is not None:
+            return result
+
+        if before_fetch is not None:
+            before_fetch()
+        fetched = _flights.do(
+            ("city", city_key, tuple(due), candidate_limit),
+            lambda: _fetch_city(city, geo, due, timeout_s=timeout_s, candidate_limit=candidate_limit),
         )
+    result["fetched"] = [a for a in due if a in fetched]
+    result["failed"] = [a for a in due if a not in fetched]
+    return result
 
-        sig = (str(name).strip().lower(), round(el_lat, 6), round(el_lon, 6))
-        if sig in seen:
-            continue
-        seen.add(sig)
 
-        places.append(
-            {
-                "name": str(name),
-                "lat": float(el_lat),
-                "lon": float(el_lon),
-                "type": activity,
-                "city": city,
-                "osm_id": element.get("id"),
-                "osm_kind": element.get("type"),
-                "popularity_score": popularity_score,
-                **(dict(defaults, rating=rating_override) if rating_override is not None else defaults),
-            }
-        )
-        if len(places) >= candidate_limit:
-            break
+def get_places_city(
+    city: str,
+    *,
+    activity: str = "nature",
+    timeout_s: float = 10.0,
+    limit: int = 120,
+) -> List[Dict[str, Any]]:
+    """Fetch places from OSM scoped to a whole city using Nominatim + Overpass."""
+    activity = (activity or "").strip().lower() or "nature"
+    return get_places_city_multi(city, activities=[activity], timeout_s=timeout_s, limit=limit)[activity].to_dicts()
 
-    places.sort(key=lambda p: (p.get("popularity_score", 0), p.get("rating", 0)), reverse=True)
-    places = places[:limit]
-    _city_cache[cache_key] = (now, list(places))
-    return places
 
+def _tile_area_m2(tile: Tuple[int, int, int]) -> float:
+    south, west, north, east = _tile_bounds(tile)
+    width = (east - west) * 111320.0 * max(0.01, math.cos(math.radians((south + north) / 2.0)))
+    return (north - south) * 111320.0 * width
 
-def get_places(
+
+def _observe_tile_density(tile: Tuple[int, int, int], activity: str, count: int, *, scale: float = 1.0) -> None:
+    _tile_density.observe(_cache_key(tile, activity), count * scale)
+
+
+def _read_tile_elements(tile: Tuple[int, int, int], activity: str) -> Optional[Tuple[float, Any, bool]]:
+    """Cached ``(stored_ts, elements, stale)`` of ``activity`` in ``tile``.
+
+    Cached tiles are complete, so when ``activity`` itself isn't cached its
+    elements are picked out of a cached activity whose filters cover it.
+    """
+    entry = _read_through(_cache, "tile_elements", _cache_key(tile, activity))
+    if entry is not None and isinstance(entry[1], list):
+        return entry
+    for wider in _COVERED_BY.get(activity, ()):
+        entry = _read_through(_cache, "tile_elements", _cache_key(tile, wider))
+        if entry is not None and isinstance(entry[1], list):
+            picked = [e for e in entry[1] if _matching_activities(e["tags"], [activity])]
+            return entry[0], picked, entry[2]
+    return None
+
+
+def _expected_places(lat: float, lon: float, radius: float, activity: str) -> Optional[float]:
+    """Places of ``activity`` expected within ``radius``, or None while a covering tile is unknown."""
+    total = 0.0
+    area = 0.0
+    for tile in _covering_tiles(lat, lon, radius):
+        estimate = _tile_density.estimate(_cache_key(tile, activity))
+        if estimate is None:
+            return None
+        total += estimate
+        area += _tile_area_m2(tile)
+    if area <= 0:
+        return None
+    # The covering tiles overshoot the circle; assume places are spread evenly.
+    return total * min(1.0, math.pi * radius * radius / area)
+
+
+def _adapt_radius(lat: float, lon: float, radius: int, activities: List[str], limit: int, *, requested: int) -> int:
+    """Scale ``radius`` so each activity expects between ``limit`` and ``_DENSITY_HEADROOM * limit`` places.
+
+    The sparsest activity decides. The result stays within half and twice the
+    ``requested`` radius; unknown areas keep ``radius`` as is.
+    """
+    factors: List[float] = []
+    for activity in activities:
+        expected = _expected_places(lat, lon, radius, activity)
+        if expected is None:
+            return radius
+        if expected < limit:
+            factors.append(math.sqrt(limit / expected) if expected > 0 else _RADIUS_MAX_FACTOR)
+        elif expected > limit * _DENSITY_HEADROOM:
+            factors.append(math.sqrt(limit * _DENSITY_HEADROOM / expected))
+        else:
+            factors.append(1.0)
+    if not factors:
+        return radius
+    low = max(_MIN_RADIUS_M, requested * _RADIUS_MIN_FACTOR)
+    high = min(_MAX_RADIUS_M, requested * _RADIUS_MAX_FACTOR)
+    return int(max(low, min(high, radius * max(factors))))
+
+
+def _tile_fetch_limits(tiles: List[Tuple[int, int, int]], activities: List[str]) -> Dict[str, int]:
+    """Overpass ``out`` cap per activity for fetching ``activities`` over ``tiles``.
+
+    Tiles are only cached from untruncated responses, so an activity's cap
+    grows past the default where learned densities say the default would
+    truncate it.
+    """
+    limits: Dict[str, int] = {}
+    for activity in activities:
+        expected = 0.0
+        for tile in tiles:
+            estimate = _tile_density.estimate(_cache_key(tile, activity))
+            if estimate is None:
+                expected = 0.0
+                break
+            expected += estimate
+        limits[activity] = int(max(_TILE_FETCH_LIMIT, min(_TILE_FETCH_MAX_LIMIT, expected * 1.25)))
+    return limits
+
+
+def get_places_multi(
     lat: float,
     lon: float,
     *,
+    activities: List[str],
     radius: int = 5000,
-    activity: str = "nature",
     timeout_s: float = 8.0,
     limit: int = 40,
-) -> List[Dict[str, Any]]:
-    """Fetch nearby places from OSM via Overpass.
-
-    Returns an empty list when Overpass is unavailable or the query fails.
+    freshness: Optional[Dict[str, Any]] = None,
+    cached_only: bool = False,
+) -> Optional[Dict[str, PlaceBatch]]:
+    """Fetch nearby places for several activities with one merged Overpass query.
+
+    Results are assembled from per-tile caches of each activity's elements
+    (or of an activity whose filters cover it); only tiles missing for some
+    activity are fetched, then filtered to the radius. Stale tiles are
+    served as-is and refreshed in the background. Where earlier fetches show
+    how dense the area is, the radius is adapted to it (see ``_adapt_radius``),
+    and a sparse first pass is widened once. Returns empty batches for
+    activities that could not be fetched; ``freshness`` and ``cached_only``
+    work as in ``get_places_city_multi``.
     """
-    activity = (activity or "").strip().lower() or "nature"
+    activities = _normalize_activities(activities)
+    lat = float(lat)
+    lon = float(lon)
     radius = int(radius)
     radius = max(250, min(20000, radius))
     timeout_s = float(timeout_s)
     timeout_s = max(1.5, min(15.0, timeout_s))
     limit = int(limit)
     limit = max(1, min(200, limit))
-    candidate_limit = max(100, min(280, limit * 2))
 
-    family = _ACTIVITY_FAMILY.get(activity, activity)
-    defaults = _DEFAULTS_BY_ACTIVITY.get(family, _DEFAULTS_BY_ACTIVITY["nature"])
+    store = _local_store_conn()
+    if store is not None:
+        d_lat = radius / 111320.0
+        d_lon = radius / (111320.0 * max(0.01, math.cos(math.radians(lat))))
+        bbox = (lat - d_lat, lon - d_lon, lat + d_lat, lon + d_lon)
+        _note_freshness(freshness, "offline")
+        table = PlaceBatch()
+        return {
+            activity: _within_radius(
+                _local_store_places(store, activity, bbox, table=table), lat, lon, radius, limit
+            )
+            for activity in activities
+        }
+
+    started = time.monotonic()
+    requested = radius
+    radius = _adapt_radius(lat, lon, radius, activities, limit, requested=requested)
+    results = _places_in_radius(
+        lat, lon, radius, activities, timeout_s=timeout_s, limit=limit, freshness=freshness, cached_only=cached_only
+    )
+    if results is None:
+        return None
+    if any(len(results[a]) < min(limit, _SPARSE_RESULTS) for a in activities):
+        # The first pass may have taught us how sparse the area is; widen once if time allows.
+        remaining = timeout_s - (time.monotonic() - started)
+        wider = _adapt_radius(lat, lon, radius, activities, limit, requested=requested)
+        if wider > radius and remaining >= timeout_s / 2:
+            widened = _places_in_radius(
+                lat,
+                lon,
+                wider,
+                activities,
+                timeout_s=remaining,
+                limit=limit,
+                freshness=freshness,
+                cached_only=cached_only,
+            )
+            for activity, places in (widened or {}).items():
+                if len(places) > len(results[activity]):
+                    results[activity] = places
+    return {a: results[a] for a in activities}
+
+
+def _elements_within(elements: List[Dict[str, Any]], lat: float, lon: float, radius: float) -> List[Dict[str, Any]]:
+    """``elements`` within ``radius`` metres, in list order, using a grid index kept per cached list."""
+    if len(elements) < _GRID_MIN_ELEMENTS:
+        return within_radius(elements, lat, lon, radius)
+    key = id(elements)
+    with _element_grids_lock:
+        held = _element_grids.get(key)
+        if held is not None and held[0] is elements:
+            _element_grids.move_to_end(key)
+            grid = held[1]
+        else:
+            grid = None
+    if grid is None:
+        grid = GridIndex(elements)
+        with _element_grids_lock:
+            _element_grids[key] = (elements, grid)
+            while len(_element_grids) > _GRID_MAX_INDEXES:
+                _element_grids.popitem(last=False)
+    return grid.within_radius(lat, lon, radius)
+
+
+def _places_in_radius(
+    lat: float,
+    lon: float,
+    radius: int,
+    activities: List[str],
+    *,
+    timeout_s: float,
+    limit: int,
+    freshness: Optional[Dict[str, Any]],
+    cached_only: bool = False,
+) -> Optional[Dict[str, PlaceBatch]]:
+    """One pass of ``get_places_multi`` over the tiles covering ``radius``; None if ``cached_only`` would miss."""
+    tiles = _covering_tiles(lat, lon, radius)
+    tile_elements: Dict[Tuple[int, int, int, str], List[Dict[str, Any]]] = {}
+    missing_tiles: List[Tuple[int, int, int]] = []
+    missing: List[str] = []
+    stale_tiles: List[Tuple[int, int, int]] = []
+    stale: List[str] = []
+    for activity in activities:
+        for tile in tiles:
+            key = _cache_key(tile, activity)
+            entry = _read_tile_elements(tile, activity)
+            if entry is not None:
+                tile_elements[key] = entry[1]
+                if _tile_density.estimate(key) is None:
+                    # e.g. tiles read back from the persistent tier after a restart.
+                    _observe_tile_density(tile, activity, len(entry[1]))
+                _note_freshness(freshness, "stale" if entry[2] else "cached", entry[0])
+                if entry[2]:
+                    if tile not in stale_tiles:
+                        stale_tiles.append(tile)
+                    if activity not in stale:
+                        stale.append(activity)
+                continue
+            if tile not in missing_tiles:
+                missing_tiles.append(tile)
+            if activity not in missing:
+                missing.append(activity)
 
-    key = _cache_key(lat, lon, radius, activity)
-    cached = _cache.get(key)
-    now = time.time()
-    if cached and (now - cached[0]) <= _CACHE_TTL_S:
-        return list(cached[1])
+    if missing and cached_only:
+        return None
+    if stale:
+        _schedule_refresh(
+            ("tiles", tuple(stale_tiles), tuple(stale)),
+            lambda: _fetch_tiles(stale_tiles, stale, timeout_s=_REFRESH_TIMEOUT_S),
+        )
+    if missing:
+        fetched = _flights.do(
+            ("tiles", tuple(missing_tiles), tuple(missing)),
+            lambda: _fetch_tiles(missing_tiles, missing, timeout_s=timeout_s),
+        )
+        if fetched:
+            _note_freshness(freshness, "live")
+        tile_elements.update(fetched)
+
+    table = PlaceBatch()
+    results: Dict[str, PlaceBatch] = {}
+    for activity in activities:
+        nearby = [
+            element
+            for tile in tiles
+            for element in _elements_within(tile_elements.get(_cache_key(tile, activity), []), lat, lon, radius)
+        ]
+        results.update(
+            _elements_to_places(nearby, [activity], candidate_limit=len(nearby), limit=limit, table=table)
+        )
+    return results
 
-    filters = _activity_filters(activity)
-    blocks = [
-        f'nwr["{k}"="{v}"](around:{radius},{float(lat)},{float(lon)});' for k, v in filters
-    ]
 
+def _fetch_tiles(
+    tiles: List[Tuple[int, int, int]],
+    activities: List[str],
+    *,
+    timeout_s: float,
+) -> Dict[Tuple[int, int, int, str], List[Dict[str, Any]]]:
+    """Fetch ``activities`` for ``tiles`` in one query and return their elements binned per tile.
+
+    Each activity is capped on its own; those that came back under their cap
+    are cached, and a truncated one is returned for this request only.
+    """
     overpass_timeout = int(max(5, min(25, round(timeout_s))))
-    # Ask Overpass to cap output to keep responses fast.
-    query = (
-        f"[out:json][timeout:{overpass_timeout}];(\n  "
-        + "\n  ".join(blocks)
-        + f"\n);\nout center qt {candidate_limit};"
+    # Ask Overpass to cap each activity's output to keep responses fast.
+    limits = _tile_fetch_limits(tiles, activities)
+    query = _plan_query(
+        activities,
+        [f"({s},{w},{n},{e})" for s, w, n, e in _tile_rectangles(tiles)],
+        overpass_timeout=overpass_timeout,
+        limits=limits,
     )
-
     data = _read_overpass_json(query, timeout_s=timeout_s)
-    if not data:
-        return []
-
-    elements = data.get("elements") or []
+    elements = data.get("elements") if data else None
     if not isinstance(elements, list):
-        return []
+        return {}
 
-    places: List[Dict[str, Any]] = []
-    seen: Set[Tuple[str, float, float]] = set()
-
-    for element in elements:
-        if not isinstance(element, dict):
-            continue
-        center = _element_center(element)
-        if not center:
-            continue
-        el_lat, el_lon = center
-
-        tags = element.get("tags") or {}
-        if not isinstance(tags, dict):
-            tags = {}
-        popularity_score = _score_popularity(tags)
-
-        rating_tag = tags.get("rating") or tags.get("stars")
-        rating_override: Optional[float]
-        try:
-            rating_override = float(rating_tag) if rating_tag is not None else None
-        except (TypeError, ValueError):
-            rating_override = None
-        if rating_override is not None and not (0.0 <= rating_override <= 5.0):
-            rating_override = None
-        name = (
-            tags.get("name")
-            or tags.get("brand")
-            or tags.get("operator")
-            or tags.get("name:en")
-            or "Unnamed place"
-        )
+    binned: Dict[Tuple[int, int, int, str], List[Dict[str, Any]]] = {
+        _cache_key(tile, activity): [] for tile in tiles for activity in activities
+    }
+    for activity, activity_elements in _bin_by_activity(elements, activities).items():
+        for element in activity_elements:
+            key = _cache_key(_tile_for(element["lat"], element["lon"]), activity)
+            if key in binned:
+                binned[key].append(element)
+        # Elements matching several activities come back in each one's output, so a
+        # truncated output alone already puts its activity at the cap.
+        if len(activity_elements) < limits[activity]:
+            for tile in tiles:
+                key = _cache_key(tile, activity)
+                _write_through(_cache, "tile_elements", key, binned[key])
+                _observe_tile_density(tile, activity, len(binned[key]))
+        else:
+            # Truncated: some tiles came back short or empty. Assume each is twice as
+            # dense as the busiest one seen, so the next fetch asks for more (and the
+            # radius shrinks) instead of the area looking sparse.
+            busiest = max(len(binned[_cache_key(tile, activity)]) for tile in tiles)
+            for tile in tiles:
+                _observe_tile_density(tile, activity, busiest, scale=2.0)
+    return binned
 
-        sig = (str(name).strip().lower(), round(el_lat, 6), round(el_lon, 6))
-        if sig in seen:
-            continue
-        seen.add(sig)
 
-        places.append(
-            {
-                "name": str(name),
-                "lat": float(el_lat),
-                "lon": float(el_lon),
-                "type": activity,
-                "osm_id": element.get("id"),
-                "osm_kind": element.get("type"),
-                "popularity_score": popularity_score,
-                **(dict(defaults, rating=rating_override) if rating_override is not None else defaults),
-            }
-        )
-        if len(places) >= candidate_limit:
-            break
+def get_places(
+    lat: float,
+    lon: float,
+    *,
+    radius: int = 5000,
+    activity: str = "nature",
+    timeout_s: float = 8.0,
+    limit: int = 40,
+) -> List[Dict[str, Any]]:
+    """Fetch nearby places from OSM via Overpass.
 
-    places.sort(key=lambda p: (p.get("popularity_score", 0), p.get("rating", 0)), reverse=True)
-    places = places[:limit]
-    _cache[key] = (now, list(places))
-    return places
+    Returns an empty list when Overpass is unavailable or the query fails.
+    """
+    activity = (activity or "").strip().lower() or "nature"
+    return get_places_multi(
+        lat, lon, activities=[activity], radius=radius, timeout_s=timeout_s, limit=limit
+    )[activity].to_dicts()
@@ -0,0 +1,249 @@
+"""Token-bucket scheduling for outbound calls to the public OSM services.
+
+Each upstream host gets a bucket (Nominatim allows 1 request/s; Overpass
+hands out a couple of slots per client). Callers wait in a per-host priority
+queue, so interactive requests are served before warm-up and background
+refresh traffic. When a shared SQLite file is configured the bucket itself
+lives there, so every worker process draws from the same budget; the
+priority queue stays per process.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import heapq
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+try:
+    from smarttrip.storage import connect_cache, take_rate_token
+except ImportError:  # pragma: no cover
+    from storage import connect_cache, take_rate_token  # type: ignore
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+# Priority of outbound calls made by the current thread / context.
+_priority: ContextVar[int] = ContextVar("smarttrip_outbound_priority", default=PRIORITY_INTERACTIVE)
+
+# host -> (requests per second, burst)
+_DEFAULT_RATES: Dict[str, Tuple[float, float]] = {
+    "nominatim.openstreetmap.org": (1.0, 1.0),
+}
+_FALLBACK_RATE: Tuple[float, float] = (1.0, 2.0)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def outbound_priority(priority: int) -> Iterator[None]:
+    """Run outbound calls inside the block at ``priority``."""
+    token = _priority.set(int(priority))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class OutboundScheduler:
+    """Priority queue in front of a token bucket for one upstream host.
+
+    Only the first waiter in (priority, arrival) order may take tokens, so a
+    background caller never jumps ahead of a queued interactive one. The
+    queue is per process: with a shared bucket, workers draw from one
+    budget, but a background caller in one worker can still take a token
+    while an interactive one waits in another.
+    """
+
+    def __init__(self, name: str, *, rate_per_s: float, burst: float) -> None:
+        self.name = name
+        self.rate_per_s = max(1e-3, float(rate_per_s))
+        self.burst = max(1.0, float(burst))
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[int, int]] = []
+        self._seq = 0
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._shared_path: Optional[str] = None
+        self._shared_local = threading.local()
+        self.granted = {name: 0 for name in _PRIORITY_NAMES.values()}
+        self.timed_out = 0
+        self.throttled = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+
+    def configure(
+        self,
+        *,
+        rate_per_s: Optional[float] = None,
+        burst: Optional[float] = None,
+        shared_path: Optional[str] = None,
+    ) -> None:
+        with self._cond:
+            if rate_per_s is not None:
+                self.rate_per_s = max(1e-3, float(rate_per_s))
+            if burst is not None:
+                self.burst = max(1.0, float(burst))
+            self._shared_path = str(shared_path) if shared_path else None
+
+    def acquire(
+        self,
+        *,
+        timeout_s: float,
+        priority: Optional[int] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> bool:
+        """Wait for a token; False when ``timeout_s`` passes (or ``cancel`` is set) first."""
+        priority = _priority.get() if priority is None else int(priority)
+        started = time.monotonic()
+        deadline = started + max(0.0, float(timeout_s))
+        with self._cond:
+            self._seq += 1
+            me = (priority, self._seq)
+            heapq.heappush(self._waiters, me)
+        try:
+            while True:
+                with self._cond:
+                    first = self._waiters[0] == me
+                # The shared bucket is a SQLite transaction that can wait on other
+                # processes, so it runs without holding up this process's queue.
+                needed = self._take_shared(penalty_s=0.0) if first else None
+                with self._cond:
+                    now = time.monotonic()
+                    wait = deadline - now
+                    if first:
+                        if needed is None:
+                            needed = self._take_local(penalty_s=0.0)
+                        if needed <= 0.0:
+                            waited = now - started
+                            self.granted[_PRIORITY_NAMES.get(priority, "background")] += 1
+                            self.wait_total_s += waited
+                            self.wait_max_s = max(self.wait_max_s, waited)
+                            return True
+                        wait = min(wait, needed)
+                    elif self._waiters[0] == me:
+                        continue
+                    if deadline - now <= 0 or (cancel is not None and cancel.is_set()):
+                        self.timed_out += 1
+                        return False
+                    # Wake up periodically to notice cancellation.
+                    self._cond.wait(min(wait, 0.1) if cancel is not None else wait)
+        finally:
+            with self._cond:
+                self._waiters.remove(me)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def penalize(self, seconds: float) -> None:
+        """Hold back every caller for ``seconds`` (e.g. after the upstream answered 429)."""
+        penalty_s = max(0.0, float(seconds))
+        shared = self._take_shared(penalty_s=penalty_s)
+        with self._cond:
+            self.throttled += 1
+            if shared is None:
+                self._take_local(penalty_s=penalty_s)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queued = {name: 0 for name in _PRIORITY_NAMES.values()}
+            for priority, _ in self._waiters:
+                queued[_PRIORITY_NAMES.get(priority, "background")] += 1
+            granted = sum(self.granted.values())
+            return {
+                "rate_per_s": self.rate_per_s,
+                "burst": self.burst,
+                "shared": self._shared_path is not None,
+                "queued": queued,
+                "granted": dict(self.granted),
+                "timed_out": self.timed_out,
+                "throttled": self.throttled,
+                "avg_wait_ms": round(self.wait_total_s / granted * 1000.0, 1) if granted else 0.0,
+                "max_wait_ms": round(self.wait_max_s * 1000.0, 1),
+            }
+
+    def _take_shared(self, *, penalty_s: float) -> Optional[float]:
+        # Seconds until a token is available, or None without a usable shared bucket.
+        conn = self._shared_conn()
+        if conn is None:
+            return None
+        try:
+            return take_rate_token(conn, self.name, rate_per_s=self.rate_per_s, burst=self.burst, penalty_s=penalty_s)
+        except sqlite3.Error:
+            return None
+
+    def _take_local(self, *, penalty_s: float) -> float:
+        # Called with the condition held. Returns seconds until a token is available.
+        now = time.time()
+        self._tokens = min(self.burst, self._tokens + max(0.0, now - self._updated) * self.rate_per_s)
+        self._updated = now
+        if penalty_s > 0:
+            self._tokens = min(self._tokens, 1.0 - penalty_s * self.rate_per_s)
+            return 0.0
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate_per_s
+
+    def _shared_conn(self) -> Optional[sqlite3.Connection]:
+        path = self._shared_path
+        if not path:
+            return None
+        current = getattr(self._shared_local, "conn", None)
+        if current is not None and current[0] == path:
+            return current[1]
+        try:
+            conn = connect_cache(path)
+        except (OSError, sqlite3.Error):
+            return None
+        self._shared_local.conn = (path, conn)
+        return conn
+
+
+_lock = threading.Lock()
+_schedulers: Dict[str, OutboundScheduler] = {}
+_rates: Dict[str, Tuple[float, float]] = dict(_DEFAULT_RATES)
+_shared_path: Optional[str] = None
+
+
+def configure_rate_limits(
+    rates: Optional[Dict[str, Dict[str, float]]] = None, *, shared_path: Optional[str] = None
+) -> None:
+    """Set ``{host: {"rate_per_s", "burst"}}`` overrides and the SQLite file shared across workers."""
+    global _shared_path
+    with _lock:
+        for host, options in (rates or {}).items():
+            default = _rates.get(host, _FALLBACK_RATE)
+            _rates[host] = (
+                float(options.get("rate_per_s", default[0])),
+                float(options.get("burst", default[1])),
+            )
+        _shared_path = str(shared_path) if shared_path else None
+        for host, scheduler in _schedulers.items():
+            rate, burst = _rates.get(host, _FALLBACK_RATE)
+            scheduler.configure(rate_per_s=rate, burst=burst, shared_path=_shared_path)
+
+
+def scheduler_for(url: str) -> OutboundScheduler:
+    host = (urlsplit(url).hostname or url).lower()
+    with _lock:
+        scheduler = _schedulers.get(host)
+        if scheduler is None:
+            rate, burst = _rates.get(host, _FALLBACK_RATE)
+            scheduler = OutboundScheduler(host, rate_per_s=rate, burst=burst)
+            scheduler.configure(shared_path=_shared_path)
+            _schedulers[host] = scheduler
+        return scheduler
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        schedulers = dict(_schedulers)
+    return {host: scheduler.stats() for host, scheduler in schedulers.items()}
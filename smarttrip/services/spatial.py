@@ -0,0 +1,155 @@
+"""Uniform-grid spatial index for points with ``lat``/``lon``.
+
+Radius queries only visit grid cells that intersect the circle. Each point
+is first checked with a cheap equirectangular distance; only points close
+to the boundary pay for an exact haversine. Membership is therefore the
+same as filtering on ``haversine_m(...) <= radius_m``.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+from typing import Any, Callable, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+EARTH_RADIUS_M = 6371000.0
+_M_PER_DEG = EARTH_RADIUS_M * math.pi / 180.0
+# Relative error allowed for the equirectangular pre-check before falling back to haversine.
+_PRECHECK_MARGIN = 0.01
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def _point(item: Any) -> Tuple[float, float]:
+    return item["lat"], item["lon"]
+
+
+class _Circle:
+    """Precomputed bounds for ``haversine_m(lat, lon, p) <= radius_m`` tests."""
+
+    __slots__ = ("lat", "lon", "radius_m", "cos_lat", "inner_sq", "outer_sq", "d_lat", "d_lon")
+
+    def __init__(self, lat: float, lon: float, radius_m: float) -> None:
+        self.lat = lat
+        self.lon = lon
+        self.radius_m = radius_m
+        clamped = min(85.0, abs(lat))
+        self.cos_lat = math.cos(math.radians(clamped))
+        # Longitude degrees shrink with latitude across the circle; widen the margin to cover it.
+        margin = _PRECHECK_MARGIN + math.tan(math.radians(clamped)) * radius_m / EARTH_RADIUS_M * 2.0
+        radius_deg = radius_m / _M_PER_DEG
+        self.inner_sq = (radius_deg * (1.0 - margin)) ** 2 if margin < 1.0 else -1.0
+        self.outer_sq = (radius_deg * (1.0 + margin)) ** 2
+        self.d_lat = radius_deg * (1.0 + margin)
+        self.d_lon = min(180.0, self.d_lat / max(0.01, math.cos(math.radians(min(89.0, clamped + self.d_lat)))))
+
+    def contains(self, lat: float, lon: float) -> bool:
+        dy = lat - self.lat
+        dx = (lon - self.lon) * self.cos_lat
+        d_sq = dx * dx + dy * dy
+        if d_sq < self.inner_sq:
+            return True
+        if d_sq > self.outer_sq:
+            return False
+        return haversine_m(self.lat, self.lon, lat, lon) <= self.radius_m
+
+
+def within_radius(
+    items: Iterable[T], lat: float, lon: float, radius_m: float, *, point: Callable[[T], Tuple[float, float]] = _point
+) -> List[T]:
+    """Items within ``radius_m`` of ``(lat, lon)``, in input order (no index; for one-off lists)."""
+    circle = _Circle(float(lat), float(lon), float(radius_m))
+    out: List[T] = []
+    for item in items:
+        p_lat, p_lon = point(item)
+        if circle.contains(p_lat, p_lon):
+            out.append(item)
+    return out
+
+
+class GridIndex(Generic[T]):
+    """Points bucketed into ``cell_deg`` x ``cell_deg`` cells.
+
+    Radius and bbox results come back in insertion order, so a query returns
+    the same list as filtering the indexed items directly. Longitudes do not
+    wrap around the antimeridian.
+    """
+
+    def __init__(
+        self,
+        items: Iterable[T] = (),
+        *,
+        cell_deg: float = 0.005,
+        point: Callable[[T], Tuple[float, float]] = _point,
+    ) -> None:
+        self.cell_deg = float(cell_deg)
+        self._point = point
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, int, T]]] = {}
+        self._count = 0
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def add(self, item: T) -> None:
+        lat, lon = self._point(item)
+        self._cells.setdefault(self._cell(lat, lon), []).append((lat, lon, self._count, item))
+        self._count += 1
+
+    def _entries_in(
+        self, south: float, west: float, north: float, east: float
+    ) -> Iterable[Tuple[float, float, int, T]]:
+        y0, x0 = self._cell(south, west)
+        y1, x1 = self._cell(north, east)
+        if (y1 - y0 + 1) * (x1 - x0 + 1) > len(self._cells):
+            # Query box spans more cells than are occupied; walk the occupied ones instead.
+            keys = sorted(k for k in self._cells if y0 <= k[0] <= y1 and x0 <= k[1] <= x1)
+        else:
+            keys = [(y, x) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+        for key in keys:
+            yield from self._cells.get(key, ())
+
+    def within_bbox(self, south: float, west: float, north: float, east: float) -> List[T]:
+        hits = [
+            (seq, item)
+            for lat, lon, seq, item in self._entries_in(south, west, north, east)
+            if south <= lat <= north and west <= lon <= east
+        ]
+        hits.sort(key=lambda hit: hit[0])
+        return [item for _, item in hits]
+
+    def within_radius(self, lat: float, lon: float, radius_m: float) -> List[T]:
+        circle = _Circle(float(lat), float(lon), float(radius_m))
+        entries = self._entries_in(lat - circle.d_lat, lon - circle.d_lon, lat + circle.d_lat, lon + circle.d_lon)
+        hits = [(seq, item) for p_lat, p_lon, seq, item in entries if circle.contains(p_lat, p_lon)]
+        hits.sort(key=lambda hit: hit[0])
+        return [item for _, item in hits]
+
+    def nearest(
+        self, lat: float, lon: float, k: int, *, max_radius_m: Optional[float] = None
+    ) -> List[Tuple[float, T]]:
+        """Up to ``k`` ``(distance_m, item)`` pairs closest to ``(lat, lon)``, nearest first."""
+        if k <= 0 or not self._count:
+            return []
+        limit = float(max_radius_m) if max_radius_m is not None else math.pi * EARTH_RADIUS_M
+        radius = min(limit, self.cell_deg * _M_PER_DEG)
+        while True:
+            found = self.within_radius(lat, lon, radius)
+            # Everything within ``radius`` is in ``found``, so k hits there are the k nearest overall.
+            if len(found) >= k or radius >= limit or len(found) == self._count:
+                ranked = [(haversine_m(lat, lon, *self._point(item)), i, item) for i, item in enumerate(found)]
+                return [(d, item) for d, _, item in heapq.nsmallest(k, ranked, key=lambda r: (r[0], r[1]))]
+            radius = min(limit, radius * 2.0)
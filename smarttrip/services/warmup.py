@@ -0,0 +1,148 @@
+"""Pre-warm the city caches so the first visitor of the day gets cached results.
+
+Used by ``python -m smarttrip warm`` and by the optional in-app scheduler
+(``SMARTTRIP_WARM_CITIES``). Cities are warmed one at a time at background
+priority, so the outbound rate limits serve interactive requests first, and
+city queries are spaced out further to go easy on Overpass. Entries that are
+still fresh are left alone, so repeated runs only re-fetch what has gone
+stale or missing.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    from smarttrip.services.ratelimit import PRIORITY_BACKGROUND
+    from smarttrip.services.osm_service import prefetch_city
+except ImportError:  # pragma: no cover
+    from services.ratelimit import PRIORITY_BACKGROUND  # type: ignore
+    from services.osm_service import prefetch_city  # type: ignore
+
+
+_OVERPASS_INTERVAL_S = 5.0
+_WARM_TIMEOUT_S = 25.0
+_WARM_LIMIT = 120
+
+_scheduler_lock = threading.Lock()
+_scheduler: Optional[threading.Thread] = None
+_scheduler_stop = threading.Event()
+_warm_stats: Dict[str, Any] = {"runs": 0, "last_run_ts": None, "last_duration_s": None, "last_results": []}
+
+
+class _Throttle:
+    """Sleep as needed so consecutive calls are at least ``interval_s`` apart."""
+
+    def __init__(self, interval_s: float) -> None:
+        self.interval_s = float(interval_s)
+        self._last = float("-inf")
+
+    def wait(self) -> None:
+        delay = self._last + self.interval_s - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._last = time.monotonic()
+
+
+def warm_city(
+    city: str,
+    activities: List[str],
+    *,
+    limit: int = _WARM_LIMIT,
+    timeout_s: float = _WARM_TIMEOUT_S,
+    overpass: Optional[_Throttle] = None,
+) -> Dict[str, Any]:
+    """Make sure the geocode and city results for ``city`` are cached and fresh.
+
+    Returns ``{"city", "status", "fetched", "cached"}`` where ``status`` is
+    ``ok``, ``not_found`` (geocoding failed) or ``failed`` (Overpass failed);
+    ``fetched`` and ``cached`` list activities.
+    """
+    city = (city or "").strip()
+    overpass = overpass or _Throttle(_OVERPASS_INTERVAL_S)
+    result: Dict[str, Any] = {"city": city, "status": "ok", "fetched": [], "cached": []}
+
+    prefetched = prefetch_city(
+        city,
+        activities,
+        priority=PRIORITY_BACKGROUND,
+        limit=limit,
+        timeout_s=timeout_s,
+        before_fetch=overpass.wait,
+    )
+    if prefetched is None:
+        result["status"] = "not_found"
+        return result
+    result["fetched"] = prefetched["fetched"]
+    result["cached"] = prefetched["cached"]
+    if prefetched["failed"]:
+        result["status"] = "failed"
+    return result
+
+
+def warm_cities(
+    cities: List[str],
+    activities: List[str],
+    *,
+    limit: int = _WARM_LIMIT,
+    timeout_s: float = _WARM_TIMEOUT_S,
+) -> List[Dict[str, Any]]:
+    """Warm each city in turn at background priority."""
+    overpass = _Throttle(_OVERPASS_INTERVAL_S)
+    started = time.time()
+    results: List[Dict[str, Any]] = []
+    for city in cities:
+        if not (city or "").strip():
+            continue
+        try:
+            results.append(warm_city(city, activities, limit=limit, timeout_s=timeout_s, overpass=overpass))
+        except Exception:
+            results.append({"city": city, "status": "failed", "fetched": [], "cached": []})
+
+    with _scheduler_lock:
+        _warm_stats["runs"] += 1
+        _warm_stats["last_run_ts"] = started
+        _warm_stats["last_duration_s"] = round(time.time() - started, 3)
+        _warm_stats["last_results"] = [{"city": r["city"], "status": r["status"]} for r in results]
+    return results
+
+
+def start_warm_scheduler(
+    cities: List[str],
+    activities: List[str],
+    *,
+    interval_s: float,
+    limit: int = _WARM_LIMIT,
+) -> None:
+    """Warm ``cities`` now and then every ``interval_s`` seconds on a daemon thread.
+
+    Calling it again while the scheduler is running does nothing.
+    """
+    global _scheduler
+    cities = [c for c in cities if (c or "").strip()]
+    if not cities or interval_s <= 0:
+        return
+    with _scheduler_lock:
+        if _scheduler is not None and _scheduler.is_alive():
+            return
+        _scheduler_stop.clear()
+
+        def loop() -> None:
+            while not _scheduler_stop.is_set():
+                warm_cities(cities, activities, limit=limit)
+                _scheduler_stop.wait(float(interval_s))
+
+        _scheduler = threading.Thread(target=loop, name="smarttrip-warm", daemon=True)
+        _scheduler.start()
+
+
+def stop_warm_scheduler() -> None:
+    _scheduler_stop.set()
+
+
+def warm_stats() -> Dict[str, Any]:
+    with _scheduler_lock:
+        running = _scheduler is not None and _scheduler.is_alive()
+        return dict(_warm_stats, scheduler_running=running)
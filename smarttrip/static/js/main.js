@@ -384,6 +384,7 @@
     radiusField: $("#radiusField"),
     cityField: $("#cityField"),
     cityInput: $("#cityInput"),
+    citySuggestions: $("#citySuggestions"),
     placeCategories: $("#placeCategories"),
     locationHint: $("#locationHint"),
     useLocationBtn: $("#useLocationBtn"),
@@ -746,6 +747,35 @@
     }
   }
 
+  let citySuggestTimer = null;
+  let citySuggestSeq = 0;
+
+  function suggestCities() {
+    if (!dom.cityInput || !dom.citySuggestions) return;
+    const query = String(dom.cityInput.value || "").trim();
+    window.clearTimeout(citySuggestTimer);
+    if (!query) {
+      dom.citySuggestions.replaceChildren();
+      return;
+    }
+    citySuggestTimer = window.setTimeout(async () => {
+      const seq = ++citySuggestSeq;
+      try {
+        const response = await fetch(`/cities/autocomplete?q=${encodeURIComponent(query)}&limit=8`);
+        const data = await response.json();
+        if (seq !== citySuggestSeq) return;
+        const options = (data.cities || []).map((city) => {
+          const option = document.createElement("option");
+          option.value = state.lang === "fa" && city.name_fa ? city.name_fa : city.name;
+          return option;
+        });
+        dom.citySuggestions.replaceChildren(...options);
+      } catch {
+        // ignore
+      }
+    }, 150);
+  }
+
   function getRadioValue(name, fallback) {
     const selected = document.querySelector(`input[name="${name}"]:checked`);
     return (selected && selected.value) || fallback;
@@ -1372,7 +1402,10 @@
       updateEngine(getPrefs());
     });
 
-    if (dom.cityInput) dom.cityInput.addEventListener("input", () => updateEngine(getPrefs()));
+    if (dom.cityInput) dom.cityInput.addEventListener("input", () => {
+      updateEngine(getPrefs());
+      suggestCities();
+    });
 
     document.querySelectorAll('input[name="search_mode"]').forEach((el) => {
       el.addEventListener("change", () => {
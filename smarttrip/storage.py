@@ -4,7 +4,8 @@ import json
 import os
 import sqlite3
 import time
-from typing import Any, Dict, List, Optional, Tuple
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 
 def connect(db_path: str) -> sqlite3.Connection:
@@ -27,6 +28,26 @@ def init_db(conn: sqlite3.Connection) -> None:
         )
         """
     )
+    # One row whose version goes up with every global weights write, so other
+    # processes can tell in one read whether their cached weights are current.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS weights_version (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            version INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute("INSERT OR IGNORE INTO weights_version(id, version) VALUES(0, 0)")
+    # The same per session for its offsets; a session without a row is at version 0.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS weights_session_version (
+            session_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        """
+    )
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS weights_user (
@@ -74,6 +95,19 @@ def init_db(conn: sqlite3.Connection) -> None:
         )
         """
     )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS weight_snapshots (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_ts REAL NOT NULL,
+            model_version TEXT NOT NULL,
+            last_event_id INTEGER NOT NULL,
+            global_json TEXT NOT NULL,
+            sessions_json TEXT NOT NULL,
+            stats_json TEXT NOT NULL
+        )
+        """
+    )
     conn.commit()
 
 
@@ -85,6 +119,7 @@ def ensure_seed_global_weights(conn: sqlite3.Connection, seed: Dict[str, float])
             "INSERT INTO weights_global(feature, weight, updated_ts) VALUES(?, ?, ?)",
             [(f, float(w), now) for f, w in seed.items()],
         )
+        _bump_weights_version(conn)
         conn.commit()
         return
 
@@ -95,9 +130,45 @@ def ensure_seed_global_weights(conn: sqlite3.Connection, seed: Dict[str, float])
             "INSERT INTO weights_global(feature, weight, updated_ts) VALUES(?, ?, ?)",
             missing,
         )
+        _bump_weights_version(conn)
         conn.commit()
 
 
+def weights_version(conn: sqlite3.Connection) -> int:
+    """Version of the stored global weights; it changes whenever one of them is written."""
+    row = conn.execute("SELECT version FROM weights_version WHERE id = 0").fetchone()
+    return int(row[0]) if row is not None else 0
+
+
+def weights_versions(conn: sqlite3.Connection, session_id: Optional[str]) -> Tuple[int, int]:
+    """``(global version, version of session_id's offsets)`` in one read; 0 for no session."""
+    row = conn.execute(
+        """
+        SELECT (SELECT version FROM weights_version WHERE id = 0),
+               (SELECT version FROM weights_session_version WHERE session_id = ?)
+        """,
+        (session_id or "",),
+    ).fetchone()
+    return int(row[0] or 0), int(row[1] or 0)
+
+
+def _bump_weights_version(conn: sqlite3.Connection) -> None:
+    # Runs inside the caller's write transaction, so the new weights and the
+    # new version become visible together.
+    conn.execute("UPDATE weights_version SET version = version + 1 WHERE id = 0")
+
+
+def _bump_session_versions(conn: sqlite3.Connection, session_ids: Iterable[str]) -> None:
+    # Like _bump_weights_version, for the offsets of each of ``session_ids``.
+    conn.executemany(
+        """
+        INSERT INTO weights_session_version(session_id, version) VALUES(?, 1)
+        ON CONFLICT(session_id) DO UPDATE SET version = version + 1
+        """,
+        [(session_id,) for session_id in session_ids],
+    )
+
+
 def load_global_weights(conn: sqlite3.Connection) -> Dict[str, float]:
     rows = conn.execute("SELECT feature, weight FROM weights_global").fetchall()
     return {r["feature"]: float(r["weight"]) for r in rows}
@@ -120,6 +191,7 @@ def upsert_global_weights(conn: sqlite3.Connection, updates: Dict[str, float]) -
         """,
         [(f, float(w), now) for f, w in updates.items()],
     )
+    _bump_weights_version(conn)
     conn.commit()
 
 
@@ -133,9 +205,47 @@ def upsert_user_weights(conn: sqlite3.Connection, session_id: str, updates: Dict
         """,
         [(session_id, f, float(w), now) for f, w in updates.items()],
     )
+    _bump_session_versions(conn, [session_id])
     conn.commit()
 
 
+def apply_trained_weights(
+    conn: sqlite3.Connection, global_weights: Dict[str, float], session_weights: Dict[str, Dict[str, float]]
+) -> None:
+    """Write new global weights and the offsets of some sessions as one transaction.
+
+    The global version goes up once, and only the written sessions' versions move.
+    """
+    now = time.time()
+    try:
+        conn.executemany(
+            """
+            INSERT INTO weights_global(feature, weight, updated_ts)
+            VALUES(?, ?, ?)
+            ON CONFLICT(feature) DO UPDATE SET weight=excluded.weight, updated_ts=excluded.updated_ts
+            """,
+            [(f, float(w), now) for f, w in global_weights.items()],
+        )
+        conn.executemany(
+            """
+            INSERT INTO weights_user(session_id, feature, weight, updated_ts)
+            VALUES(?, ?, ?, ?)
+            ON CONFLICT(session_id, feature) DO UPDATE SET weight=excluded.weight, updated_ts=excluded.updated_ts
+            """,
+            [
+                (session_id, f, float(w), now)
+                for session_id, offsets in session_weights.items()
+                for f, w in offsets.items()
+            ],
+        )
+        _bump_weights_version(conn)
+        _bump_session_versions(conn, session_weights)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
 def log_recommendation(
     conn: sqlite3.Connection,
     *,
@@ -203,6 +313,63 @@ def get_recommendation(
     return context, places
 
 
+def iter_recommendations(
+    conn: sqlite3.Connection,
+    actions: Iterable[str],
+    *,
+    limit: Optional[int] = None,
+) -> Iterator[Tuple[str, Optional[str], Dict[str, Any], List[Dict[str, Any]], Set[str]]]:
+    """Stream logged recommendations, oldest first, for replaying them offline.
+
+    Yields ``(request_id, session_id, context, places, clicked)`` where
+    ``places`` are in the order they were shown and ``clicked`` holds the
+    place_ids that got one of ``actions``. Requests whose context no longer
+    parses are skipped.
+    """
+    actions = list(actions)
+    clicked: Dict[str, Set[str]] = {}
+    for request_id, place_id in conn.execute(
+        f"SELECT request_id, place_id FROM events WHERE action IN ({', '.join('?' * len(actions))})",
+        actions,
+    ):
+        clicked.setdefault(request_id, set()).add(place_id)
+
+    cur = conn.execute(
+        """
+        SELECT r.request_id, r.session_id, r.context_json, i.place_json
+        FROM (SELECT rowid, * FROM recommendations ORDER BY created_ts, rowid LIMIT ?) r
+        JOIN recommendation_items i ON i.request_id = r.request_id
+        ORDER BY r.created_ts, r.rowid, i.rowid
+        """,
+        (-1 if limit is None else int(limit),),
+    )
+    current: Optional[Tuple[Any, ...]] = None
+    places: List[Dict[str, Any]] = []
+    for request_id, session_id, context_json, place_json in cur:
+        if current is not None and current[0] != request_id:
+            yield from _replayable(current, places, clicked)
+            places = []
+        current = (request_id, session_id, context_json)
+        try:
+            places.append(json.loads(place_json))
+        except Exception:
+            continue
+    if current is not None:
+        yield from _replayable(current, places, clicked)
+
+
+def _replayable(
+    current: Tuple[Any, ...], places: List[Dict[str, Any]], clicked: Dict[str, Set[str]]
+) -> Iterator[Tuple[str, Optional[str], Dict[str, Any], List[Dict[str, Any]], Set[str]]]:
+    request_id, session_id, context_json = current
+    try:
+        context = json.loads(context_json)
+    except Exception:
+        return
+    if isinstance(context, dict):
+        yield request_id, session_id, context, places, clicked.get(request_id, set())
+
+
 def log_event(
     conn: sqlite3.Connection,
     *,
@@ -228,3 +395,271 @@ def log_event(
     )
     conn.commit()
 
+
+def iter_feedback(
+    conn: sqlite3.Connection,
+    actions: Iterable[str],
+    *,
+    after_event_id: int = 0,
+) -> Iterator[Tuple[int, Optional[str], str, str, List[Tuple[str, Dict[str, Any]]]]]:
+    """Stream logged feedback with the recommendation it was given on, oldest first.
+
+    Yields ``(event_id, session_id, context, place_id, items)`` for each
+    event whose action is in ``actions``, where ``context`` is the logged
+    context JSON and ``items`` the ``(place_id, place)`` pairs that were shown.
+    Rows come from one joined cursor, so nothing is loaded up front.
+    """
+    actions = list(actions)
+    cur = conn.execute(
+        f"""
+        SELECT e.id, e.session_id, e.place_id, r.context_json, i.place_id, i.place_json
+        FROM events e
+        JOIN recommendations r ON r.request_id = e.request_id
+        JOIN recommendation_items i ON i.request_id = e.request_id
+        WHERE e.id > ? AND e.action IN ({", ".join("?" * len(actions))})
+        ORDER BY e.id
+        """,
+        (int(after_event_id), *actions),
+    )
+    current: Optional[Tuple[Any, ...]] = None
+    items: List[Tuple[str, Dict[str, Any]]] = []
+    for event_id, session_id, place_id, context_json, item_id, place_json in cur:
+        if current is not None and current[0] != event_id:
+            yield (*current, items)
+            items = []
+        current = (event_id, session_id, context_json, place_id)
+        try:
+            items.append((item_id, json.loads(place_json)))
+        except Exception:
+            continue
+    if current is not None:
+        yield (*current, items)
+
+
+def save_weight_snapshot(
+    conn: sqlite3.Connection,
+    *,
+    model_version: str,
+    last_event_id: int,
+    global_weights: Dict[str, float],
+    session_weights: Dict[str, Dict[str, float]],
+    stats: Dict[str, Any],
+) -> int:
+    """Store trained weights as a new snapshot; returns its version."""
+    cur = conn.execute(
+        """
+        INSERT INTO weight_snapshots(
+            created_ts, model_version, last_event_id, global_json, sessions_json, stats_json
+        )
+        VALUES(?, ?, ?, ?, ?, ?)
+        """,
+        (
+            time.time(),
+            model_version,
+            int(last_event_id),
+            json.dumps(global_weights),
+            json.dumps(session_weights, ensure_ascii=False),
+            json.dumps(stats, ensure_ascii=False),
+        ),
+    )
+    conn.commit()
+    return int(cur.lastrowid)
+
+
+def load_weight_snapshot(conn: sqlite3.Connection, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """The snapshot with ``version`` (default: the latest), or None."""
+    if version is None:
+        row = conn.execute("SELECT * FROM weight_snapshots ORDER BY version DESC LIMIT 1").fetchone()
+    else:
+        row = conn.execute("SELECT * FROM weight_snapshots WHERE version = ?", (int(version),)).fetchone()
+    if row is None:
+        return None
+    return {
+        "version": int(row["version"]),
+        "created_ts": float(row["created_ts"]),
+        "model_version": row["model_version"],
+        "last_event_id": int(row["last_event_id"]),
+        "global": json.loads(row["global_json"]),
+        "sessions": json.loads(row["sessions_json"]),
+        "stats": json.loads(row["stats_json"]),
+    }
+
+
+def connect_cache(db_path: str) -> sqlite3.Connection:
+    """Open the shared OSM cache database (a sidecar file next to the main DB)."""
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=1.0, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    init_cache_db(conn)
+    return conn
+
+
+def init_cache_db(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS osm_cache (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            stored_ts REAL NOT NULL,
+            expires_ts REAL NOT NULL,
+            payload BLOB NOT NULL,
+            PRIMARY KEY (namespace, key)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rate_buckets (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_ts REAL NOT NULL
+        )
+        """
+    )
+    conn.commit()
+
+
+def cache_get(conn: sqlite3.Connection, namespace: str, key: str) -> Optional[Tuple[float, Any]]:
+    """Return ``(stored_ts, value)`` for a live entry, or None when missing/expired."""
+    row = conn.execute(
+        "SELECT stored_ts, payload FROM osm_cache WHERE namespace = ? AND key = ? AND expires_ts > ?",
+        (namespace, key, time.time()),
+    ).fetchone()
+    if row is None:
+        return None
+    try:
+        value = json.loads(zlib.decompress(row[1]).decode("utf-8"))
+    except Exception:
+        return None
+    return float(row[0]), value
+
+
+def cache_put(conn: sqlite3.Connection, namespace: str, key: str, value: Any, *, ttl_s: float) -> None:
+    now = time.time()
+    payload = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    conn.execute(
+        """
+        INSERT INTO osm_cache(namespace, key, stored_ts, expires_ts, payload)
+        VALUES(?, ?, ?, ?, ?)
+        ON CONFLICT(namespace, key) DO UPDATE SET
+            stored_ts=excluded.stored_ts, expires_ts=excluded.expires_ts, payload=excluded.payload
+        """,
+        (namespace, key, now, now + float(ttl_s), payload),
+    )
+    conn.commit()
+
+
+def purge_expired_cache(conn: sqlite3.Connection) -> int:
+    cur = conn.execute("DELETE FROM osm_cache WHERE expires_ts <= ?", (time.time(),))
+    conn.commit()
+    return int(cur.rowcount or 0)
+
+
+def take_rate_token(
+    conn: sqlite3.Connection,
+    name: str,
+    *,
+    rate_per_s: float,
+    burst: float,
+    penalty_s: float = 0.0,
+) -> float:
+    """Take a token from the shared bucket ``name``; return 0.0 on success, else seconds to wait.
+
+    With ``penalty_s`` nothing is taken; instead the bucket is drained so the
+    next token is at least ``penalty_s`` away (used after an upstream 429).
+    The read-modify-write runs under ``BEGIN IMMEDIATE`` so worker processes
+    sharing the file never hand out the same token twice.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT tokens, updated_ts FROM rate_buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            tokens = float(burst)
+        else:
+            tokens = min(float(burst), float(row[0]) + max(0.0, now - float(row[1])) * rate_per_s)
+        wait = 0.0
+        if penalty_s > 0:
+            tokens = min(tokens, 1.0 - penalty_s * rate_per_s)
+        elif tokens >= 1.0:
+            tokens -= 1.0
+        else:
+            wait = (1.0 - tokens) / rate_per_s
+        conn.execute(
+            """
+            INSERT INTO rate_buckets(name, tokens, updated_ts) VALUES(?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET tokens=excluded.tokens, updated_ts=excluded.updated_ts
+            """,
+            (name, tokens, now),
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return wait
+
+
+def connect_poi_store(db_path: str) -> sqlite3.Connection:
+    """Open the local POI store written by the offline OSM importer."""
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=5.0, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    init_poi_store(conn)
+    return conn
+
+
+def init_poi_store(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pois (
+            activity TEXT NOT NULL,
+            osm_kind TEXT NOT NULL,
+            osm_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            popularity INTEGER NOT NULL,
+            rating REAL,
+            PRIMARY KEY (activity, osm_kind, osm_id)
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pois_activity_lat ON pois(activity, lat)")
+    conn.commit()
+
+
+def insert_pois(conn: sqlite3.Connection, rows: List[Tuple[Any, ...]]) -> None:
+    """Insert ``(activity, osm_kind, osm_id, name, lat, lon, popularity, rating)`` rows."""
+    conn.executemany(
+        """
+        INSERT INTO pois(activity, osm_kind, osm_id, name, lat, lon, popularity, rating)
+        VALUES(?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(activity, osm_kind, osm_id) DO UPDATE SET
+            name=excluded.name, lat=excluded.lat, lon=excluded.lon,
+            popularity=excluded.popularity, rating=excluded.rating
+        """,
+        rows,
+    )
+    conn.commit()
+
+
+def query_pois_bbox(
+    conn: sqlite3.Connection,
+    activity: str,
+    bbox: Tuple[float, float, float, float],
+    *,
+    limit: Optional[int] = None,
+) -> List[Tuple[Any, ...]]:
+    """Return POI rows for ``activity`` inside ``(south, west, north, east)``, most popular first."""
+    south, west, north, east = bbox
+    return conn.execute(
+        """
+        SELECT osm_kind, osm_id, name, lat, lon, popularity, rating
+        FROM pois
+        WHERE activity = ? AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?
+        ORDER BY popularity DESC
+        LIMIT ?
+        """,
+        (activity, float(south), float(north), float(west), float(east), -1 if limit is None else int(limit)),
+    ).fetchall()
@@ -0,0 +1,101 @@
+"""Activities, families, groups and budgets as small integer codes.
+
+Every module that needs to know that ``juice`` is a kind of ``cafe``, or
+which group types and budgets exist, resolves them here. Lookups take the
+canonical spelling straight from a dict and only strip/lower other input,
+so codes can be worked out once when a place is created and compared as
+integers (or bitmasks) while scoring.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Tuple
+
+# Primary activity families; a family's code is its index.
+FAMILIES: Tuple[str, ...] = ("nature", "cafe", "restaurant", "entertainment")
+NATURE, CAFE, RESTAURANT, ENTERTAINMENT = range(len(FAMILIES))
+
+# Specific activities and the family each belongs to.
+ACTIVITY_FAMILY: Dict[str, str] = {
+    "fast_food": "restaurant",
+    "juice": "cafe",
+    "ice_cream": "cafe",
+    "park": "nature",
+    "attraction": "nature",
+    "nature_tourism": "nature",
+    "historical": "nature",
+    "cinema": "entertainment",
+    "amusement_park": "entertainment",
+    "theatre": "entertainment",
+    "museum": "entertainment",
+    "pool": "entertainment",
+    "hotel": "entertainment",
+    "eco_lodge": "nature",
+    "hostel": "entertainment",
+    "market": "entertainment",
+    "shopping_mall": "entertainment",
+}
+
+# Every activity a request may ask for: the families first, then the specific ones.
+ACTIVITIES: Tuple[str, ...] = (*FAMILIES, *ACTIVITY_FAMILY)
+
+FAMILY_CODE: Dict[str, int] = {family: code for code, family in enumerate(FAMILIES)}
+_FAMILY_OF_ACTIVITY: Dict[str, int] = {
+    **FAMILY_CODE,
+    **{activity: FAMILY_CODE[family] for activity, family in ACTIVITY_FAMILY.items()},
+}
+FOOD_MASK = (1 << CAFE) | (1 << RESTAURANT)
+
+GROUPS: Tuple[str, ...] = ("solo", "friends", "family")
+_GROUP_BIT: Dict[str, int] = {group: 1 << code for code, group in enumerate(GROUPS)}
+_DEFAULT_GROUP = "friends"
+
+# Budget tiers (comparable with a place's price_tier) and the spellings that map to them.
+BUDGET_TIERS: Dict[str, int] = {"low": 1, "medium": 2, "open": 3}
+_BUDGET_ALIASES: Dict[str, str] = {"cheap": "low", "کم": "low", "high": "open", "زیاد": "open"}
+
+
+def _key(value: Any) -> str:
+    return str(value or "").strip().lower()
+
+
+def family_code(activity: Any) -> int:
+    """Code of ``activity``'s family; anything unknown counts as nature."""
+    code = _FAMILY_OF_ACTIVITY.get(activity) if isinstance(activity, str) else None
+    if code is None:
+        code = _FAMILY_OF_ACTIVITY.get(_key(activity), NATURE)
+    return code
+
+
+def canonical_family(activity: Any) -> str:
+    return FAMILIES[family_code(activity)]
+
+
+def canonical_group(group_type: Any) -> str:
+    if isinstance(group_type, str) and group_type in _GROUP_BIT:
+        return group_type
+    group = _key(group_type)
+    return group if group in _GROUP_BIT else _DEFAULT_GROUP
+
+
+def group_bit(group_type: Any) -> int:
+    return _GROUP_BIT[canonical_group(group_type)]
+
+
+def group_mask(groups: Iterable[Any]) -> int:
+    """Bitmask of the known groups in ``groups`` (e.g. a place's ``best_for``)."""
+    mask = 0
+    for group in groups or ():
+        bit = _GROUP_BIT.get(group) if isinstance(group, str) else None
+        mask |= bit if bit is not None else _GROUP_BIT.get(_key(group), 0)
+    return mask
+
+
+def canonical_budget(budget: Any) -> str:
+    key = _key(budget)
+    key = _BUDGET_ALIASES.get(key, key)
+    return key if key in BUDGET_TIERS else "medium"
+
+
+def budget_tier(budget: Any) -> int:
+    return BUDGET_TIERS[canonical_budget(budget)]
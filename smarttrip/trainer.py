@@ -0,0 +1,303 @@
+"""Offline pairwise trainer that replays the feedback log.
+
+``/feedback`` nudges the weights one click at a time. ``train`` replays
+the logged clicks instead: each (clicked, other shown place) pair becomes
+a row of a feature-difference matrix, the global weights are fit to all
+rows with mini-batch SGD on the same pairwise logistic loss, and then each
+session's offset is fit to its own rows on top of the new global weights.
+Sessions are independent, so their fits run in a process pool. Each run
+picks up from the latest weight snapshot and replays only the clicks
+logged since.
+
+    python -m smarttrip train [--epochs 10] [--workers 4] [--apply] [--full]
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from smarttrip.ai_recommender import (
+        FEATURE_NAMES,
+        TRAINING_ACTIONS,
+        build_features_from_context,
+        compile_context,
+        seed_weights,
+    )
+    from smarttrip.storage import iter_feedback, load_global_weights, load_weight_snapshot
+except ImportError:  # pragma: no cover
+    from ai_recommender import (  # type: ignore
+        FEATURE_NAMES,
+        TRAINING_ACTIONS,
+        build_features_from_context,
+        compile_context,
+        seed_weights,
+    )
+    from storage import iter_feedback, load_global_weights, load_weight_snapshot  # type: ignore
+
+# Same bound app._clip_weights applies to every stored weight.
+_MAX_ABS_WEIGHT = 6.0
+_NO_SESSION = -1
+
+
+class PairSet:
+    """Feature differences (clicked - other) of every logged pair, one row per pair."""
+
+    __slots__ = ("diffs", "session_codes", "sessions", "events", "last_event_id")
+
+    def __init__(
+        self,
+        diffs: "np.ndarray",
+        session_codes: "np.ndarray",
+        sessions: List[str],
+        events: int,
+        last_event_id: int,
+    ) -> None:
+        self.diffs = diffs
+        self.session_codes = session_codes
+        self.sessions = sessions
+        self.events = events
+        self.last_event_id = last_event_id
+
+    def __len__(self) -> int:
+        return len(self.diffs)
+
+
+def load_pairs(conn: sqlite3.Connection, *, after_event_id: int = 0) -> PairSet:
+    """Build the pair matrix from the events log, skipping clicks /feedback would skip too."""
+    blocks: List["np.ndarray"] = []
+    codes: List["np.ndarray"] = []
+    session_index: Dict[str, int] = {}
+    events = 0
+    last_event_id = int(after_event_id)
+    for event_id, session_id, context_json, place_id, items in iter_feedback(
+        conn, TRAINING_ACTIONS, after_event_id=after_event_id
+    ):
+        last_event_id = event_id
+        clicked = [i for i, (item_id, _) in enumerate(items) if item_id == place_id]
+        # Copies of the clicked place shown twice would only make zero-difference pairs.
+        if not clicked or len(clicked) == len(items):
+            continue
+        try:
+            context = json.loads(context_json)
+        except Exception:
+            continue
+        if not isinstance(context, dict):
+            continue
+        ctx = compile_context(context)
+        rows = (build_features_from_context(place, ctx) for _, place in items)
+        x = np.array([[features[k] for k in FEATURE_NAMES] for features in rows])
+        others = np.ones(len(items), dtype=bool)
+        others[clicked] = False
+        blocks.append(x[clicked[0]] - x[others])
+        code = session_index.setdefault(session_id, len(session_index)) if session_id else _NO_SESSION
+        codes.append(np.full(int(others.sum()), code, dtype=np.intp))
+        events += 1
+
+    sessions = list(session_index)
+    if not blocks:
+        return PairSet(np.zeros((0, len(FEATURE_NAMES))), np.zeros(0, dtype=np.intp), sessions, 0, last_event_id)
+    return PairSet(np.concatenate(blocks), np.concatenate(codes), sessions, events, last_event_id)
+
+
+def _pair_stats(diffs: "np.ndarray", weights: "np.ndarray") -> Tuple[float, float]:
+    """Mean pairwise log loss and the fraction of pairs ranked the right way round."""
+    margin = diffs @ weights
+    return float(np.mean(np.logaddexp(0.0, -margin))), float(np.mean(margin > 0.0))
+
+
+def _sgd(
+    diffs: "np.ndarray",
+    weights: "np.ndarray",
+    *,
+    anchor: "np.ndarray",
+    lr: float,
+    l2: float,
+    epochs: int,
+    batch_size: int,
+    rng: "np.random.Generator",
+    history: Optional[List[Dict[str, float]]] = None,
+) -> "np.ndarray":
+    """Fit ``weights`` by mini-batch SGD on ``mean(log(1 + exp(-(anchor + w)·d)))``.
+
+    The L2 term pulls ``weights`` back toward where they started rather than
+    toward zero, so features that never differ within a pair (bias, city_mode)
+    keep their value. ``anchor + weights`` is clipped like stored weights.
+    """
+    start = weights.copy()
+    weights = weights.copy()
+    n = len(diffs)
+    for epoch in range(epochs):
+        before = weights.copy()
+        order = rng.permutation(n)
+        for lo in range(0, n, batch_size):
+            batch = diffs[order[lo : lo + batch_size]]
+            # d/dw log(1 + exp(-m)) = -sigmoid(-m) * d
+            slack = np.exp(-np.logaddexp(0.0, batch @ (anchor + weights)))
+            grad = l2 * (weights - start) - (slack @ batch) / len(batch)
+            weights = np.clip(anchor + weights - lr * grad, -_MAX_ABS_WEIGHT, _MAX_ABS_WEIGHT) - anchor
+        if history is not None:
+            loss, accuracy = _pair_stats(diffs, anchor + weights)
+            history.append(
+                {
+                    "epoch": epoch + 1,
+                    "loss": loss,
+                    "accuracy": accuracy,
+                    "step_norm": float(np.linalg.norm(weights - before)),
+                }
+            )
+    return weights
+
+
+def _fit_session(task: Tuple[Any, ...]) -> Tuple[str, "np.ndarray", int, float, float]:
+    """Offset for one session, refit from ``start`` (runs in a worker process)."""
+    session_id, diffs, anchor, start, seed, options = task
+    before, _ = _pair_stats(diffs, anchor + start)
+    offset = _sgd(diffs, start, anchor=anchor, rng=np.random.default_rng(seed), **options)
+    offset = np.clip(offset, -_MAX_ABS_WEIGHT, _MAX_ABS_WEIGHT)
+    after, _ = _pair_stats(diffs, anchor + offset)
+    return session_id, offset, len(diffs), before, after
+
+
+def _session_tasks(
+    pairs: PairSet,
+    anchor: "np.ndarray",
+    starts: Dict[str, "np.ndarray"],
+    seed: int,
+    options: Dict[str, Any],
+) -> Iterable[Tuple[Any, ...]]:
+    order = np.argsort(pairs.session_codes, kind="stable")
+    codes = pairs.session_codes[order]
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    for rows in np.split(order, bounds):
+        code = int(pairs.session_codes[rows[0]]) if len(rows) else _NO_SESSION
+        if code != _NO_SESSION:
+            session_id = pairs.sessions[code]
+            start = starts.get(session_id, np.zeros_like(anchor))
+            yield session_id, pairs.diffs[rows], anchor, start, [seed, code], options
+
+
+def _as_dict(vector: "np.ndarray") -> Dict[str, float]:
+    return {k: float(v) for k, v in zip(FEATURE_NAMES, vector.tolist())}
+
+
+def _as_vector(weights: Dict[str, Any]) -> "np.ndarray":
+    return np.array([float(weights.get(k, 0.0)) for k in FEATURE_NAMES])
+
+
+def train(
+    conn: sqlite3.Connection,
+    *,
+    epochs: int = 10,
+    batch_size: int = 256,
+    lr: float = 0.5,
+    l2: float = 0.001,
+    session_epochs: int = 20,
+    session_lr: float = 0.2,
+    session_l2: float = 0.05,
+    workers: Optional[int] = None,
+    from_seed: bool = False,
+    full: bool = False,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Fit global weights and per-session offsets to the logged clicks.
+
+    By default this continues from the latest weight snapshot: its weights
+    are refit to the clicks logged after its ``last_event_id``. Offsets of
+    sessions without new clicks are shifted by the change in the global
+    weights, so their combined weights stay what they were fitted to. With
+    ``full`` (or without a snapshot) every click is replayed, starting from
+    the live global weights, or from ``seed_weights()`` with ``from_seed``.
+
+    Returns ``{"global", "sessions", "last_event_id", "stats"}``; ``stats``
+    has the per-epoch loss/accuracy of the global fit and the pairs/s of
+    both phases.
+    """
+    base = None if full or from_seed else load_weight_snapshot(conn)
+    after_event_id = base["last_event_id"] if base is not None else 0
+    started = time.perf_counter()
+    pairs = load_pairs(conn, after_event_id=after_event_id)
+    load_s = time.perf_counter() - started
+
+    initial = seed_weights()
+    if base is not None:
+        initial.update(base["global"])
+    elif not from_seed:
+        initial.update(load_global_weights(conn))
+    w0 = _as_vector(initial)
+    zero = np.zeros_like(w0)
+    loss, accuracy = _pair_stats(pairs.diffs, w0) if len(pairs) else (float("nan"), float("nan"))
+    history: List[Dict[str, float]] = [{"epoch": 0, "loss": loss, "accuracy": accuracy, "step_norm": 0.0}]
+
+    started = time.perf_counter()
+    if len(pairs):
+        weights = _sgd(
+            pairs.diffs,
+            w0,
+            anchor=zero,
+            lr=lr,
+            l2=l2,
+            epochs=epochs,
+            batch_size=batch_size,
+            rng=np.random.default_rng(seed),
+            history=history,
+        )
+    else:
+        weights = w0
+    global_s = time.perf_counter() - started
+
+    # Keep global + offset of every snapshot session where it was.
+    shift = w0 - weights
+    carried = {
+        session_id: np.clip(_as_vector(offset) + shift, -_MAX_ABS_WEIGHT, _MAX_ABS_WEIGHT)
+        for session_id, offset in (base["sessions"] if base is not None else {}).items()
+    }
+
+    started = time.perf_counter()
+    options = {"lr": session_lr, "l2": session_l2, "epochs": session_epochs, "batch_size": batch_size}
+    tasks = list(_session_tasks(pairs, weights, carried, seed, options))
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            fitted = list(pool.map(_fit_session, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+    else:
+        fitted = [_fit_session(task) for task in tasks]
+    session_s = time.perf_counter() - started
+
+    session_pairs = sum(n for _, _, n, _, _ in fitted)
+    sessions = {session_id: _as_dict(offset) for session_id, offset in carried.items()}
+    sessions.update((session_id, _as_dict(offset)) for session_id, offset, _, _, _ in fitted)
+    stats = {
+        "after_event_id": after_event_id,
+        "base_snapshot": base["version"] if base is not None else None,
+        "events": pairs.events,
+        "pairs": len(pairs),
+        "sessions": len(fitted),
+        "carried_sessions": len(sessions) - len(fitted),
+        "load_s": load_s,
+        "global": {
+            "epochs": history,
+            "seconds": global_s,
+            "pairs_per_s": len(pairs) * epochs / global_s if global_s > 0 else 0.0,
+        },
+        "session": {
+            "workers": workers,
+            "seconds": session_s,
+            "pairs_per_s": session_pairs * session_epochs / session_s if session_s > 0 else 0.0,
+            "loss_before": float(np.mean([b for _, _, _, b, _ in fitted])) if fitted else None,
+            "loss_after": float(np.mean([a for _, _, _, _, a in fitted])) if fitted else None,
+        },
+    }
+    return {
+        "global": _as_dict(weights),
+        "sessions": sessions,
+        "last_event_id": pairs.last_event_id,
+        "stats": stats,
+    }